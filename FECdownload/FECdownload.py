@@ -1,95 +1,232 @@
 import requests
 import os
+import gzip
 import json
-import pandas
+import hashlib
+import re
 import time
+import datetime
+import threading
 from time import sleep
-from pandas import json_normalize
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+from .rate_limiter import RateLimiter
+from .http_client import HTTPClient, get_client, set_client
+from .page_size import PageSizeController
+from .metrics import metrics
+
 # API url for schedule A receipts, including contributions from individuals
 api_url = "https://api.open.fec.gov/v1/schedules/schedule_a/"
 
 rate_limit = 900 # per hour
-start_time = time.time()
-request_count = 1
+# Shared by all threads and, through its state file, all processes on the host
+default_limiter = RateLimiter(rate=rate_limit)
+
+# Compress the pages appended to checkpoint journals
+checkpoint_compress = True
+
+# Tunes the page size of all queries. Its history shows the latency and
+# records per second of each request.
+page_size_controller = PageSizeController()
+
+def set_rate_limiter(limiter):
+    """Sets the rate limiter used by default in `make_request`."""
+    global default_limiter
+    default_limiter = limiter
+
+def set_page_size_controller(controller):
+    """Sets the controller that tunes the page size in `iter_pages`."""
+    global page_size_controller
+    page_size_controller = controller
 
-def make_request(url, params, max_tries = 20, sleep_time = 1):
+def make_request(url, params, max_tries = 20, sleep_time = 1, limiter = None, client = None):
     """Make a request to a URL, checking for HTTP error codes and retrying if the request fails.
     Args:
         url (str) : The URL to request.
-        max_tries (int): The maximum number of times to attempt the request (default: 3).
+        params (dict): The request parameters. The api_key parameter may be a
+            list of keys, in which case requests are spread over the keys.
+        max_tries (int): The maximum number of times to attempt the request (default: 20).
         sleep_time (int): The time to wait (in seconds) between retries (default: 1).
+        limiter (RateLimiter): The rate limiter to use (default: `default_limiter`).
+        client (HTTPClient): The HTTP client to use (default: the shared client).
+            If the client has a response cache, cached responses are returned
+            without a request and new responses are added to the cache.
     
     Returns:
         The response object if the request is successful. Otherwise raises the last exception.
     """
-    global request_count
+    if limiter is None:
+        limiter = default_limiter
+    if client is None:
+        client = get_client()
+    cache = getattr(client, "cache", None)
+    if cache is not None:
+        cached = cache.get(url, params)
+        if cached is not None:
+            return cached
     attempt = 0
     while attempt < max_tries:
-        elapsed_time = time.time() - start_time
-        rate = (request_count / elapsed_time) * 3600
-        if rate > rate_limit:
-            #print(f"waiting for due to rate limit ({rate}/{rate_limit})")
-            sleep(3600/rate_limit+1)
+        wait_start = time.time()
+        api_key = limiter.acquire(params.get("api_key"))
+        metrics.inc("fec_rate_limiter_wait_seconds_total", time.time() - wait_start)
+        params = dict(params, api_key=api_key)
+        if attempt > 0:
+            metrics.inc("fec_request_retries_total")
         try:
-            request_count += 1
             request_start = time.time()
-            response = requests.get(url, params=params)
+            response = client.get(url, params=params)
             #print(f"actual request took {time.time()- request_start} seconds")
+            elapsed = time.time() - request_start
+            metrics.observe("fec_request_seconds", elapsed)
+            metrics.inc("fec_requests_total", status=response.status_code)
+            metrics.inc("fec_response_bytes_total", len(response.content))
+            limiter.update(api_key, response)
             response.raise_for_status()
-            return response, time.time() - request_start
+            if cache is not None:
+                cache.put(url, params, response, elapsed)
+            return response, elapsed
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 429:
-                # rate limit hit. Wait for a moment longer
-                print(f"rate: {rate} {request_count}")
-                sleep(5*3600/rate_limit)
-            print(f"HTTP error ({e.response.status_code}): {e.response.reason}")
-            print(e.response.text)
+                metrics.inc("fec_rate_limited_total")
+                # rate limit hit, the limiter holds back requests with this key
+                print(f"rate limit reached, waiting {e.response.headers.get('Retry-After', '')}")
+            else:
+                print(f"HTTP error ({e.response.status_code}): {e.response.reason}")
+                print(e.response.text)
             if attempt == max_tries - 1:
                 raise e
         except requests.exceptions.RequestException as e:
+            metrics.inc("fec_requests_total", status="error")
             print(f"Request Error: {e}")
             if attempt == max_tries - 1:
                 raise e
         attempt += 1
         sleep(sleep_time)
 
-def checkpoint_filename(year, employer, last_name):
-    if not os.path.exists("checkpoints"):
-        os.makedirs("checkpoints")
+def checkpoint_filename(year, employer, last_name, shard = None):
+    """Returns the base name of the checkpoint files for a query.
+
+    A checkpoint consists of a page journal (``<name>.pages.jsonl`` or
+    ``<name>.pages.jsonl.gz``), with one JSON array of results per line, and a
+    small cursor file (``<name>.cursor.json``) holding the pagination state and
+    the size of the journal at the last completed page.
+    """
+    # Parallel downloads can create the directory at the same time
+    os.makedirs("checkpoints", exist_ok=True)
     name = f"checkpoints/fec_download_checkpoint_{year}"
     if employer is not None:
-        name = f"{name}_e_{employer}.json"
+        name = f"{name}_e_{employer}"
     if last_name is not None:
-        name = f"{name}_n_{last_name}.json"
-    
-    return f"{name}.json"
+        name = f"{name}_n_{last_name}"
+    if shard is not None:
+        name = f"{name}_d_{shard}"
+    return name
+
+def journal_filename(name):
+    if checkpoint_compress:
+        return f"{name}.pages.jsonl.gz"
+    return f"{name}.pages.jsonl"
+
+def cursor_filename(name):
+    return f"{name}.cursor.json"
+
+def checkpoint_dump(pagination, page, entry, year, employer, last_name, shard = None):
+    """Appends a page of results to the journal and moves the cursor past it.
+
+    Only the new page is written, so the cost of a checkpoint does not grow with
+    the number of pages already downloaded. The cursor is replaced atomically
+    after the page is on disk, so a crash at any point leaves a consistent
+    checkpoint.
+    """
+    name = checkpoint_filename(year, employer, last_name, shard)
+    line = (json.dumps(page) + "\n").encode("utf-8")
+    with open(journal_filename(name), 'ab') as journal:
+        if checkpoint_compress:
+            # Each page is a complete gzip member. Concatenated members form a
+            # valid gzip stream.
+            line = gzip.compress(line, compresslevel=1)
+        journal.write(line)
+        offset = journal.tell()
+
+    cursor = {"pagination": pagination, "entry": entry, "offset": offset}
+    tmp_filename = cursor_filename(name) + ".tmp"
+    with open(tmp_filename, 'w') as cursor_file:
+        json.dump(cursor, cursor_file)
+    os.replace(tmp_filename, cursor_filename(name))
+
+def checkpoint_remove(year, employer, last_name, shard = None):
+    name = checkpoint_filename(year, employer, last_name, shard)
+    for filename in [cursor_filename(name), journal_filename(name)]:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+def checkpoint_migrate(year, employer, last_name):
+    """Converts a checkpoint written in the old single-file format."""
+    legacy_filename = f"checkpoints/fec_download_checkpoint_{year}"
+    if employer is not None:
+        legacy_filename = f"{legacy_filename}_e_{employer}.json"
+    if last_name is not None:
+        legacy_filename = f"{legacy_filename}_n_{last_name}.json"
+    legacy_filename = f"{legacy_filename}.json"
 
-def checkpoint_dump(pagination, entries, entry, year, employer, last_name):
-    checkpoint = {"pagination": pagination, "entries": entries, "entry": entry}
-    with open(checkpoint_filename(year, employer, last_name), 'w') as checkpoint_file:
-        json.dump(checkpoint, checkpoint_file, indent=4)
+    name = checkpoint_filename(year, employer, last_name)
+    if not os.path.exists(legacy_filename) or os.path.exists(cursor_filename(name)):
+        return
+    with open(legacy_filename, 'r') as f:
+        checkpoint = json.load(f)
+    checkpoint_remove(year, employer, last_name)
+    checkpoint_dump(checkpoint["pagination"], checkpoint["entries"], checkpoint["entry"], year, employer, last_name)
+    os.remove(legacy_filename)
 
-def checkpoint_read(year, employer, last_name):
-    filename = checkpoint_filename(year, employer, last_name)
+def checkpoint_read(year, employer, last_name, shard = None):
+    """Reads the cursor of a checkpoint.
+
+    Any data written to the journal after the last completed checkpoint is
+    discarded, so downloading continues exactly from the cursor.
+
+    Returns:
+        tuple: The number of entries requested so far and the pagination
+        state of the last response.
+    """
+    name = checkpoint_filename(year, employer, last_name, shard)
     try:
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                checkpoint = json.load(f)
-            entry = checkpoint["entry"]
-            entries = checkpoint["entries"]
-            pagination = checkpoint["pagination"]
-            return entry, entries, pagination
-    except:
+        if shard is None:
+            checkpoint_migrate(year, employer, last_name)
+        if os.path.exists(cursor_filename(name)):
+            with open(cursor_filename(name), 'r') as f:
+                cursor = json.load(f)
+            with open(journal_filename(name), 'r+b') as journal:
+                journal.seek(0, os.SEEK_END)
+                if journal.tell() < cursor["offset"]:
+                    raise ValueError("checkpoint journal is shorter than the cursor")
+                journal.truncate(cursor["offset"])
+            return cursor["entry"], cursor["pagination"]
+    except (OSError, ValueError, KeyError):
         pass
+    checkpoint_remove(year, employer, last_name, shard)
     entry = 0
-    entries = []
     pagination = {"count": 1, "last_indexes": {}}
-    return entry, entries, pagination
-
-
-def download_pages(parameters):
+    return entry, pagination
+
+def checkpoint_pages(year, employer, last_name, shard = None):
+    """Iterates over the pages stored in a checkpoint journal."""
+    filename = journal_filename(checkpoint_filename(year, employer, last_name, shard))
+    if not os.path.exists(filename):
+        return
+    opener = gzip.open if checkpoint_compress else open
+    with opener(filename, 'rt', encoding="utf-8") as journal:
+        for line in journal:
+            yield json.loads(line)
+
+def checkpoint_entries(year, employer, last_name, shard = None):
+    """Iterates over the entries stored in a checkpoint journal."""
+    for page in checkpoint_pages(year, employer, last_name, shard):
+        yield from page
+
+
+def describe_query(parameters):
+    """Returns the checkpoint key and a description of a query."""
     year = parameters["two_year_transaction_period"]
     employer = None
     name = None
@@ -99,66 +236,86 @@ def download_pages(parameters):
         message = f"{message} for employer {employer}"
     if "contributor_name" in parameters:
         name = parameters["contributor_name"]
-        message = f"{message} for name {name}"
-    entry, entries_year, pagination = checkpoint_read(year, employer, name)
+        if isinstance(name, (list, tuple)):
+            message = f"{message} for {len(name)} names"
+            name = "batch_" + hashlib.sha1("|".join(sorted(name)).encode("utf-8")).hexdigest()[:16]
+        else:
+            message = f"{message} for name {name}"
+    if parameters.get("sort_null_only") == "true":
+        message = f"{message}, without receipt date"
+    elif query_shard(parameters) is not None:
+        message = f"{message}, dates {parameters.get('min_date', '')} to {parameters.get('max_date', '')}"
+    return year, employer, name, message
+
+
+def query_shard(parameters):
+    """Returns the checkpoint key of a date range shard, or None for a whole query."""
+    if parameters.get("sort_null_only") == "true":
+        return "undated"
+    if "min_date" not in parameters and "max_date" not in parameters:
+        return None
+    return f"{parameters.get('min_date', '')}_{parameters.get('max_date', '')}"
+
+
+def drop_committee(page):
+    """Removes the nested committee from the items of a page, keeping `committee_id`."""
+    for item in page:
+        item.pop("committee", None)
+    return page
+
+
+def iter_pages(parameters, progress = False, position = None, checkpoint = True, hooks = (), committee = True):
+    """Lazily iterates over the pages of results of a query.
+
+    Pages are requested only as they are consumed, so callers can filter the
+    results or stop early without holding the whole result in memory. Pages
+    already saved in the checkpoint are yielded first, followed by new pages
+    from the API.
 
-    print(message)
+    Args:
+        parameters (dict): API parameters of the query. The cursor and page
+            size are updated in place.
+        progress (bool): show a progress bar (default: False)
+        position (int): line of the progress bar, for parallel downloads (default: None)
+        checkpoint (bool): save each page to the checkpoint journal and resume
+            from it (default: True)
+        hooks (list): functions called as hook(year, page) for each page, for
+            example `Sink.write` (default: ())
+        committee (bool): keep the nested committee of each item. Without it,
+            the committee is removed before the page is saved to the
+            checkpoint or passed to the hooks (default: True)
+
+    Yields:
+        list: A page of contribution and loan items.
+    """
+    year, employer, name, message = describe_query(parameters)
+    shard = query_shard(parameters)
+    if checkpoint:
+        entry, pagination = checkpoint_read(year, employer, name, shard)
+        for page in checkpoint_pages(year, employer, name, shard):
+            if not committee:
+                drop_committee(page)
+            for hook in hooks:
+                hook(year, page)
+            yield page
+    else:
+        entry = 0
+        pagination = {"count": 1, "last_indexes": {}}
 
     if "last_indexes" in pagination and pagination["last_indexes"] is None:
-        return entries_year
-
-    while True:
-        if "last_indexes" in pagination:
-            if pagination["last_indexes"] is None:
-                break
-            for key, value in pagination["last_indexes"].items():
-                parameters[key] = value
-
-        response, timing = make_request(api_url, params=parameters)
-        response = response.json()
-        results = response["results"]
-
-        entries_year += results
-
-        pagination = response["pagination"]
-        entry += parameters["per_page"]
-
-        checkpoint_dump(pagination, entries_year, entry, year, employer, name)
-
-        if len(results) < parameters["per_page"]:
-            print(len(results))
-            break
-
-        if timing > 20 and parameters["per_page"] > 1:
-            parameters["per_page"] //= 2
-        if timing < 2 and parameters["per_page"] <= 90:
-            parameters["per_page"] += 10
-            #print(f"reducing per page to {parameters['per_page']} (timing {timing})")
-
-    return entries_year
+        return
 
+    if not progress:
+        print(message)
 
-
-def download_pages_tqdm(parameters):
-    year = parameters["two_year_transaction_period"]
-    employer = None
-    name = None
-    message = f"Downloading years {year-2} to {year}"
-    if "contributor_employer" in parameters:
-        employer = parameters["contributor_employer"]
-        message = f"{message} for employer {employer}"
-    if "contributor_name" in parameters:
-        name = parameters["contributor_name"]
-        message = f"{message} for name {name}"
-    entry, entries_year, pagination = checkpoint_read(year, employer, name)
-
-    if "last_indexes" in pagination and pagination["last_indexes"] is None:
-        return entries_year
+    parameters["per_page"] = page_size_controller.initial(parameters)
 
     with tqdm(
         total=pagination['count'],
         desc=message,
-        miniters=1
+        miniters=1,
+        position=position,
+        disable=not progress,
     ) as pbar:
         pbar.update(entry)
         while True:
@@ -171,43 +328,252 @@ def download_pages_tqdm(parameters):
             response, timing = make_request(api_url, params=parameters)
             response = response.json()
             results = response["results"]
-
-            entries_year += results
+            if not committee:
+                drop_committee(results)
 
             pagination = response["pagination"]
-            entry += parameters["per_page"]
-
-            checkpoint_dump(pagination, entries_year, entry, year, employer, name)
-
-            if len(results) < parameters["per_page"]:
+            per_page = parameters["per_page"]
+            entry += per_page
+            parameters["per_page"] = page_size_controller.update(parameters, per_page, timing, len(results))
+
+            metrics.inc("fec_records_total", len(results))
+            metrics.set("fec_last_page_timestamp_seconds", time.time())
+            if timing > 0:
+                metrics.set("fec_records_per_second", len(results) / timing)
+
+            if checkpoint:
+                with metrics.timer("fec_checkpoint_write_seconds"):
+                    checkpoint_dump(pagination, results, entry, year, employer, name, shard)
+            for hook in hooks:
+                hook(year, results)
+            yield results
+
+            if len(results) < per_page:
                 break
 
-            if timing > 20 and parameters["per_page"] > 1:
-                parameters["per_page"] //= 2
-            if timing < 2 and parameters["per_page"] <= 90:
-                parameters["per_page"] += 10
-                #print(f"reducing per page to {parameters['per_page']} (timing {timing})")
-
             pbar.total = pagination['count']
             pbar.n = entry
             pbar.update(entry - pbar.n)
-    return entries_year
 
 
-def download_scheduleA_year_range(start, end, api_key = "DEMO_KEY", employer = None, name = None):
+def download_pages(parameters, committee = True):
+    entries = []
+    for page in iter_pages(parameters, committee=committee):
+        entries += page
+    return entries
+
+
+def download_pages_tqdm(parameters, position=None, sink=None, committee=True):
+    if sink is not None:
+        for page in iter_pages(parameters, progress=True, position=position, hooks=[sink.write], committee=committee):
+            pass
+        return []
+
+    entries = []
+    for page in iter_pages(parameters, progress=True, position=position, committee=committee):
+        entries += page
+    return entries
+
+
+def download_parallel(parameter_list, workers = 4, sink = None, committee = True):
+    """Downloads several queries at the same time.
+
+    Each query keeps its own cursor and checkpoint. All threads share the rate
+    limiter used by `make_request`.
+
+    Args:
+        parameter_list (list): API parameters of each query
+        workers (int): number of queries to download at the same time (default: 4)
+        sink (Sink): if given, entries are written to the sink as they arrive
+            instead of being returned (default: None)
+        committee (bool): keep the nested committee of each entry (default: True)
+
+    Returns:
+        list: The list of entries of each query, in the order of parameter_list.
+    """
+    if workers <= 1:
+        return [download_pages_tqdm(parameters, sink=sink, committee=committee) for parameters in parameter_list]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(download_pages_tqdm, parameters, position, sink, committee)
+            for position, parameters in enumerate(parameter_list)
+        ]
+        return [future.result() for future in futures]
+
+
+def probe_count(parameters):
+    """Requests a single result of a query to read its number of results.
+
+    Returns:
+        tuple: The count and whether the API reports it as exact.
+    """
+    probe = dict(parameters, per_page=1, page=1)
+    pagination = make_request(api_url, params=probe)[0].json()["pagination"]
+    return pagination["count"], pagination.get("is_count_exact", False)
+
+
+def shard_parameters(parameters, shard_size = 50000, max_shards = 16):
+    """Splits a query into date ranges that can be downloaded concurrently.
+
+    A keyset paginated query is a single chain of requests. Splitting it by
+    contribution receipt date gives independent chains, each with its own
+    cursor and checkpoint. The largest range is halved, using the counts of
+    probe requests, until every range has at most `shard_size` results or
+    there are `max_shards` ranges. The first and last ranges are open ended,
+    so dates outside the cycle are included.
+
+    Records without a receipt date are not in any range. They are
+    downloaded as one more shard, with `sort_null_only`, which the API
+    answers with the records whose sort column, the receipt date, is null.
+    The shard is left out only when exact counts show that every record has
+    a date. Large queries have estimated counts, which are used to size the
+    ranges all the same.
+
+    Args:
+        parameters (dict): API parameters of the query
+        shard_size (int): target number of results in a range (default: 50000)
+        max_shards (int): maximum number of ranges (default: 16)
+
+    Returns:
+        list: API parameters of each range, or of the whole query.
+    """
+    total, exact = probe_count(parameters)
+    if total <= shard_size:
+        return [parameters]
+
+    year = parameters["two_year_transaction_period"]
+    first_day = datetime.date(year - 1, 1, 1)
+    last_day = datetime.date(year, 12, 31)
+    day = datetime.timedelta(days=1)
+
+    def with_dates(min_date, max_date):
+        shard = dict(parameters)
+        if min_date is not None:
+            shard["min_date"] = min_date.isoformat()
+        if max_date is not None:
+            shard["max_date"] = max_date.isoformat()
+        return shard
+
+    dated, dated_exact = probe_count(with_dates(datetime.date(1900, 1, 1), datetime.date(2100, 12, 31)))
+    exact = exact and dated_exact
+
+    # (min_date, max_date, estimated count), None for an open end
+    shards = [(None, None, dated)]
+    while len(shards) < max_shards:
+        splittable = [
+            shard for shard in shards
+            if shard[2] > shard_size and (shard[1] or last_day) > (shard[0] or first_day)
+        ]
+        if len(splittable) == 0:
+            break
+        shard = max(splittable, key=lambda shard: shard[2])
+        low = shard[0] or first_day
+        high = shard[1] or last_day
+        middle = low + (high - low) // 2
+        left, _ = probe_count(with_dates(shard[0], middle))
+        index = shards.index(shard)
+        shards[index:index+1] = [
+            (shard[0], middle, left),
+            (middle + day, shard[1], max(shard[2] - left, 0)),
+        ]
+
+    if len(shards) == 1:
+        return [parameters]
+    # Estimated counts of small ranges can be 0 when the range has results
+    result = [with_dates(min_date, max_date) for min_date, max_date, count in shards if count > 0 or not exact]
+    if not exact or dated < total:
+        result.append(dict(parameters, sort_null_only="true"))
+    return result
+
+
+def download_sharded(parameter_list, workers = 4, sink = None, shard_size = 50000, max_shards = 16, committee = True):
+    """Downloads queries split into date ranges, several ranges at the same time.
+
+    Results that appear in more than one range, for example because a
+    record changed while it was downloaded, are kept once.
+
+    Args:
+        parameter_list (list): API parameters of each query
+        workers (int): number of ranges to download at the same time (default: 4)
+        sink (Sink): if given, entries are written to the sink as they arrive
+            instead of being returned (default: None)
+        shard_size (int): target number of results in a range (default: 50000)
+        max_shards (int): maximum number of ranges per query (default: 16)
+        committee (bool): keep the nested committee of each entry (default: True)
+
+    Returns:
+        list: The list of entries of each query, in the order of parameter_list.
+    """
+    shards = []
+    for index, parameters in enumerate(parameter_list):
+        for shard in shard_parameters(parameters, shard_size, max_shards):
+            shards.append((index, shard))
+
+    seen = [set() for _ in parameter_list]
+    lock = threading.Lock()
+
+    def download_shard(index, parameters, position):
+        entries = []
+        for page in iter_pages(parameters, progress=True, position=position, committee=committee):
+            with lock:
+                page = [item for item in page if item["sub_id"] not in seen[index]]
+                seen[index].update(item["sub_id"] for item in page)
+            if sink is not None:
+                sink.write(parameters["two_year_transaction_period"], page)
+            else:
+                entries += page
+        return index, entries
+
+    results = [[] for _ in parameter_list]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(download_shard, index, parameters, position)
+            for position, (index, parameters) in enumerate(shards)
+        ]
+        for future in futures:
+            index, entries = future.result()
+            results[index] += entries
+    return results
+
+
+def download_scheduleA_year_range(start, end, api_key = "DEMO_KEY", employer = None, name = None, workers = 1, sink = None, shard_size = None, committee = True):
     """Fetches all Schedule A filings of campaign contributions and loans for the given two-year periods.
 
     Args:
         start (int): starting year of two-year periods
         end (int): ending year of two-year periods
-        api_key (str): API key for accessing the FEC API (default: "DEMO_KEY")
+        api_key (str or list): API key, or a list of keys to spread requests over (default: "DEMO_KEY")
+        workers (int): number of two-year periods to download at the same time (default: 1)
+        sink (Sink): if given, items are written to the sink as they arrive
+            instead of being returned (default: None)
+        shard_size (int): if given, split each two-year period into date
+            ranges of about this many items, downloaded `workers` at a time
+            (default: None)
+        committee (bool): keep the nested committee of each item (default: True)
 
     Returns:
         list: A list of contribution and loan items from FEC API.
     """
+    parameter_list = scheduleA_parameters(start, end, api_key, employer, name)
+
+    if shard_size is not None:
+        results = download_sharded(parameter_list, max(workers, 1), sink, shard_size, committee=committee)
+    else:
+        results = download_parallel(parameter_list, workers, sink, committee=committee)
+
+    entries = []
+    for entries_year in results:
+        entries += entries_year
+
+    return entries
+
+
+def scheduleA_parameters(start, end, api_key = "DEMO_KEY", employer = None, name = None):
+    """Returns the API parameters for each two-year period between start and end."""
     start = (start//2+1)*2
     end = (end//2+2)*2
-    entries = []
+    parameter_list = []
 
     for year in range(start, end, 2):
         parameters = {
@@ -221,23 +587,200 @@ def download_scheduleA_year_range(start, end, api_key = "DEMO_KEY", employer = N
         if name is not None:
             parameters["contributor_name"] = name
         parameters["two_year_transaction_period"] = year
+        parameter_list.append(parameters)
 
-        entries += download_pages_tqdm(parameters)
+    return parameter_list
 
-    return entries
+
+# Longest request URL sent for batched name queries. Many servers reject
+# URLs longer than 8 KB.
+max_url_length = 6000
+# Room left in the URL for the keyset cursor parameters
+cursor_url_length = 200
+
+
+def url_length(parameters):
+    """Returns the length of the request URL of a query."""
+    return len(requests.Request("GET", api_url, params=parameters).prepare().url)
+
+
+def name_batches_filename(parameter_list, names, *limits):
+    """Returns the file of the saved batches of a set of names, keyed by the queries and limits."""
+    queries = [
+        sorted((key, value) for key, value in parameters.items() if key not in ("api_key", "per_page", "page"))
+        for parameters in parameter_list
+    ]
+    key = json.dumps([queries, sorted(set(names)), limits], default=str)
+    return f"checkpoints/name_batches_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+def plan_name_batches(parameter_list, names, max_results = 20000, max_names = 100, max_url_length = max_url_length, probe = True, checkpoint = True):
+    """Groups names into batches queried together.
+
+    The schedule_a endpoint accepts several `contributor_name` values and
+    returns the results of all of them, so a batch needs one chain of
+    requests instead of one per name. Names are added to a batch until the
+    request URL would exceed `max_url_length` or the batch has `max_names`
+    names. With `probe`, the expected number of results of each batch is
+    read from probe requests, and batches with more than `max_results`
+    results are halved, so that a single batch stays quick to download and
+    to retry.
+
+    A probed plan is saved next to the checkpoints and reused by later runs
+    with the same queries, names and limits, so a resumed download sends no
+    probe requests and keeps the batches of its checkpoints.
+
+    Args:
+        parameter_list (list): API parameters of each two-year period, without names
+        names (list): names to query
+        max_results (int): maximum expected results of a batch (default: 20000)
+        max_names (int): maximum number of names in a batch (default: 100)
+        max_url_length (int): maximum length of a request URL (default: 6000)
+        probe (bool): size batches by their result counts (default: True)
+        checkpoint (bool): save the probed plan and reuse a saved one (default: True)
+
+    Returns:
+        list: Lists of names.
+    """
+    names = sorted(set(names))
+    filename = name_batches_filename(parameter_list, names, max_results, max_names, max_url_length)
+    if probe and checkpoint and os.path.exists(filename):
+        try:
+            with open(filename, "r") as f:
+                return json.load(f)
+        except ValueError:
+            pass
+
+    batches = []
+    batch = []
+    for name in names:
+        candidate = batch + [name]
+        too_long = max(
+            url_length(dict(parameters, contributor_name=candidate)) for parameters in parameter_list
+        ) + cursor_url_length > max_url_length
+        if len(batch) > 0 and (too_long or len(candidate) > max_names):
+            batches.append(batch)
+            candidate = [name]
+        batch = candidate
+    if len(batch) > 0:
+        batches.append(batch)
+
+    if not probe:
+        return batches
+
+    planned = []
+    while len(batches) > 0:
+        batch = batches.pop()
+        if len(batch) > 1:
+            count = sum(probe_count(dict(parameters, contributor_name=batch))[0] for parameters in parameter_list)
+            if count > max_results:
+                half = len(batch) // 2
+                batches += [batch[:half], batch[half:]]
+                continue
+        planned.append(batch)
+    planned = sorted(planned)
+
+    if checkpoint:
+        os.makedirs("checkpoints", exist_ok=True)
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(planned, f)
+        os.replace(tmp_filename, filename)
+    return planned
+
+
+def name_tokens(name):
+    return set(re.findall(r"[A-Z0-9]+", name.upper()))
+
+
+def split_by_name(items, names):
+    """Splits the results of a batched query by the queried names.
+
+    An item belongs to a name if all words of the name appear in its
+    `contributor_name`, which is how the API matches names. An item can
+    belong to several names.
+
+    Returns:
+        dict: The items of each name.
+    """
+    tokens = {name: name_tokens(name) for name in names}
+    result = {name: [] for name in names}
+    for item in items:
+        item_tokens = name_tokens(item.get("contributor_name") or "")
+        for name, words in tokens.items():
+            if words <= item_tokens:
+                result[name].append(item)
+    return result
+
+
+def iter_scheduleA(start, end, api_key = "DEMO_KEY", employer = None, name = None, progress = True, hooks = (), committee = True):
+    """Lazily iterates over pages of Schedule A filings for the given two-year periods.
+
+    Args:
+        start (int): starting year of two-year periods
+        end (int): ending year of two-year periods
+        api_key (str or list): API key, or a list of keys to spread requests over (default: "DEMO_KEY")
+        progress (bool): show a progress bar (default: True)
+        hooks (list): functions called as hook(year, page) for each page (default: ())
+        committee (bool): keep the nested committee of each item (default: True)
+
+    Yields:
+        list: A page of contribution and loan items.
+    """
+    for parameters in scheduleA_parameters(start, end, api_key, employer, name):
+        yield from iter_pages(parameters, progress=progress, hooks=hooks, committee=committee)
     
-def fec_scheduleA_year_range(start, end, key = "DEMO_KEY", employer=None, name=None):
+def fec_scheduleA_year_range(start, end, key = "DEMO_KEY", employer=None, name=None, workers=1, shard_size=None, committee=True):
     """Returns a panda DataFrame with campaign contributions and loans by cycle.
 
     Args:
         start (int): starting year of two-year periods
         end (int): ending year of two-year periods
-        key (str): API key for accessing the FEC API (default: "DEMO_KEY")
+        key (str or list): API key, or a list of keys to spread requests over (default: "DEMO_KEY")
+        workers (int): number of two-year periods to download at the same time (default: 1)
+        shard_size (int): if given, split each two-year period into date
+            ranges of about this many items, downloaded `workers` at a time
+            (default: None)
+        committee (bool): keep the nested committee of each item as
+            "committee.<field>" columns. Without it only `committee_id` is
+            kept; see committees.CommitteeTable.enrich (default: True)
 
     Returns:
         pandas.DataFrame: A DataFrame of contribution and loan items by cycle.
     """
-    entries = download_scheduleA_year_range(start, end, key, employer, name)
-    df = pandas.DataFrame(json_normalize(entries))
+    import pandas
+    entries = download_scheduleA_year_range(start, end, key, employer, name, workers, shard_size=shard_size, committee=committee)
+    df = pandas.DataFrame(pandas.json_normalize(entries))
     return df
 
+
+
+def fec_scheduleA_to_file(start, end, path, format = "parquet", key = "DEMO_KEY", employer=None, name=None, workers=1, shard_size=None, committee=True):
+    """Downloads campaign contributions and loans and writes them to disk as they arrive.
+
+    Each page is flattened to a fixed, typed set of columns and written to
+    files partitioned by cycle, so memory use does not grow with the size of
+    the output.
+
+    Args:
+        start (int): starting year of two-year periods
+        end (int): ending year of two-year periods
+        path (str): output directory
+        format (str): "parquet", "arrow" or "csv" (default: "parquet")
+        key (str or list): API key, or a list of keys to spread requests over (default: "DEMO_KEY")
+        workers (int): number of two-year periods to download at the same time (default: 1)
+        shard_size (int): if given, split each two-year period into date
+            ranges of about this many items, downloaded `workers` at a time
+            (default: None)
+        committee (bool): write the committee fields. Without them only
+            `committee_id` is written; see committees.CommitteeTable.enrich
+            (default: True)
+
+    Returns:
+        str: The output directory.
+    """
+    from .sinks import make_sink, schedule_a_schema, schedule_a_schema_without_committee
+    schema = schedule_a_schema if committee else schedule_a_schema_without_committee
+    with make_sink(path, format, schema=schema) as sink:
+        download_scheduleA_year_range(start, end, key, employer, name, workers, sink, shard_size, committee)
+    return path
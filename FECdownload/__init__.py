@@ -1,2 +1,86 @@
-from .FECdownload import *
-from . import contributor_employer_name_matcher
+"""Download individual contributions from the OpenFEC API and match them to donors.
+
+Submodules and the functions of `FECdownload.FECdownload` are imported on
+first access (PEP 562), so `import FECdownload` does not load pandas,
+requests or the nickname tables until they are used.
+"""
+import importlib
+
+_submodules = {
+    "FECdownload",
+    "bulk_download",
+    "bulk_ingest",
+    "bulk_matcher",
+    "committees",
+    "contributor_employer_name_matcher",
+    "http_client",
+    "job_queue",
+    "metrics",
+    "name_groups",
+    "page_size",
+    "rate_limiter",
+    "response_cache",
+    "sinks",
+    "stage_cache",
+    "store",
+    "utils",
+}
+
+# Exported by `from FECdownload import *`, which resolves them through __getattr__
+__all__ = [
+    "contributor_employer_name_matcher",
+    "set_rate_limiter",
+    "set_page_size_controller",
+    "make_request",
+    "checkpoint_filename",
+    "journal_filename",
+    "cursor_filename",
+    "checkpoint_dump",
+    "checkpoint_remove",
+    "checkpoint_migrate",
+    "checkpoint_read",
+    "checkpoint_pages",
+    "checkpoint_entries",
+    "describe_query",
+    "query_shard",
+    "drop_committee",
+    "iter_pages",
+    "download_pages",
+    "download_pages_tqdm",
+    "download_parallel",
+    "probe_count",
+    "shard_parameters",
+    "download_sharded",
+    "download_scheduleA_year_range",
+    "scheduleA_parameters",
+    "url_length",
+    "name_batches_filename",
+    "plan_name_batches",
+    "name_tokens",
+    "split_by_name",
+    "iter_scheduleA",
+    "fec_scheduleA_year_range",
+    "fec_scheduleA_to_file",
+]
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f".{name}", __name__)
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Everything else is exported from the download module
+    module = importlib.import_module(".FECdownload", __name__)
+    try:
+        value = getattr(module, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    names = set(globals()) | _submodules
+    if "FECdownload" in globals():
+        names |= {name for name in dir(globals()["FECdownload"]) if not name.startswith("_")}
+    return sorted(names)
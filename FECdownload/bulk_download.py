@@ -2,6 +2,12 @@ import requests
 import tqdm
 import datetime
 import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+from .http_client import get_client
+from .metrics import metrics
 
 bulk_contributions_url = "https://www.fec.gov/files/bulk-downloads/{y}/indiv{y2}.zip"
 bulk_committee_url = "https://www.fec.gov/files/bulk-downloads/{y}/cm{y2}.zip"
@@ -9,45 +15,179 @@ this_year = datetime.date.today().year
 first_year = 1980
 last_year = (this_year//2+1)*2
 
-chunk_size = 1024
-unit = "KB"
+chunk_size = 1024*1024
+unit = "B"
 
-def download_contibutions():
-    if not os.path.isdir("bulk_data"):
-        os.makedirs("bulk_data")
 
-    for year in range(first_year, last_year, 2):
-        filename = f"bulk_data/contributions_{year}.zip"
-        if os.path.exists(filename):
+def read_meta(filename):
+    """Reads the validators (ETag, Last-Modified and size) saved for a download."""
+    try:
+        with open(f"{filename}.meta.json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_meta(filename, meta):
+    tmp_filename = f"{filename}.meta.json.tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_filename, f"{filename}.meta.json")
+
+def response_meta(response):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+def total_size(response, offset):
+    """Returns the full size of the file from a 200 or 206 response, if known."""
+    if response.status_code == 206:
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range and not content_range.endswith("/*"):
+            return int(content_range.rsplit("/", 1)[1])
+        return None
+    length = response.headers.get("Content-Length")
+    if length is None:
+        return None
+    return int(length)
+
+
+def download_file(url, filename, position = None, refresh = True, max_tries = 5, sleep_time = 5):
+    """Downloads a file, resuming partial downloads and skipping unchanged files.
+
+    The file is written to `<filename>.part` and renamed once its size matches
+    the size reported by the server, so an interrupted download never leaves
+    a truncated file in place. A partial file is continued with a Range
+    request. An existing file is downloaded again only if its ETag or
+    Last-Modified date has changed.
+
+    Args:
+        url (str): The URL to download
+        filename (str): The file to write
+        position (int): line of the progress bar, for parallel downloads (default: None)
+        refresh (bool): check whether existing files have changed (default: True)
+        max_tries (int): number of attempts, each continuing the previous one (default: 5)
+        sleep_time (int): time to wait in seconds between attempts (default: 5)
+
+    Returns:
+        bool: True if the file was downloaded, False if it was up to date.
+    """
+    client = get_client()
+    part_filename = f"{filename}.part"
+    meta = read_meta(filename)
+
+    if os.path.exists(filename) and not os.path.exists(part_filename):
+        if not refresh and "size" in meta:
+            metrics.inc("fec_bulk_files_total", result="unchanged")
+            return False
+        if "size" not in meta:
+            # Downloaded by an older version. Keep it if the size matches.
+            response = client.session.head(url, timeout=client.timeout, allow_redirects=True)
+            response.raise_for_status()
+            if total_size(response, 0) == os.path.getsize(filename):
+                write_meta(filename, dict(response_meta(response), size=os.path.getsize(filename)))
+                metrics.inc("fec_bulk_files_total", result="unchanged")
+                return False
+
+    for attempt in range(max_tries):
+        headers = {"Accept-Encoding": "identity"}
+        offset = 0
+        if os.path.exists(part_filename):
+            offset = os.path.getsize(part_filename)
+            headers["Range"] = f"bytes={offset}-"
+            validator = meta.get("partial", {})
+            if validator.get("etag") or validator.get("last_modified"):
+                # The server sends the whole file if it changed since the part was written
+                headers["If-Range"] = validator.get("etag") or validator.get("last_modified")
+        elif os.path.exists(filename) and "size" in meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = client.get(url, headers=headers, stream=True)
+            if response.status_code == 304:
+                metrics.inc("fec_bulk_files_total", result="unchanged")
+                return False
+            if response.status_code == 416:
+                # The part is not a prefix of the current file. Start over.
+                os.remove(part_filename)
+                continue
+            response.raise_for_status()
+
+            if response.status_code != 206:
+                offset = 0
+            size = total_size(response, offset)
+            meta["partial"] = response_meta(response)
+            write_meta(filename, meta)
+
+            with open(part_filename, "ab" if offset > 0 else "wb") as f, tqdm.tqdm(
+                total=size, initial=offset, unit=unit, unit_scale=True,
+                desc=os.path.basename(filename), position=position
+            ) as pbar:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    pbar.update(len(chunk))
+                    metrics.inc("fec_bulk_bytes_total", len(chunk))
+        except requests.exceptions.HTTPError:
+            raise
+        except (IOError, ValueError) as e:
+            # Includes dropped connections. The next attempt continues from the part.
+            print(f"Download of {url} interrupted: {e}")
+            metrics.inc("fec_bulk_retries_total")
+            if attempt == max_tries - 1:
+                raise
+            sleep(sleep_time)
             continue
 
-        url = bulk_contributions_url.format(y=str(year), y2=str(year)[-2:])
-        print(f"Downloading {url}")
+        received = os.path.getsize(part_filename)
+        if size is not None and received != size:
+            print(f"Download of {url} incomplete: {received} of {size} bytes")
+            if received > size:
+                os.remove(part_filename)
+            continue
 
-        response = requests.get(url, stream = True)
-        total_size = int(response.headers.get('content-length', 0))//chunk_size
-        with open(filename, 'wb') as f:
-            for chunk in tqdm.tqdm(response.iter_content(chunk_size=chunk_size), total=total_size, unit=unit):
-                f.write(chunk)
+        os.replace(part_filename, filename)
+        write_meta(filename, dict(meta["partial"], size=received))
+        metrics.inc("fec_bulk_files_total", result="downloaded")
+        return True
 
+    raise IOError(f"Could not download {url} in {max_tries} attempts")
 
-def download_committees():
+
+def download_files(files, workers = 4, refresh = True):
+    """Downloads several files at the same time.
+
+    Args:
+        files (list): (url, filename) pairs
+        workers (int): number of files downloaded at the same time (default: 4)
+        refresh (bool): check whether existing files have changed (default: True)
+    """
     if not os.path.isdir("bulk_data"):
         os.makedirs("bulk_data")
 
-    for year in range(first_year, last_year, 2):
-        filename = f"bulk_data/committees_{year}.zip"
-        if os.path.exists(filename):
-            continue
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(download_file, url, filename, position, refresh)
+            for position, (url, filename) in enumerate(files)
+        ]
+        return [future.result() for future in futures]
 
-        url = bulk_committee_url.format(y=str(year), y2=str(year)[-2:])
-        print(f"Downloading {url}")
 
-        response = requests.get(url, stream = True)
-        total_size = int(response.headers.get('content-length', 0))//chunk_size
-        with open(filename, 'wb') as f:
-            for chunk in tqdm.tqdm(response.iter_content(chunk_size=chunk_size), total=total_size, unit=unit):
-                f.write(chunk)
+def download_contibutions(workers = 4, refresh = True):
+    files = []
+    for year in range(first_year, last_year, 2):
+        filename = f"bulk_data/contributions_{year}.zip"
+        url = bulk_contributions_url.format(y=str(year), y2=str(year)[-2:])
+        files.append((url, filename))
+    download_files(files, workers, refresh)
 
 
-    
\ No newline at end of file
+def download_committees(workers = 4, refresh = True):
+    files = []
+    for year in range(first_year, last_year, 2):
+        filename = f"bulk_data/committees_{year}.zip"
+        url = bulk_committee_url.format(y=str(year), y2=str(year)[-2:])
+        files.append((url, filename))
+    download_files(files, workers, refresh)
@@ -0,0 +1,285 @@
+import os
+import glob
+import shutil
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .sinks import require_pyarrow
+from .metrics import metrics
+
+# Columns of the bulk files, from the FEC header files, and their types.
+# Numbers are parsed by the CSV reader, dates are parsed from MMDDYYYY.
+bulk_files = {
+    "contributions": {
+        "filename": "contributions_{year}.zip",
+        "members": ["itcont.txt"],
+        "columns": {
+            "CMTE_ID": "string",
+            "AMNDT_IND": "category",
+            "RPT_TP": "category",
+            "TRANSACTION_PGI": "category",
+            "IMAGE_NUM": "string",
+            "TRANSACTION_TP": "category",
+            "ENTITY_TP": "category",
+            "NAME": "string",
+            "CITY": "string",
+            "STATE": "category",
+            "ZIP_CODE": "string",
+            "EMPLOYER": "string",
+            "OCCUPATION": "string",
+            "TRANSACTION_DT": "date",
+            "TRANSACTION_AMT": "float",
+            "OTHER_ID": "string",
+            "TRAN_ID": "string",
+            "FILE_NUM": "int",
+            "MEMO_CD": "category",
+            "MEMO_TEXT": "string",
+            "SUB_ID": "int",
+        },
+        "partitions": {
+            "state": "STATE",
+            "month": "TRANSACTION_DT",
+        },
+    },
+    "committees": {
+        "filename": "committees_{year}.zip",
+        "members": ["cm.txt"],
+        "columns": {
+            "CMTE_ID": "string",
+            "CMTE_NM": "string",
+            "TRES_NM": "string",
+            "CMTE_ST1": "string",
+            "CMTE_ST2": "string",
+            "CMTE_CITY": "string",
+            "CMTE_ST": "category",
+            "CMTE_ZIP": "string",
+            "CMTE_DSGN": "category",
+            "CMTE_TP": "category",
+            "CMTE_PTY_AFFILIATION": "category",
+            "CMTE_FILING_FREQ": "category",
+            "ORG_TP": "category",
+            "CONNECTED_ORG_NM": "string",
+            "CAND_ID": "string",
+        },
+        "partitions": {},
+    },
+}
+
+# Bytes of text parsed at a time. Memory use is a small multiple of this.
+block_size = 64 * 1024 * 1024
+
+
+def zip_members(archive, kind):
+    """Returns the data files in a bulk archive."""
+    names = archive.namelist()
+    members = [name for name in names if os.path.basename(name) in bulk_files[kind]["members"]]
+    if len(members) == 0:
+        members = [name for name in names if name.endswith(".txt")]
+    return members
+
+
+def iter_bulk_batches(zip_path, kind = "contributions"):
+    """Reads a bulk archive in bounded-size chunks without extracting it.
+
+    Rows with the wrong number of fields are skipped. Their number is printed
+    and counted in `fec_bulk_skipped_rows_total`.
+
+    Yields:
+        pyarrow.Table: A chunk of rows with the official column names and types.
+    """
+    pa = require_pyarrow()
+    import pyarrow.csv as csv
+    import pyarrow.compute as pc
+
+    columns = bulk_files[kind]["columns"]
+    types = {
+        "string": pa.string(),
+        "category": pa.string(),
+        "date": pa.string(),
+        "float": pa.float64(),
+        "int": pa.int64(),
+    }
+    read_options = csv.ReadOptions(column_names=list(columns), block_size=block_size, encoding="latin1")
+    # Rows are parsed in several threads
+    lock = threading.Lock()
+    skipped = {"rows": 0, "first": None}
+
+    def skip(row):
+        with lock:
+            skipped["rows"] += 1
+            if skipped["first"] is None:
+                skipped["first"] = row.number
+        return "skip"
+
+    # The files are not quoted. Names can contain quote characters.
+    parse_options = csv.ParseOptions(delimiter="|", quote_char=False, invalid_row_handler=skip)
+    convert_options = csv.ConvertOptions(
+        column_types={column: types[kind] for column, kind in columns.items()},
+        null_values=[""],
+        strings_can_be_null=True,
+    )
+
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in zip_members(archive, kind):
+            with archive.open(member) as f:
+                reader = csv.open_csv(f, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+                for batch in reader:
+                    table = pa.Table.from_batches([batch])
+                    for i, (column, column_kind) in enumerate(columns.items()):
+                        if column_kind == "category":
+                            table = table.set_column(i, column, pc.dictionary_encode(table[column]))
+                        elif column_kind == "date":
+                            dates = pc.strptime(table[column], format="%m%d%Y", unit="s", error_is_null=True)
+                            table = table.set_column(i, column, pc.cast(dates, pa.date32()))
+                    yield table
+            if skipped["rows"] > 0:
+                print(f"Skipped {skipped['rows']} malformed rows of {zip_path}:{member}, the first at line {skipped['first']}")
+                metrics.inc("fec_bulk_skipped_rows_total", skipped["rows"], kind=kind)
+                skipped["rows"] = 0
+                skipped["first"] = None
+
+
+def partition_values(table, column, partition_by):
+    """Returns the partition directory of each distinct value and the rows in it."""
+    pa = require_pyarrow()
+    import pyarrow.compute as pc
+    values = table[column]
+    if partition_by == "month":
+        values = pc.strftime(pc.cast(values, "timestamp[s]"), format="%Y-%m")
+    elif not pa.types.is_string(values.type):
+        values = pc.cast(values, "string")
+    for value in pc.unique(values).to_pylist():
+        if value is None:
+            mask = pc.is_null(values)
+            value = "__HIVE_DEFAULT_PARTITION__"
+        else:
+            mask = pc.equal(values, value)
+        yield f"{partition_by}={value}", table.filter(mask)
+
+
+def ingest_file(zip_path, output, cycle, kind = "contributions", partition_by = None, compression = "zstd", row_group_size = 1000000, max_buffered_rows = None):
+    """Converts one bulk archive into compressed Parquet files.
+
+    Rows are written to `<output>/cycle=<cycle>/[<partition>=<value>/]part-0.parquet`
+    and buffered per partition until a row group is full. When more than
+    `max_buffered_rows` rows are buffered in all partitions together, the
+    largest buffers are written early, so memory use does not grow with the
+    number of partitions.
+
+    The files are written to a hidden directory next to `cycle=<cycle>`,
+    which replaces the directory of the cycle when all files are complete.
+    Files of an earlier ingest of the cycle, for example with other
+    partitions, are removed, and a failed ingest leaves the old files.
+
+    Args:
+        max_buffered_rows (int): rows buffered in all partitions together
+            (default: row_group_size)
+
+    Returns:
+        int: The number of rows written.
+    """
+    pa = require_pyarrow()
+    import pyarrow.parquet as pq
+
+    if partition_by is not None and partition_by not in bulk_files[kind]["partitions"]:
+        raise ValueError(f"Cannot partition {kind} by {partition_by}")
+
+    if max_buffered_rows is None:
+        max_buffered_rows = row_group_size
+
+    cycle_directory = os.path.join(output, f"cycle={cycle}")
+    # Hidden from glob and pyarrow datasets until it is complete
+    tmp_directory = os.path.join(output, f".cycle={cycle}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    writers = {}
+    buffers = {}
+    buffered = {}
+    rows = 0
+
+    def flush(partition):
+        tables = buffers.pop(partition, [])
+        buffered.pop(partition, None)
+        if len(tables) == 0:
+            return
+        table = pa.concat_tables(tables).combine_chunks()
+        if partition not in writers:
+            directory = os.path.join(tmp_directory, partition)
+            os.makedirs(directory, exist_ok=True)
+            filename = os.path.join(directory, "part-0.parquet")
+            writers[partition] = pq.ParquetWriter(filename, table.schema, compression=compression)
+        writers[partition].write_table(table, row_group_size=row_group_size)
+
+    try:
+        try:
+            for table in iter_bulk_batches(zip_path, kind):
+                rows += table.num_rows
+                if partition_by is None:
+                    parts = [("", table)]
+                else:
+                    column = bulk_files[kind]["partitions"][partition_by]
+                    parts = partition_values(table, column, partition_by)
+                for partition, part in parts:
+                    buffers.setdefault(partition, []).append(part)
+                    buffered[partition] = buffered.get(partition, 0) + part.num_rows
+                    if buffered[partition] >= row_group_size:
+                        flush(partition)
+                while sum(buffered.values()) > max_buffered_rows:
+                    flush(max(buffered, key=buffered.get))
+            for partition in list(buffers):
+                flush(partition)
+        finally:
+            for writer in writers.values():
+                writer.close()
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+
+    old_directory = os.path.join(output, f".cycle={cycle}.{os.getpid()}.old")
+    shutil.rmtree(old_directory, ignore_errors=True)
+    if os.path.exists(cycle_directory):
+        os.replace(cycle_directory, old_directory)
+    os.replace(tmp_directory, cycle_directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    return rows
+
+
+def ingest_bulk(kind = "contributions", years = None, bulk_dir = "bulk_data", output = None, partition_by = None, workers = 4):
+    """Converts downloaded bulk archives into Parquet datasets partitioned by cycle.
+
+    Each archive is handled by a separate worker process.
+
+    Args:
+        kind (str): "contributions" or "committees" (default: "contributions")
+        years (list): cycles to convert. By default all downloaded archives
+            are converted (default: None)
+        bulk_dir (str): directory of the downloaded archives (default: "bulk_data")
+        output (str): output directory (default: "bulk_parquet/<kind>")
+        partition_by (str): also partition each cycle by "state" or "month" (default: None)
+        workers (int): number of archives converted at the same time (default: 4)
+
+    Returns:
+        dict: The number of rows written for each cycle.
+    """
+    require_pyarrow()
+    if output is None:
+        output = os.path.join("bulk_parquet", kind)
+
+    filename = bulk_files[kind]["filename"]
+    if years is None:
+        pattern = os.path.join(bulk_dir, filename.format(year="*"))
+        prefix, suffix = filename.split("{year}")
+        years = sorted(int(os.path.basename(f)[len(prefix):-len(suffix)]) for f in glob.glob(pattern))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            year: executor.submit(
+                ingest_file,
+                os.path.join(bulk_dir, filename.format(year=year)),
+                output, year, kind, partition_by
+            )
+            for year in years
+        }
+        return {year: future.result() for year, future in futures.items()}
@@ -0,0 +1,289 @@
+import os
+import glob
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from . import utils
+from .sinks import require_pyarrow
+from .store import bulk_fields
+from .metrics import metrics
+from .contributor_employer_name_matcher import match_names
+
+
+def name_partitions(canonical, partitions):
+    """Returns the partition of each canonical last name.
+
+    The partition is a hash of the name, the same in every process, so both
+    sides of the match put a last name in the same partition.
+    """
+    canonical = canonical.astype("category")
+    hashes = pd.util.hash_array(np.asarray(canonical.cat.categories, dtype=object))
+    codes = canonical.cat.codes.to_numpy()
+    return np.where(codes >= 0, hashes[codes] % partitions, -1)
+
+
+def partition_file(filename, cycle, work_dir, target_last_names, partitions, batch_size = 1000000):
+    """Splits one Parquet file of bulk contributions into last name partitions.
+
+    Only contributions whose canonical last name is one of the target last
+    names are kept, since the matcher requires an exact last name match.
+    Rows are written to `<work_dir>/contributions/part=<partition>/`, one file
+    per batch, keeping the column types of the bulk file.
+
+    Returns:
+        int: The number of rows kept.
+    """
+    pa = require_pyarrow()
+    import pyarrow.parquet as pq
+
+    kept = 0
+    # Bulk files of a cycle can have the same name in different directories
+    name = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:16]
+    for i, batch in enumerate(pq.ParquetFile(filename).iter_batches(batch_size=batch_size)):
+        table = pa.Table.from_batches([batch])
+        table = table.rename_columns([bulk_fields.get(column, column) for column in table.column_names])
+        last_names = table["contributor_name"].to_pandas().str.partition(",")[0].str.strip()
+        canonical = utils.canonize_name(last_names, cache=False)
+        keep = (canonical.isin(target_last_names) & canonical.notna()).to_numpy()
+        if not keep.any():
+            continue
+
+        table = table.filter(pa.array(keep))
+        last_names = last_names[keep]
+        rest = table["contributor_name"].to_pandas().str.partition(",")[2].str.split()
+        part = name_partitions(canonical[keep], partitions)
+        table = table.append_column("two_year_transaction_period", pa.array(np.full(len(part), cycle, dtype="int64")))
+        table = table.append_column("contributor_last_name", pa.array(last_names, type=pa.string(), from_pandas=True))
+        table = table.append_column("contributor_first_name", pa.array(rest.str[0], type=pa.string(), from_pandas=True))
+        table = table.append_column("contributor_middle_name", pa.array(rest.str[1], type=pa.string(), from_pandas=True))
+
+        for partition in np.unique(part):
+            directory = os.path.join(work_dir, "contributions", f"part={partition}")
+            os.makedirs(directory, exist_ok=True)
+            pq.write_table(
+                table.filter(pa.array(part == partition)),
+                os.path.join(directory, f"{cycle}-{name}-{os.getpid()}-{i}.parquet"),
+            )
+        kept += len(part)
+    return kept
+
+
+def write_parquet(df, filename):
+    """Writes a partition of the results with types that are the same in all partitions.
+
+    Categorical columns are written as plain values, columns without values
+    as strings and the pandas metadata is dropped, so the partitions can be
+    read as one dataset.
+    """
+    pa = require_pyarrow()
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+        elif pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+    # The pandas metadata would restore the types of this partition
+    table = table.replace_schema_metadata(None)
+    tmp_filename = f"{filename}.tmp"
+    pq.write_table(table, tmp_filename)
+    os.replace(tmp_filename, filename)
+
+
+def match_partition(
+    partition,
+    work_dir,
+    output,
+    first_name_column,
+    middle_name_column,
+    last_name_column,
+    exact_match_employers,
+    partial_match_employers,
+    first_name_fuzzy_ratio,
+):
+    """Matches the contributions of one partition to the targets of the same partition.
+
+    The matched and unmatched rows are written to
+    `<output>/matched/part-<partition>.parquet` and
+    `<output>/unmatched/part-<partition>.parquet`.
+
+    Returns:
+        tuple: The number of matched and unmatched rows.
+    """
+    directory = os.path.join(work_dir, "contributions", f"part={partition}")
+    if not os.path.isdir(directory):
+        return 0, 0
+    # Arrow types keep integer columns with missing values as integers, so
+    # all partitions have the same column types.
+    df = pd.read_parquet(directory, dtype_backend="pyarrow")
+    target_data = pd.read_parquet(os.path.join(work_dir, "targets", f"part={partition}.parquet"))
+
+    if len(exact_match_employers) > 0 or len(partial_match_employers) > 0:
+        match, matched_employer = utils.match_employers(
+            df["contributor_employer"], exact_match_employers, partial_match_employers
+        )
+        df = df.assign(matched_employer=matched_employer)[match]
+
+    match_df, merged = match_names(
+        df, target_data, first_name_column, middle_name_column, last_name_column, first_name_fuzzy_ratio
+    )
+    write_parquet(match_df, os.path.join(output, "matched", f"part-{partition}.parquet"))
+    write_parquet(merged, os.path.join(output, "unmatched", f"part-{partition}.parquet"))
+    return len(match_df), len(merged)
+
+
+def match_bulk(
+    target_donors_dataset,
+    path = "bulk_parquet/contributions",
+    output = "bulk_matches",
+    first_name_column = "first_name",
+    middle_name_column = "middle_name",
+    last_name_column = "last_name",
+    exact_match_employers = [],
+    partial_match_employers = [],
+    first_name_fuzzy_ratio = 0.7,
+    cycles = None,
+    partitions = 64,
+    workers = 4,
+    keep_partitions = False,
+):
+    ''' Match target donors against the bulk individual contributions files.
+
+    Uses the same exact, nickname and fuzzy first name matching as
+    `FEC_match_name_and_employer`, for donor lists too large to match
+    against API downloads and bulk data too large for one merge.
+
+    Both the contributions and the targets are split into partitions by a
+    hash of the canonical last name, so the contributions of a target are in
+    the partition of the target. Each partition is then matched in a worker
+    process, and the matched and unmatched rows are written to disk as each
+    partition completes. The memory used by a worker is that of one
+    partition; use more partitions to use less memory.
+
+    Parameters:
+    -----------
+    target_donors_dataset: str or pandas.DataFrame
+        Dataset containing the names to match, a DataFrame or a .dta, .csv
+        or .parquet file
+    path: str
+        Parquet dataset written by `bulk_ingest.ingest_bulk`
+    output: str
+        Output directory. Matched rows are written to `<output>/matched/` and
+        unmatched rows to `<output>/unmatched/`, one Parquet file per partition.
+    first_name_column, middle_name_column, last_name_column: str
+        Columns in the target donors dataset containing the names
+    exact_match_employers: list of str
+        If given, only contributions with one of these employers are matched.
+    partial_match_employers: list of str
+        If given, only contributions with an employer containing one of
+        these strings are matched.
+    first_name_fuzzy_ratio: float
+        Fuzzy matching ratio for the first name.
+    cycles: list of int
+        Cycles to match. By default all cycles in the dataset.
+    partitions: int
+        Number of last name partitions.
+    workers: int
+        Number of worker processes.
+    keep_partitions: bool
+        Keep the partitioned inputs in `<output>/partitions` after matching.
+
+    Returns:
+    --------
+    tuple: The number of matched and unmatched rows.
+    '''
+    require_pyarrow()
+    if isinstance(target_donors_dataset, pd.DataFrame):
+        target_data = target_donors_dataset
+    elif target_donors_dataset.endswith(".dta"):
+        target_data = pd.read_stata(target_donors_dataset)
+    elif target_donors_dataset.endswith(".csv"):
+        target_data = pd.read_csv(target_donors_dataset)
+    elif target_donors_dataset.endswith(".parquet"):
+        target_data = pd.read_parquet(target_donors_dataset)
+    else:
+        raise ValueError(f"Unknown target dataset format: {target_donors_dataset}")
+    target_data = target_data[~target_data[last_name_column].isna()]
+    target_data = target_data[~target_data[first_name_column].isna()]
+
+    work_dir = os.path.join(output, "partitions")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    for directory in ["targets", "contributions"]:
+        os.makedirs(os.path.join(work_dir, directory))
+    for directory in ["matched", "unmatched"]:
+        shutil.rmtree(os.path.join(output, directory), ignore_errors=True)
+        os.makedirs(os.path.join(output, directory))
+
+    # Split the targets by last name
+    metrics.begin_stage("partition")
+    canonical = utils.canonize_name(target_data[last_name_column])
+    target_part = name_partitions(canonical, partitions)
+    for partition in np.unique(target_part):
+        target_data[target_part == partition].to_parquet(
+            os.path.join(work_dir, "targets", f"part={partition}.parquet"), index=False
+        )
+    target_last_names = set(canonical.dropna().unique())
+
+    # Split the contributions by last name, one bulk file per task
+    files = []
+    for directory in sorted(glob.glob(os.path.join(path, "cycle=*"))):
+        cycle = int(os.path.basename(directory).split("=", 1)[1])
+        if cycles is None or cycle in cycles:
+            files += [(f, cycle) for f in sorted(glob.glob(os.path.join(directory, "**", "*.parquet"), recursive=True))]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(partition_file, filename, cycle, work_dir, target_last_names, partitions)
+            for filename, cycle in files
+        ]
+        kept = sum(future.result() for future in futures)
+    print(f"{kept} contributions with target last names")
+    metrics.end_stage("partition")
+
+    # Match each partition
+    metrics.begin_stage("match")
+    matched = unmatched = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                match_partition, partition, work_dir, output,
+                first_name_column, middle_name_column, last_name_column,
+                exact_match_employers, partial_match_employers, first_name_fuzzy_ratio,
+            )
+            for partition in np.unique(target_part)
+        ]
+        for future in futures:
+            partition_matched, partition_unmatched = future.result()
+            matched += partition_matched
+            unmatched += partition_unmatched
+    metrics.end_stage("match")
+
+    if not keep_partitions:
+        shutil.rmtree(work_dir)
+    return matched, unmatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match target donors against the bulk individual contributions files.")
+    parser.add_argument("targets", help="target donors dataset, a .dta, .csv or .parquet file")
+    parser.add_argument("-i", "--input", metavar="", default="bulk_parquet/contributions", help="bulk Parquet dataset, default: bulk_parquet/contributions")
+    parser.add_argument("-o", "--output", metavar="", default="bulk_matches", help="output directory, default: bulk_matches")
+    parser.add_argument("-p", "--partitions", metavar="", default=64, type=int, help="number of last name partitions, default: 64")
+    parser.add_argument("-w", "--workers", metavar="", default=4, type=int, help="number of worker processes, default: 4")
+    parser.add_argument("-E", "--employer", metavar="", action="append", default=[], help="only match employers containing this string, can be repeated")
+    args = parser.parse_args()
+
+    matched, unmatched = match_bulk(
+        args.targets, args.input, args.output,
+        partial_match_employers=args.employer,
+        partitions=args.partitions, workers=args.workers,
+    )
+    print(f"{matched} matched and {unmatched} unmatched rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import glob
+import numpy as np
+
+from .sinks import require_pyarrow
+from .bulk_ingest import bulk_files, iter_bulk_batches
+
+committee_table_filename = os.path.join("bulk_parquet", "committees.arrow")
+
+# Columns of the committee master files and the names of the same fields in
+# the `committee` object of the API records
+committee_fields = {
+    "CMTE_ID": "committee_id",
+    "CMTE_NM": "name",
+    "TRES_NM": "treasurer_name",
+    "CMTE_ST1": "street_1",
+    "CMTE_ST2": "street_2",
+    "CMTE_CITY": "city",
+    "CMTE_ST": "state",
+    "CMTE_ZIP": "zip",
+    "CMTE_DSGN": "designation",
+    "CMTE_TP": "committee_type",
+    "CMTE_PTY_AFFILIATION": "party",
+    "CMTE_FILING_FREQ": "filing_frequency",
+    "ORG_TP": "organization_type",
+    "CONNECTED_ORG_NM": "connected_organization_name",
+    "CAND_ID": "candidate_id",
+}
+
+# Cycles are years, so committee and cycle fit in one sortable integer key
+cycle_base = 10000
+
+
+def build_committee_table(years = None, bulk_dir = "bulk_data", output = committee_table_filename):
+    """Builds the committee dimension table from the bulk committee master files.
+
+    The committees of each cycle are read from the archives downloaded by
+    `bulk_download.download_committees`, sorted by committee id and cycle and
+    written as an uncompressed Arrow IPC file, which `CommitteeTable` memory
+    maps instead of reading. Repeated values such as the state, party and
+    committee type are dictionary encoded.
+
+    Args:
+        years (list): cycles to include. By default all downloaded archives (default: None)
+        bulk_dir (str): directory of the downloaded archives (default: "bulk_data")
+        output (str): the table file (default: "bulk_parquet/committees.arrow")
+
+    Returns:
+        int: The number of rows written.
+    """
+    pa = require_pyarrow()
+
+    filename = bulk_files["committees"]["filename"]
+    if years is None:
+        pattern = os.path.join(bulk_dir, filename.format(year="*"))
+        prefix, suffix = filename.split("{year}")
+        years = sorted(int(os.path.basename(f)[len(prefix):-len(suffix)]) for f in glob.glob(pattern))
+
+    tables = []
+    for year in years:
+        for table in iter_bulk_batches(os.path.join(bulk_dir, filename.format(year=year)), "committees"):
+            table = table.rename_columns([committee_fields[column] for column in table.column_names])
+            tables.append(table.append_column("cycle", pa.array(np.full(table.num_rows, year, dtype="int32"))))
+    if len(tables) == 0:
+        raise ValueError(f"No committee files found in {bulk_dir}")
+
+    # The IPC file format requires a single dictionary per column
+    table = pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+    table = table.filter(table["committee_id"].is_valid())
+    table = table.sort_by([("committee_id", "ascending"), ("cycle", "ascending")])
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_filename = f"{output}.tmp"
+    with pa.OSFile(tmp_filename, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_filename, output)
+    return table.num_rows
+
+
+class CommitteeTable:
+    """Committee dimension table, indexed by committee id and cycle.
+
+    The table file written by `build_committee_table` is memory mapped, so
+    opening it is fast and its pages are shared by all processes using it.
+    Lookups are vectorized: the committee ids are matched to the table with
+    one hash lookup and the cycles with a binary search.
+
+    Contributions can therefore keep only `committee_id` and get the
+    committee fields when needed, with `enrich`.
+
+    Args:
+        path (str): the table file (default: "bulk_parquet/committees.arrow")
+    """
+    def __init__(self, path = committee_table_filename):
+        pa = require_pyarrow()
+        import pyarrow.compute as pc
+        self.path = path
+        self.table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+        # The table is sorted by committee id, so the unique ids are sorted
+        # and the keys below increase.
+        committee_ids = self.table["committee_id"]
+        self.committee_ids = pc.unique(committee_ids)
+        codes = pc.index_in(committee_ids, value_set=self.committee_ids).to_numpy().astype("int64")
+        cycles = self.table["cycle"].to_numpy().astype("int64")
+        self.keys = codes * cycle_base + cycles
+
+    def rows(self, committee_ids, cycles = None):
+        """Returns the row of each committee in the given cycles, or -1 if not found.
+
+        Without cycles, the row of the latest cycle of each committee is returned.
+
+        Args:
+            committee_ids (array-like): committee ids
+            cycles (array-like): two-year periods (default: None)
+
+        Returns:
+            numpy.ndarray: Row numbers in the table.
+        """
+        pa = require_pyarrow()
+        import pyarrow.compute as pc
+        ids = pa.array(np.asarray(committee_ids, dtype=object), type=pa.string(), from_pandas=True)
+        codes = pc.fill_null(pc.index_in(ids, value_set=self.committee_ids), -1).to_numpy().astype("int64")
+
+        if cycles is None:
+            # The last row of the committee
+            keys = codes * cycle_base + cycle_base - 1
+            rows = np.searchsorted(self.keys, keys, side="right") - 1
+            found = rows >= 0
+            found[found] = self.keys[rows[found]] // cycle_base == codes[found]
+        else:
+            cycles = np.asarray(cycles, dtype="float64")
+            valid = ~np.isnan(cycles)
+            keys = codes * cycle_base + np.where(valid, cycles, 0).astype("int64")
+            rows = np.searchsorted(self.keys, keys)
+            found = valid & (rows < len(self.keys))
+            found[found] = self.keys[rows[found]] == keys[found]
+        return np.where(found & (codes >= 0), rows, -1)
+
+    def lookup(self, committee_ids, cycles = None, columns = None):
+        """Returns the committee fields for each id and cycle as an Arrow table.
+
+        Rows of committees not in the table are null.
+        """
+        pa = require_pyarrow()
+        rows = self.rows(committee_ids, cycles)
+        if columns is None:
+            columns = [column for column in self.table.column_names if column not in ("committee_id", "cycle")]
+        return self.table.select(columns).take(pa.array(rows, mask=rows < 0))
+
+    def enrich(self, df, columns = None, id_column = "committee_id", cycle_column = "two_year_transaction_period", prefix = "committee."):
+        """Adds committee fields to a DataFrame of contributions.
+
+        The fields are named as the flattened fields of the API records,
+        "committee.<field>", so enriched data has the same columns as data
+        downloaded with the nested committee.
+
+        Args:
+            df (pandas.DataFrame): contributions
+            columns (list): committee fields to add. By default all (default: None)
+            id_column (str): column of the committee id (default: "committee_id")
+            cycle_column (str): column of the two-year period. If None or not
+                in `df`, the latest cycle of each committee is used
+                (default: "two_year_transaction_period")
+            prefix (str): prefix of the added columns (default: "committee.")
+
+        Returns:
+            pandas.DataFrame: A copy of `df` with the committee fields.
+        """
+        import pandas as pd
+        cycles = None
+        if cycle_column is not None and cycle_column in df.columns:
+            cycles = pd.to_numeric(df[cycle_column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        fields = self.lookup(df[id_column], cycles, columns).to_pandas()
+        fields.index = df.index
+        return df.assign(**{f"{prefix}{column}": fields[column] for column in fields.columns})
@@ -6,12 +6,19 @@
 import os
 import pandas as pd
 import argparse
-from pathlib import Path
-import glob
-from nicknames import NickNamer
+from concurrent.futures import ThreadPoolExecutor
 
-from . import fec_scheduleA_year_range
+import hashlib
+from pandas import json_normalize
+
+from . import fec_scheduleA_year_range, download_scheduleA_year_range
+from . import scheduleA_parameters, plan_name_batches, split_by_name
 from . import utils
+from . import name_groups
+from .store import ContributionStore
+from .job_queue import JobQueue
+from .metrics import metrics
+from .stage_cache import StageCache, file_fingerprint, cache_dir as stage_cache_dir
 
 def FEC_match_name_and_employer(
     target_donors_dataset = None,
@@ -24,6 +31,10 @@ def FEC_match_name_and_employer(
     partial_match_employers = ["Google", "Microsoft", "MSFT"],
     first_name_fuzzy_ratio = 0.7,
     api_key = "DEMO_KEY",
+    download_workers = 1,
+    store = None,
+    job_queue = "jobs.sqlite",
+    stage_cache = stage_cache_dir,
 ):
     ''' Download individual contributions data from the FEC API and match by employer, 
     first name and middle name initial.
@@ -58,8 +69,22 @@ def FEC_match_name_and_employer(
         Fuzzy matching ratio for the first name.
     api_key: str
         FEC API key
+    download_workers: int
+        Number of downloads to run at the same time. The downloads share the
+        API rate limit.
+    store: str or ContributionStore
+        Local contributions store, or the path of one. When given, the data is
+        read from the store and only queries the store does not cover are sent
+        to the API. The downloaded data is added to the store.
+    job_queue: str
+        Database of the download job queue. Processes using the same queue,
+        also on different hosts, share the downloads. Run
+        `python -m FECdownload.job_queue status` to see the progress.
+    stage_cache: str or StageCache
+        Cache of the results of each step, or its directory. A step is only
+        recomputed when its inputs or parameters change. None disables the
+        cache.
     '''
-    nicknamer = NickNamer()
     if target_donors_dataset is None:
         raise ValueError("target_donors_dataset must be provided")
 
@@ -70,174 +95,291 @@ def FEC_match_name_and_employer(
     elif target_donors_dataset.endswith(".csv"):
         target_data = pd.read_csv(target_donors_dataset)
     target_data = target_data[~target_data[last_name_column].isna()]
+    # Donors without a first name are matched in step 3, but not used to
+    # select the downloads
+    target_donors = target_data
     target_data = target_data[~target_data[first_name_column].isna()]
 
+    if not isinstance(stage_cache, StageCache):
+        stage_cache = StageCache(stage_cache)
+
     if api_key == "DEMO_KEY":
         print("Warning: Using DEMO_KEY. This API key is rate-limited and should not be used for production. Get a personal key at https://api.data.gov/signup.")
 
-    # step 1: Download by employer, filtering by last name for data after 2018
-    employer_path = "by_employer/downloaded"
-    for employer in api_filter_by_employers:
-        filename = f"{employer_path}_{employer}.csv"
-        if not os.path.exists(filename):
-            # touch the file to reserve, in case there is another process downloading
-            Path(filename).touch()
-            try:
-                df = fec_scheduleA_year_range(1979, 2017, key=api_key, employer=employer)
-                df.to_csv(filename)
-            except:
-                # in case of an issue, remove the reservation file
-                os.remove(filename)
-                raise
-            
-    # From 2019, filter by last name as well
-    employer_name_path = "by_name_and_employer/downloaded"
-    for employer in api_filter_by_employers:
-        target_names = target_data[target_data[employer_column].str.contains(employer)]
-        names = target_names[last_name_column].unique()
-
-        for n, name in enumerate(names):
-            filename = f"{employer_name_path}_{employer}_{name}.csv"
-            if not os.path.exists(filename):
-                print(f"{employer}, {name}, {n} / {len(names)}")
-                # touch the file to reserve, in case there is another process downloading
-                Path(filename).touch()
-                try:
-                    df = fec_scheduleA_year_range(2019, 2024, key=api_key, employer=employer, name=name)
-                    df.to_csv(filename)
-                except:
-                    # in case of an issue, remove the reservation file
-                    os.remove(filename)
-                    raise
-
-
-    if os.path.exists("downloaded.csv"):
-        df = pd.read_csv("downloaded.csv")
+    metrics.begin_stage("download")
+    if store is not None:
+        if not isinstance(store, ContributionStore):
+            store = ContributionStore(store)
+        df = download_to_store(
+            store, target_data, api_filter_by_employers, employer_column,
+            last_name_column, api_key, download_workers
+        )
+        key = stage_cache.key("downloaded", data=df)
     else:
-        files = glob.glob(f'{employer_path}*.csv')+glob.glob(f'{employer_name_path}*.csv')
-        dfs = []
-        for f in files:
-            dfs.append(pd.read_csv(f))
-        df = pd.concat(dfs)
-        df.to_csv(f"downloaded.csv")
-
+        # step 1: Download by employer, filtering by last name for data after 2018.
+        # The downloads are jobs in a queue shared with other processes.
+        employer_path = "by_employer/downloaded"
+        employer_name_path = "by_name_and_employer/downloaded"
+        queue = JobQueue(job_queue)
+        for employer in api_filter_by_employers:
+            filename = f"{employer_path}_{employer}.csv"
+            queue.add(
+                f"employer:{employer}",
+                {"filename": filename, "start": 1979, "end": 2017, "employer": employer},
+                done=os.path.exists(filename) and os.path.getsize(filename) > 0
+            )
+
+        # From 2019, filter by last name as well. Names are queried in
+        # batches and the results are split into a file per name.
+        for employer in api_filter_by_employers:
+            target_names = target_data[target_data[employer_column].str.contains(employer)]
+            filenames = {}
+            for name in target_names[last_name_column].unique():
+                filename = f"{employer_name_path}_{employer}_{name}.csv"
+                if not (os.path.exists(filename) and os.path.getsize(filename) > 0):
+                    filenames[name] = filename
+            if len(filenames) == 0:
+                continue
+            parameter_list = scheduleA_parameters(2019, 2024, api_key, employer)
+            for batch in plan_name_batches(parameter_list, list(filenames)):
+                digest = hashlib.sha1("|".join(batch).encode("utf-8")).hexdigest()[:16]
+                queue.add(
+                    f"names:{employer}:{digest}",
+                    {"filenames": {name: filenames[name] for name in batch}, "start": 2019, "end": 2024, "employer": employer},
+                )
+
+        def write_csv(df, filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            df.to_csv(f"{filename}.tmp")
+            os.replace(f"{filename}.tmp", filename)
+
+        def download_job(start, end, employer, filename = None, name = None, filenames = None):
+            if filenames is None:
+                write_csv(fec_scheduleA_year_range(start, end, key=api_key, employer=employer, name=name), filename)
+                return
+            items = download_scheduleA_year_range(start, end, api_key, employer, list(filenames))
+            for name, name_items in split_by_name(items, list(filenames)).items():
+                write_csv(pd.DataFrame(json_normalize(name_items)), filenames[name])
+
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            futures = [executor.submit(queue.run, download_job) for _ in range(download_workers)]
+            for future in futures:
+                future.result()
+        failed = queue.failed()
+        if len(failed) > 0:
+            raise RuntimeError(f"{len(failed)} download jobs failed, first: {failed[0][0]}: {failed[0][1]}")
+
+
+        # Only the files of this run, not those of earlier runs with other targets
+        files = [f"{employer_path}_{employer}.csv" for employer in api_filter_by_employers]
+        for employer in api_filter_by_employers:
+            target_names = target_data[target_data[employer_column].str.contains(employer)]
+            files += [f"{employer_name_path}_{employer}_{name}.csv" for name in target_names[last_name_column].unique()]
+
+        df, key = stage_cache.cached(
+            "downloaded",
+            lambda: pd.concat([pd.read_csv(f) for f in files]),
+            files=[file_fingerprint(f) for f in files],
+        )
+    metrics.end_stage("download")
 
     # step 2: Filter by employer, should be exact match to "EY" or contain any of the other names.
-    if os.path.exists("filtered_by_employer.csv"):
-        df = pd.read_csv("filtered_by_employer.csv")
-    else:
-        match = df["contributor_employer"].str == exact_match_employers[0]
-        for employer in exact_match_employers[1:]:
-            match = match | df["contributor_employer"].str == employer
-        for employer in partial_match_employers:
-            match = match | df["contributor_employer"].str.contains(employer)
-        df = df[match]
-
-        df.to_csv("filtered_by_employer.csv", index=False)
+    metrics.begin_stage("filter_employer")
+    def filter_by_employer():
+        match, matched_employer = utils.match_employers(
+            df["contributor_employer"], exact_match_employers, partial_match_employers
+        )
+        return df.assign(matched_employer=matched_employer)[match]
 
+    df, key = stage_cache.cached(
+        "filtered_by_employer",
+        filter_by_employer,
+        downloaded=key,
+        exact_match_employers=exact_match_employers,
+        partial_match_employers=partial_match_employers,
+    )
+    metrics.end_stage("filter_employer")
 
     # step 3: Filter and match to auditor names
+    metrics.begin_stage("match")
+    key = stage_cache.key(
+        "match",
+        filtered_by_employer=key,
+        target_data=target_donors,
+        first_name_fuzzy_ratio=first_name_fuzzy_ratio,
+        canonize_version=utils.canonize_version,
+        nickname_index=name_groups.index_filename,
+    )
+    match_df = stage_cache.get("matched", key)
+    merged = stage_cache.get("unmatched", key)
+    if match_df is None or merged is None:
+        match_df, merged = match_names(
+            df, target_donors, first_name_column, middle_name_column, last_name_column, first_name_fuzzy_ratio
+        )
+        stage_cache.put("matched", key, match_df)
+        stage_cache.put("unmatched", key, merged)
+
+    match_df.to_csv("matched_names.csv", index=False)
+    merged.to_csv("unmatched.csv", index=False)
+    metrics.end_stage("match")
+
+
+def match_names(
+    df,
+    target_data,
+    first_name_column,
+    middle_name_column,
+    last_name_column,
+    first_name_fuzzy_ratio,
+):
+    ''' Step 3 of the matcher: matches contributions to the target donors.
+
+    Requires an exact match to the canonical last name, then matches the
+    first name exactly, as a nickname, or by fuzzy matching, in that order.
+
+    Returns the matched contributions, with the columns of the target
+    dataset, and the contributions that were not matched.
+    '''
     df = df[~df["contributor_last_name"].isna()]
     df = df[~df["contributor_first_name"].isna()]
     df["canonical_last_name"] = utils.canonize_name(df["contributor_last_name"])
     df["canonical_first_name"] = utils.canonize_name(df["contributor_first_name"])
     df["canonical_middle_name"] = utils.canonize_name(df["contributor_middle_name"])
 
-    target_data = pd.read_stata(target_donors_dataset)
-    target_data = target_data[~target_data[last_name_column].isna()]
+    target_data = target_data.copy()
     target_data["canonical_last_name"] = utils.canonize_name(target_data[last_name_column])
     target_data["canonical_first_name"] = utils.canonize_name(target_data[first_name_column])
     target_data["canonical_middle_name"] = utils.canonize_name(target_data[middle_name_column])
+    for column in ["canonical_last_name", "canonical_first_name", "canonical_middle_name"]:
+        df[column], target_data[column] = utils.align_categories(df[column], target_data[column])
 
     df.drop_duplicates(inplace=True)
 
+    # Match by first name and middle name initial. When there are multipl
+    # matches, require a full match to the middle name.
+    # When the middle name is omitted, match if there is only one target,
+    # or if one of the targets does not have a middle name.
+    ln_col = 'canonical_last_name'
+    id_col = 'original_index'
+    fnx_col = 'canonical_first_name_x'
+    mnx_col = 'canonical_middle_name_x'
+    fny_col = 'canonical_first_name_y'
+    mny_col = 'canonical_middle_name_y'
+
+    df = df.reset_index().rename(columns={'index': id_col})
+
+    merged = pd.merge(df, target_data, on=ln_col)
+    print("df", df.shape)
+    print("remaining", merged.shape)
+
+    matches_mask = (
+        (merged[fnx_col] == merged[fny_col]) &
+        ((merged[mnx_col].str[0] == merged[mny_col].str[0]) |
+         (merged[mnx_col] == ""))
+    )
+    matched = merged[matches_mask]
+
+    # If there are multiple possible matches to a transaction, require a
+    # full match to the middle name.
+    duplicated = matched[matched.duplicated(subset=[id_col, fnx_col, ln_col], keep=False)]
+    duplicated = duplicated[~(duplicated[mnx_col] == duplicated[mny_col])]
+    matches_mask[duplicated.index] = False
+
+    match_df = merged[matches_mask]
+    merged = merged[~merged[id_col].isin(match_df[id_col].unique())]
+
+
+    # Now match first names that are nicknames or canonicals of the first
+    # name in the target dataset, joining on the nickname groups
+    pairs = name_groups.nickname_pairs(merged[fnx_col], merged[fny_col])
+    pairs = pairs.rename(columns={'name_x': fnx_col, 'name_y': fny_col})
+    candidates = merged.reset_index().merge(pairs, on=[fnx_col, fny_col])
+    matches_mask = (
+        (candidates[mnx_col].str[0] == candidates[mny_col].str[0]) |
+        (candidates[mnx_col] == "")
+    )
+    matched = candidates[matches_mask]
+    duplicated = matched[matched.duplicated(subset=[id_col, fnx_col, ln_col], keep=False)]
+    duplicated = duplicated[~(duplicated[mnx_col] == duplicated[mny_col])]
+    matches_mask[duplicated.index] = False
+
+    nickname_match_df = candidates[matches_mask]
+    match_df = pd.concat([match_df, nickname_match_df])
+
+    merged = merged[~merged[id_col].isin(match_df[id_col].unique())]
+
+
+    # Finally try fuzzy matching to first name
+    middle_name_matches = merged[
+        merged[mnx_col].str[0] == merged[mny_col].str[0]
+    ].reset_index()
+    matches_mask = pd.Series(utils.fuzzy_match_many(
+        middle_name_matches[fnx_col],
+        middle_name_matches[fny_col],
+        threshold=first_name_fuzzy_ratio,
+    ), index=middle_name_matches.index)
+    matched = middle_name_matches[matches_mask]
+    duplicated = matched[matched.duplicated(subset=[id_col, fnx_col, ln_col], keep=False)]
+    duplicated = duplicated[~(duplicated[mnx_col] == duplicated[mny_col])]
+    matches_mask[duplicated.index] = False
+
+    fuzzy_matched = middle_name_matches[matches_mask]
+    match_df = pd.concat([match_df, fuzzy_matched])
+    merged = merged[~merged[id_col].isin(match_df[id_col].unique())]
+
+
+
+    match_df.drop(columns=[ln_col, id_col, fnx_col, mnx_col, fny_col, mny_col], inplace=True)
+    return match_df, merged
+
+
+def download_to_store(
+    store,
+    target_data,
+    api_filter_by_employers,
+    employer_column,
+    last_name_column,
+    api_key,
+    download_workers = 1,
+):
+    ''' Step 1 of the matcher using a local contributions store.
 
-    # Here we filter match by last name
-    if os.path.exists("matched_first_name.csv"):
-        df = pd.read_csv("matched_first_name.csv")
-    else:
-        # Match by first name and middle name initial. When there are multipl
-        # matches, require a full match to the middle name.
-        # When the middle name is omitted, match if there is only one target,
-        # or if one of the targets does not have a middle name.
-        ln_col = 'canonical_last_name'
-        id_col = 'original_index'
-        fnx_col = 'canonical_first_name_x'
-        mnx_col = 'canonical_middle_name_x'
-        fny_col = 'canonical_first_name_y'
-        mny_col = 'canonical_middle_name_y'
-
-        df = df.reset_index().rename(columns={'index': id_col})
-
-        merged = pd.merge(df, target_data, on=ln_col)
-        print("df", df.shape)
-        print("remaining", merged.shape)
-
-        matches_mask = (
-            (merged[fnx_col] == merged[fny_col]) &
-            ((merged[mnx_col].str[0] == merged[mny_col].str[0]) |
-             (merged[mnx_col] == ""))
-        )
-        matched = merged[matches_mask]
-
-        # If there are multiple possible matches to a transaction, require a
-        # full match to the middle name.
-        duplicated = matched[matched.duplicated(subset=[id_col, fnx_col, ln_col], keep=False)]
-        duplicated = duplicated[~(duplicated[mnx_col] == duplicated[mny_col])]
-        matches_mask[duplicated.index] = False
-
-        match_df = merged[matches_mask]
-        merged = merged[~merged[id_col].isin(match_df[id_col].unique())]
-
-
-        # Now add nicknames and canonicals of each first name in the target dataset
-        merged['nickname'] = merged[fny_col].apply(
-            lambda name: list(nicknamer.nicknames_of(name)) + list(nicknamer.canonicals_of(name)))
-        exploded = merged.explode('nickname').reset_index()
-        matches_mask = (
-            (exploded['nickname'] == exploded[fnx_col]) &
-            ((exploded[mnx_col].str[0] == exploded[mny_col].str[0]) |
-             (exploded[mnx_col] == ""))
-        )
-        matched = exploded[matches_mask]
-        duplicated = matched[matched.duplicated(subset=[id_col, fnx_col, ln_col], keep=False)]
-        duplicated = duplicated[~(duplicated[mnx_col] == duplicated[mny_col])]
-        matches_mask[duplicated.index] = False
-
-        nickname_match_df = exploded[matches_mask].drop(columns='nickname')
-        match_df = pd.concat([match_df, nickname_match_df])
-
-        merged = merged[~merged[id_col].isin(match_df[id_col].unique())]
-
-
-        # Finally try fuzzy matching to first name
-        middle_name_matches = merged[
-            merged[mnx_col].str[0] == merged[mny_col].str[0]
-        ].reset_index()
-        matches_mask = middle_name_matches.apply(
-            lambda row: utils.fuzzy_match(row[fnx_col], row[fny_col], threshold=first_name_fuzzy_ratio),
-            axis=1
-        )
-        matched = middle_name_matches[matches_mask]
-        duplicated = matched[matched.duplicated(subset=[id_col, fnx_col, ln_col], keep=False)]
-        duplicated = duplicated[~(duplicated[mnx_col] == duplicated[mny_col])]
-        matches_mask[duplicated.index] = False
+    Downloads only the (employer, cycle) and (employer, last name, cycle)
+    queries the store does not cover, then reads the contributions of the
+    target last names from the store.
+    '''
+    for employer in api_filter_by_employers:
+        store.download(1979, 2017, api_key, employer=employer)
 
-        fuzzy_matched = middle_name_matches[matches_mask]
-        match_df = pd.concat([match_df, fuzzy_matched])
-        merged = merged[~merged[id_col].isin(match_df[id_col].unique())]
+    with ThreadPoolExecutor(max_workers=download_workers) as executor:
+        futures = []
+        for employer in api_filter_by_employers:
+            target_names = target_data[target_data[employer_column].str.contains(employer)]
+            for name in target_names[last_name_column].unique():
+                futures.append(executor.submit(store.download, 2019, 2024, api_key, employer, name))
+        for future in futures:
+            future.result()
 
+    return store.query(
+        employers=api_filter_by_employers,
+        last_names=target_data[last_name_column].unique(),
+    )
 
-        match_df.drop(columns=[ln_col, id_col, fnx_col, mnx_col, fny_col, mny_col], inplace=True)
-        match_df.to_csv("matched_names.csv", index=False)
-        merged.to_csv("unmatched.csv", index=False)
 
 def main():
     parser = argparse.ArgumentParser(description="Match FEC individual contributor data from the API with first, middle and last names.")
     parser.add_argument("-k", "--api_key", metavar="", default="DEMO_KEY", help="your FEC API key, default: DEMO_KEY")
+    parser.add_argument("-w", "--workers", metavar="", default=1, type=int, help="number of downloads to run at the same time, default: 1")
+    parser.add_argument("--metrics-json", metavar="", default=None, help="write metrics to this JSON file every 15 seconds")
+    parser.add_argument("--metrics-textfile", metavar="", default=None, help="write metrics to this Prometheus textfile every 15 seconds")
     args = parser.parse_args()
-    
-    FEC_match_name_and_employer()
+
+    if args.metrics_json or args.metrics_textfile:
+        metrics.start(args.metrics_json, args.metrics_textfile)
+    try:
+        FEC_match_name_and_employer(api_key=args.api_key, download_workers=args.workers)
+    finally:
+        metrics.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HTTPClient:
+    """HTTP session shared by the API and bulk downloads.
+
+    Connections are kept alive and reused from a pool, so a crawl pays for the
+    TCP and TLS handshakes once per connection instead of once per page.
+    Connection errors and server errors (5xx) are retried with exponential
+    backoff. Rate limit errors (429) are left to the caller.
+
+    Args:
+        pool_size (int): Maximum number of connections kept open per host. Use at
+            least the number of parallel downloads (default: 10).
+        timeout (float or tuple): Connect and read timeouts in seconds
+            (default: (10, 120)).
+        retries (int): Number of retries after connection and server errors
+            (default: 3).
+        backoff_factor (float): Base of the exponential wait between retries in
+            seconds (default: 1).
+        compress (bool): Ask the server for gzip or deflate compressed responses
+            (default: True).
+        cache (ResponseCache): Cache of API responses used by `make_request`,
+            see response_cache.ResponseCache (default: None).
+    """
+    def __init__(self, pool_size=10, timeout=(10, 120), retries=3, backoff_factor=1, compress=True, cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+            # urllib3 retries a 429 with Retry-After on its own. Leave it to
+            # make_request, so the rate limiter sees the header.
+            respect_retry_after_header=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if compress else "identity"
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_received = 0
+        self.request_time = 0
+
+    def get(self, url, params=None, headers=None, stream=False, timeout=None):
+        """Makes a GET request using a pooled connection.
+
+        Returns:
+            requests.Response: The response. With stream=True the body has not
+            been read yet.
+        """
+        request_start = time.time()
+        response = self.session.get(
+            url,
+            params=params,
+            headers=headers,
+            stream=stream,
+            timeout=timeout or self.timeout,
+        )
+        with self.lock:
+            self.request_count += 1
+            self.request_time += time.time() - request_start
+            if not stream:
+                # Bytes read from the socket, before decompression
+                self.bytes_received += response.raw.tell()
+        return response
+
+    def connections_opened(self):
+        """Returns the number of connections opened so far."""
+        count = 0
+        adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                count += pools[key].num_connections
+        return count
+
+    def stats(self):
+        """Returns a summary of the requests made with this client."""
+        return {
+            "requests": self.request_count,
+            "connections": self.connections_opened(),
+            "bytes_received": self.bytes_received,
+            "request_time": self.request_time,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+default_client = None
+client_lock = threading.Lock()
+
+def get_client():
+    """Returns the client shared by the API and bulk downloads."""
+    global default_client
+    with client_lock:
+        if default_client is None:
+            default_client = HTTPClient()
+    return default_client
+
+def set_client(client):
+    """Sets the client shared by the API and bulk downloads."""
+    global default_client
+    with client_lock:
+        default_client = client
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+
+schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    params TEXT,
+    status TEXT,
+    tries INTEGER DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    added REAL,
+    started REAL,
+    finished REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+"""
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def worker_name():
+    """Identifies the worker thread across hosts and processes."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobQueue:
+    """Queue of download jobs shared by worker processes.
+
+    Jobs are stored in an SQLite database. A worker takes a job with a lease
+    and renews the lease with heartbeats while the job runs. If a worker
+    crashes, its lease expires and the job is given to another worker. A job
+    that fails `max_tries` times is marked as failed.
+
+    The database can be on a shared filesystem, so workers on several hosts
+    can share a queue, as long as the filesystem supports file locking. The
+    rollback journal is used instead of WAL for that reason.
+
+    Args:
+        path (str): The database file (default: "jobs.sqlite")
+        lease_time (float): seconds a job is reserved without a heartbeat (default: 600)
+        max_tries (int): attempts before a job is marked as failed (default: 3)
+    """
+    def __init__(self, path = "jobs.sqlite", lease_time = 600, max_tries = 3):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_tries = max_tries
+        self.local = threading.local()
+        self.connection().executescript(schema)
+
+    def connection(self):
+        """Returns the connection of the current thread."""
+        if not hasattr(self.local, "connection"):
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self.local.connection = connection
+        return self.local.connection
+
+    def transaction(self):
+        """Runs a write transaction, holding the database lock from the start."""
+        return _Transaction(self.connection())
+
+    def add(self, key, params, done = False):
+        """Adds a job, unless a job with the same key exists.
+
+        A job added as not done that is already done is returned to the
+        queue, for example when its output has been deleted since it ran.
+        Pending, running and failed jobs are left as they are.
+
+        Args:
+            key (str): unique name of the job
+            params (dict): JSON serializable parameters passed to the job function
+            done (bool): add the job as already done (default: False)
+        """
+        with self.transaction() as connection:
+            if done:
+                connection.execute(
+                    "INSERT OR IGNORE INTO jobs (key, params, status, added) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(params), DONE, time.time())
+                )
+                return
+            connection.execute(
+                """INSERT INTO jobs (key, params, status, added) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET params = excluded.params, status = excluded.status,
+                tries = 0, worker = NULL, lease_expires = NULL, error = NULL
+                WHERE jobs.status = ?""",
+                (key, json.dumps(params), PENDING, time.time(), DONE)
+            )
+
+    def acquire(self, worker = None):
+        """Leases the next pending job, or a job whose lease has expired.
+
+        Returns:
+            tuple: The key and parameters of the job, or None if no job is available.
+        """
+        worker = worker or worker_name()
+        now = time.time()
+        with self.transaction() as connection:
+            # Jobs of crashed workers that have used all their tries
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = 'lease expired' WHERE status = ? AND lease_expires < ? AND tries >= ?",
+                (FAILED, RUNNING, now, self.max_tries)
+            )
+            row = connection.execute(
+                """SELECT key, params FROM jobs
+                WHERE status = ? OR (status = ? AND lease_expires < ?)
+                ORDER BY tries, added LIMIT 1""",
+                (PENDING, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                """UPDATE jobs SET status = ?, worker = ?, lease_expires = ?,
+                tries = tries + 1, started = ? WHERE key = ?""",
+                (RUNNING, worker, now + self.lease_time, now, row[0])
+            )
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, key, worker = None):
+        """Renews the lease of a job.
+
+        Returns:
+            bool: False if the job is no longer leased to the worker.
+        """
+        worker = worker or worker_name()
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE key = ? AND worker = ? AND status = ?",
+                (time.time() + self.lease_time, key, worker, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, key, worker = None):
+        worker = worker or worker_name()
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = NULL WHERE key = ? AND worker = ?",
+                (DONE, time.time(), key, worker)
+            )
+
+    def fail(self, key, error, worker = None):
+        """Returns a job to the queue, or marks it failed after `max_tries` attempts."""
+        worker = worker or worker_name()
+        with self.transaction() as connection:
+            connection.execute(
+                """UPDATE jobs SET status = CASE WHEN tries >= ? THEN ? ELSE ? END,
+                lease_expires = NULL, error = ? WHERE key = ? AND worker = ?""",
+                (self.max_tries, FAILED, PENDING, str(error), key, worker)
+            )
+
+    def reset_failed(self):
+        """Gives failed jobs another `max_tries` attempts."""
+        with self.transaction() as connection:
+            connection.execute("UPDATE jobs SET status = ?, tries = 0 WHERE status = ?", (PENDING, FAILED))
+
+    def run(self, function, poll_time = 10):
+        """Runs jobs until none are pending or running.
+
+        `function` is called with the parameters of each job. Jobs that raise
+        an exception are retried. While workers of other processes hold
+        leases, the worker waits in case their jobs are returned to the queue.
+
+        Args:
+            function (callable): called with the parameters of each job as keyword arguments
+            poll_time (float): seconds to wait between checks for new jobs (default: 10)
+
+        Returns:
+            int: The number of jobs run by this worker.
+        """
+        worker = worker_name()
+        count = 0
+        while True:
+            job = self.acquire(worker)
+            if job is None:
+                if self.counts().get(PENDING, 0) == 0 and self.running_elsewhere() == 0:
+                    # Jobs still running belong to other threads of this
+                    # process, which retry them themselves if they fail
+                    return count
+                time.sleep(poll_time)
+                continue
+
+            key, params = job
+            stop = threading.Event()
+            thread = threading.Thread(target=self.keep_alive, args=(key, worker, stop), daemon=True)
+            thread.start()
+            try:
+                function(**params)
+            except Exception as e:
+                print(f"Job {key} failed: {e!r}")
+                self.fail(key, repr(e), worker)
+            else:
+                self.complete(key, worker)
+                count += 1
+            finally:
+                stop.set()
+                thread.join()
+
+    def keep_alive(self, key, worker, stop):
+        """Sends heartbeats until `stop` is set."""
+        while not stop.wait(self.lease_time / 3):
+            if not self.heartbeat(key, worker):
+                print(f"Lost the lease of job {key}")
+                return
+
+    def running_elsewhere(self):
+        """Returns the number of running jobs leased by other processes."""
+        prefix = f"{socket.gethostname()}:{os.getpid()}:"
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND substr(worker, 1, ?) != ?",
+            (RUNNING, len(prefix), prefix)
+        ).fetchone()[0]
+
+    def counts(self):
+        """Returns the number of jobs in each status."""
+        rows = self.connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return dict(rows.fetchall())
+
+    def failed(self):
+        """Returns the keys and errors of failed jobs."""
+        return self.connection().execute("SELECT key, error FROM jobs WHERE status = ?", (FAILED,)).fetchall()
+
+    def status(self, window = 3600):
+        """Summarizes the progress of the queue.
+
+        Args:
+            window (float): seconds over which throughput is measured (default: 3600)
+
+        Returns:
+            dict: Job counts by status, jobs finished per hour over the
+                window, and the estimated hours to finish the remaining jobs.
+        """
+        now = time.time()
+        counts = self.counts()
+        connection = self.connection()
+        finished, first = connection.execute(
+            "SELECT COUNT(*), MIN(finished) FROM jobs WHERE status = ? AND finished > ?",
+            (DONE, now - window)
+        ).fetchone()
+        workers = connection.execute(
+            "SELECT COUNT(DISTINCT worker) FROM jobs WHERE status = ? AND lease_expires > ?",
+            (RUNNING, now)
+        ).fetchone()[0]
+        remaining = counts.get(PENDING, 0) + counts.get(RUNNING, 0)
+        throughput = 0
+        if finished > 0:
+            throughput = finished / max(now - first, 1) * 3600
+        return {
+            "counts": counts,
+            "remaining": remaining,
+            "active_workers": workers,
+            "jobs_per_hour": throughput,
+            "hours_remaining": remaining / throughput if throughput > 0 else None,
+        }
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the progress of a download job queue.")
+    parser.add_argument("command", choices=["status", "retry"], help="status: show progress, retry: requeue failed jobs")
+    parser.add_argument("-p", "--path", metavar="", default="jobs.sqlite", help="the queue database, default: jobs.sqlite")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.path)
+    if args.command == "retry":
+        queue.reset_failed()
+    status = queue.status()
+    print("jobs: " + ", ".join(f"{count} {name}" for name, count in sorted(status["counts"].items())))
+    print(f"remaining: {status['remaining']}, active workers: {status['active_workers']}")
+    print(f"throughput: {status['jobs_per_hour']:.1f} jobs per hour")
+    if status["hours_remaining"] is not None:
+        print(f"estimated time remaining: {status['hours_remaining']:.1f} hours")
+    for key, error in queue.failed():
+        print(f"failed: {key}: {error}")
+
+
+if __name__ == "__main__":
+    main()
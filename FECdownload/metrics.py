@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows. Peak memory is then not recorded.
+    resource = None
+
+# Upper bounds of the latency histogram buckets, in seconds
+default_buckets = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+descriptions = {
+    "fec_requests_total": "API requests by HTTP status",
+    "fec_request_seconds": "API request latency",
+    "fec_request_retries_total": "API requests retried after an error",
+    "fec_rate_limited_total": "API responses with status 429",
+    "fec_response_bytes_total": "Bytes of API responses",
+    "fec_rate_limiter_wait_seconds_total": "Time spent waiting for the rate limiter",
+    "fec_records_total": "Records received from the API",
+    "fec_records_per_second": "Records per second of the last page",
+    "fec_last_page_timestamp_seconds": "Time the last page was received",
+    "fec_checkpoint_write_seconds": "Time to write a page to the checkpoint",
+    "fec_bulk_bytes_total": "Bytes of bulk files downloaded",
+    "fec_bulk_files_total": "Bulk files checked, by result",
+    "fec_bulk_retries_total": "Interrupted bulk downloads",
+    "fec_bulk_skipped_rows_total": "Malformed rows skipped in bulk files, by kind",
+    "fec_stage_seconds": "Wall time of the last run of a stage",
+    "fec_stage_process_peak_memory_bytes": "Peak memory of the process up to the end of a stage, including earlier stages",
+    "fec_stage_last_completed_timestamp_seconds": "Time a stage last completed",
+    "fec_stage_cache_total": "Stage cache lookups, by stage and result",
+    "fec_response_cache_total": "API response cache lookups and stores, by result",
+}
+
+
+def peak_memory():
+    """Returns the peak resident memory of the process in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class Metrics:
+    """Counters, gauges and histograms of the downloads and the matcher.
+
+    Metrics have a name and optional labels. They can be written to a JSON
+    file and to a Prometheus textfile, for the node exporter's textfile
+    collector, either on demand or periodically from a background thread
+    with `start`. All methods are thread safe.
+    """
+    def __init__(self, buckets = default_buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.stage_starts = {}
+        self.started = time.time()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def inc(self, name, value = 1, **labels):
+        """Adds to a counter."""
+        with self.lock:
+            values = self.counters.setdefault(name, {})
+            key = label_key(labels)
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Sets a gauge."""
+        with self.lock:
+            self.gauges.setdefault(name, {})[label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Adds a value to a histogram."""
+        with self.lock:
+            values = self.histograms.setdefault(name, {})
+            key = label_key(labels)
+            if key not in values:
+                values[key] = Histogram(self.buckets)
+            values[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the duration of a block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def begin_stage(self, stage):
+        """Marks the start of a processing stage."""
+        with self.lock:
+            self.stage_starts[stage] = time.perf_counter()
+
+    def end_stage(self, stage, completed = True):
+        """Records the wall time of a processing stage and the peak memory of the process.
+
+        The peak memory is the high-water mark of the whole process up to the
+        end of the stage, so it includes the memory of earlier stages. It is
+        the memory of the stage itself only for the first stage, or when
+        each stage runs in a separate process.
+
+        Args:
+            stage (str): name of the stage
+            completed (bool): False if the stage raised an exception. The
+                completion time is then not updated (default: True)
+        """
+        with self.lock:
+            start = self.stage_starts.pop(stage)
+        self.set("fec_stage_seconds", time.perf_counter() - start, stage=stage)
+        memory = peak_memory()
+        if memory is not None:
+            self.set("fec_stage_process_peak_memory_bytes", memory, stage=stage)
+        if completed:
+            self.set("fec_stage_last_completed_timestamp_seconds", time.time(), stage=stage)
+
+    @contextmanager
+    def stage(self, stage):
+        """Records the wall time of a block and the peak memory, see `end_stage`.
+
+        A block that raises is recorded too, without a completion time.
+        """
+        self.begin_stage(stage)
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            self.end_stage(stage, completed)
+
+    def snapshot(self):
+        """Returns all metrics as a JSON serializable dict."""
+        def entries(values, convert = lambda value: value):
+            return [dict(labels=dict(key), value=convert(value)) for key, value in values.items()]
+
+        with self.lock:
+            return {
+                "timestamp": time.time(),
+                "started": self.started,
+                "counters": {name: entries(values) for name, values in self.counters.items()},
+                "gauges": {name: entries(values) for name, values in self.gauges.items()},
+                "histograms": {
+                    name: entries(values, Histogram.to_dict) for name, values in self.histograms.items()
+                },
+            }
+
+    def prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        def format_labels(key, extra = ()):
+            labels = list(key) + list(extra)
+            if len(labels) == 0:
+                return ""
+            escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels]
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        lines = []
+        with self.lock:
+            for kind, metrics in [("counter", self.counters), ("gauge", self.gauges)]:
+                for name, values in sorted(metrics.items()):
+                    lines.append(f"# HELP {name} {descriptions.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in values.items():
+                        lines.append(f"{name}{format_labels(key)} {value}")
+            for name, values in sorted(self.histograms.items()):
+                lines.append(f"# HELP {name} {descriptions.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in values.items():
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path = None, textfile_path = None):
+        """Writes the metrics to a JSON file and/or a Prometheus textfile.
+
+        Files are replaced atomically, so readers never see a partial file.
+        """
+        for path, content in [
+            (json_path, lambda: json.dumps(self.snapshot(), indent=1)),
+            (textfile_path, self.prometheus),
+        ]:
+            if path is None:
+                continue
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(content())
+            os.replace(tmp_path, path)
+
+    def start(self, json_path = None, textfile_path = None, interval = 15):
+        """Writes the metrics every `interval` seconds until `stop` is called."""
+        self.stop()
+        self.stop_event = threading.Event()
+
+        def run(stop_event):
+            while not stop_event.wait(interval):
+                self.write(json_path, textfile_path)
+            self.write(json_path, textfile_path)
+
+        self.thread = threading.Thread(target=run, args=(self.stop_event,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops periodic writing, after writing the metrics a last time."""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+
+# Shared by the API client, the bulk downloader and the matcher
+metrics = Metrics()
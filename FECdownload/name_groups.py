@@ -0,0 +1,106 @@
+import os
+import threading
+import pandas as pd
+from importlib import metadata
+
+
+def nicknames_version():
+    # Read from the package metadata, without importing the nickname tables
+    try:
+        return metadata.version("nicknames")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+cache_dir = "cache"
+# The index depends on the nickname data shipped with the nicknames package
+index_filename = os.path.join(cache_dir, f"nickname_groups_{nicknames_version()}.csv")
+
+_index = None
+_nicknamer = None
+_nicknamer_lock = threading.Lock()
+
+
+def nicknamer():
+    """Returns the NickNamer shared by the package.
+
+    Reading the nickname tables takes time, so they are read on first use
+    and only once per process.
+    """
+    global _nicknamer
+    with _nicknamer_lock:
+        if _nicknamer is None:
+            from nicknames import NickNamer
+            _nicknamer = NickNamer()
+        return _nicknamer
+
+
+def build_nickname_index():
+    """Builds the nickname equivalence index from the nicknames package.
+
+    Each canonical first name and its nicknames form a name group with an
+    integer id. A name can be in several groups, as a nickname of several
+    canonical names or as both a canonical name and a nickname.
+
+    Returns:
+        pandas.DataFrame: One row per name and group, with columns "name",
+            "group" and "canonical", True for the canonical name of the group.
+    """
+    lookup = nicknamer().nickname_lookup
+    names = []
+    groups = []
+    canonical = []
+    for group, name in enumerate(sorted(lookup)):
+        members = [name] + sorted(lookup[name])
+        names += members
+        groups += [group] * len(members)
+        canonical += [True] + [False] * (len(members) - 1)
+    return pd.DataFrame({
+        "name": names,
+        "group": pd.Series(groups, dtype="int32"),
+        "canonical": canonical,
+    })
+
+
+def nickname_index():
+    """Returns the nickname equivalence index.
+
+    The index is built on first use and saved in the cache directory, so
+    later runs only read it from disk.
+    """
+    global _index
+    if _index is not None:
+        return _index
+    if os.path.exists(index_filename):
+        # "nan" is a nickname, not a missing value
+        _index = pd.read_csv(index_filename, keep_default_na=False, dtype={"name": str, "group": "int32", "canonical": bool})
+    else:
+        _index = build_nickname_index()
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_filename = f"{index_filename}.{os.getpid()}.tmp"
+        _index.to_csv(tmp_filename, index=False)
+        os.replace(tmp_filename, index_filename)
+    return _index
+
+
+def nickname_pairs(first_names, target_first_names):
+    """Finds the nickname matches between two sets of canonized first names.
+
+    A name matches a target name if it is a nickname of the target or if the
+    target is a nickname of it, which is the same as checking membership in
+    `NickNamer.nicknames_of(target)` or `NickNamer.canonicals_of(target)`.
+
+    Args:
+        first_names (array-like): first names, e.g. from the contributions
+        target_first_names (array-like): first names from the target dataset
+
+    Returns:
+        pandas.DataFrame: The unique matching pairs, with columns "name_x" and
+            "name_y".
+    """
+    index = nickname_index()
+    x = index[index["name"].isin(pd.unique(pd.Series(first_names, dtype=object)))]
+    y = index[index["name"].isin(pd.unique(pd.Series(target_first_names, dtype=object)))]
+    pairs = x.merge(y, on="group")
+    pairs = pairs[pairs["canonical_x"] != pairs["canonical_y"]]
+    return pairs[["name_x", "name_y"]].drop_duplicates().reset_index(drop=True)
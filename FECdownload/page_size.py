@@ -0,0 +1,117 @@
+import time
+import threading
+from collections import deque
+
+
+def query_type(parameters):
+    """Groups queries whose pages take similar time to serve."""
+    filters = [
+        name for name, parameter in [
+            ("employer", "contributor_employer"),
+            ("name", "contributor_name"),
+            ("dates", "min_date"),
+            ("load_date", "min_load_date"),
+        ]
+        if parameter in parameters
+    ]
+    return "+".join(filters) or "all"
+
+
+class PageSizeController:
+    """Additive increase, multiplicative decrease (AIMD) control of `per_page`.
+
+    After each page, the page size is increased by `increase` if the request
+    took less than `target_latency` seconds and the page was full, and
+    multiplied by `decrease` if it took longer. Requests slower than
+    `max_latency` halve the page size at least. The tuned size is kept per
+    query type, so a new query starts from the size learned for similar
+    queries instead of the maximum.
+
+    Every decision is recorded in `history`, with the latency, the number of
+    records and the records per second, for inspection with `summary`.
+
+    Args:
+        target_latency (float): latency in seconds to stay below (default: 10)
+        max_latency (float): latency in seconds considered a failure (default: 20)
+        min_size (int): smallest page size (default: 1)
+        max_size (int): largest page size, the API maximum (default: 100)
+        increase (int): records added after a fast page (default: 10)
+        decrease (float): factor applied after a slow page (default: 0.7)
+        history_size (int): number of decisions kept (default: 10000)
+    """
+    def __init__(self, target_latency = 10, max_latency = 20, min_size = 1, max_size = 100, increase = 10, decrease = 0.7, history_size = 10000):
+        self.target_latency = target_latency
+        self.max_latency = max_latency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.increase = increase
+        self.decrease = decrease
+        self.lock = threading.Lock()
+        self.sizes = {}
+        self.history = deque(maxlen=history_size)
+
+    def initial(self, parameters):
+        """Returns the page size to start a query with."""
+        with self.lock:
+            return self.sizes.get(query_type(parameters), self.max_size)
+
+    def update(self, parameters, per_page, latency, records):
+        """Records a page and returns the page size for the next request.
+
+        Args:
+            parameters (dict): API parameters of the query
+            per_page (int): page size of the request
+            latency (float): seconds the request took
+            records (int): number of records received
+        """
+        if latency > self.max_latency:
+            size = min(int(per_page * self.decrease), per_page // 2)
+            decision = "decrease"
+        elif latency > self.target_latency:
+            size = int(per_page * self.decrease)
+            decision = "decrease"
+        elif records >= per_page:
+            size = per_page + self.increase
+            decision = "increase"
+        else:
+            size = per_page
+            decision = "hold"
+        size = max(self.min_size, min(self.max_size, size))
+
+        kind = query_type(parameters)
+        with self.lock:
+            self.sizes[kind] = size
+            self.history.append({
+                "time": time.time(),
+                "query_type": kind,
+                "per_page": per_page,
+                "latency": latency,
+                "records": records,
+                "records_per_second": records / latency if latency > 0 else None,
+                "decision": decision,
+                "next_per_page": size,
+            })
+        return size
+
+    def summary(self):
+        """Summarizes the history by query type.
+
+        Returns:
+            dict: For each query type, the number of requests, the current
+                page size, the mean latency and the records per second over
+                all requests.
+        """
+        with self.lock:
+            history = list(self.history)
+            sizes = dict(self.sizes)
+        summary = {}
+        for entry in history:
+            kind = summary.setdefault(entry["query_type"], {"requests": 0, "records": 0, "seconds": 0.0})
+            kind["requests"] += 1
+            kind["records"] += entry["records"]
+            kind["seconds"] += entry["latency"]
+        for kind, values in summary.items():
+            values["per_page"] = sizes.get(kind)
+            values["mean_latency"] = values["seconds"] / values["requests"]
+            values["records_per_second"] = values["records"] / values["seconds"] if values["seconds"] > 0 else None
+        return summary
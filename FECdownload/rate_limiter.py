@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from time import sleep
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking (Windows). The limiter is then shared only within a process.
+    fcntl = None
+
+
+def user_state_file():
+    """Returns the state file of the current user in the temp directory.
+
+    The temp directory is shared by all users of a host, and a file created
+    by one user cannot be written by the others, so each user has a file.
+    """
+    user = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "")
+    return os.path.join(tempfile.gettempdir(), f"fec_download_rate_limit_{user}.json")
+
+
+default_state_file = user_state_file()
+
+
+class RateLimiter:
+    """Token bucket rate limiter for the FEC API.
+
+    Each API key has a bucket that holds up to `burst` tokens and refills at
+    `rate` tokens per `period` seconds. A request takes one token. The buckets
+    are adjusted from the `X-RateLimit-Remaining` and `Retry-After` headers of
+    the responses, so the limiter slows down before the API starts returning
+    429 errors.
+
+    When a state file is given, the buckets are stored in it under a file lock,
+    so all processes on the same host using the same file share the budget of
+    each key. Keys are stored as hashes.
+
+    Args:
+        api_keys (list): Pool of API keys to spread requests over. If empty, the
+            key given to `acquire` is used (default: None).
+        rate (float): Requests allowed per key per period (default: 900).
+        period (float): Length of the period in seconds (default: 3600).
+        burst (int): Maximum number of requests made without waiting (default: 10).
+        state_file (str): File for sharing the buckets between processes. None
+            keeps the buckets in memory (default: a file of the current user
+            in the temp directory).
+    """
+    def __init__(self, api_keys=None, rate=900, period=3600, burst=10, state_file=default_state_file):
+        self.api_keys = list(api_keys) if api_keys else []
+        self.rate = rate / period
+        self.burst = burst
+        self.state_file = state_file if fcntl is not None else None
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.wait_time = 0
+
+    def bucket_id(self, api_key):
+        return hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()[:16]
+
+    @contextmanager
+    def state(self):
+        """Yields the buckets of all keys, locked for the current thread and process."""
+        with self.lock:
+            if self.state_file is None:
+                yield self.buckets
+                return
+            # Created readable and writable by the owner only
+            descriptor = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(descriptor, "r+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read()
+                    try:
+                        buckets = json.loads(content) if content else {}
+                    except ValueError:
+                        buckets = {}
+                    yield buckets
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(buckets, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def bucket(self, buckets, api_key, now):
+        """Returns the bucket of a key, refilled up to the current time."""
+        bucket = buckets.setdefault(
+            self.bucket_id(api_key),
+            {"tokens": self.burst, "updated": now, "blocked_until": 0}
+        )
+        elapsed = max(0, now - bucket["updated"])
+        bucket["tokens"] = min(self.burst, bucket["tokens"] + elapsed * self.rate)
+        bucket["updated"] = now
+        return bucket
+
+    def acquire(self, api_key=None):
+        """Waits until a request can be made and takes a token for it.
+
+        Args:
+            api_key (str or list): Key, or list of keys, to use if the limiter
+                has no key pool of its own.
+
+        Returns:
+            str: The API key to make the request with.
+        """
+        keys = self.api_keys
+        if not keys:
+            keys = list(api_key) if isinstance(api_key, (list, tuple)) else [api_key]
+
+        wait_start = time.time()
+        while True:
+            now = time.time()
+            chosen = None
+            wait = None
+            with self.state() as buckets:
+                best = None
+                for key in keys:
+                    bucket = self.bucket(buckets, key, now)
+                    if bucket["blocked_until"] > now:
+                        key_wait = bucket["blocked_until"] - now
+                    elif bucket["tokens"] >= 1:
+                        if best is None or bucket["tokens"] > best[1]["tokens"]:
+                            best = (key, bucket)
+                        continue
+                    else:
+                        key_wait = (1 - bucket["tokens"]) / self.rate
+                    if wait is None or key_wait < wait:
+                        wait = key_wait
+                if best is not None:
+                    chosen, bucket = best
+                    bucket["tokens"] -= 1
+            if best is not None:
+                self.wait_time += time.time() - wait_start
+                return chosen
+            sleep(wait)
+
+    def update(self, api_key, response):
+        """Adjusts the bucket of a key using the rate limit headers of a response."""
+        now = time.time()
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        retry_after = retry_after_seconds(response.headers.get("Retry-After"), now)
+        if response.status_code == 429 and retry_after is None:
+            # No hint from the server. Wait long enough to refill a few tokens.
+            retry_after = 5 / self.rate
+
+        if remaining is None and retry_after is None:
+            return
+        with self.state() as buckets:
+            bucket = self.bucket(buckets, api_key, now)
+            if remaining is not None:
+                try:
+                    bucket["tokens"] = min(bucket["tokens"], int(remaining))
+                except ValueError:
+                    pass
+            if retry_after is not None:
+                bucket["tokens"] = 0
+                bucket["blocked_until"] = max(bucket["blocked_until"], now + retry_after)
+
+
+def retry_after_seconds(value, now):
+    """Parses a Retry-After header, given either in seconds or as an HTTP date."""
+    if value is None:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError):
+        return None
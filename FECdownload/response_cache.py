@@ -0,0 +1,195 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+import requests
+
+from .metrics import metrics
+
+cache_dir = os.path.join("cache", "responses")
+
+# Requests with these parameters ask for records loaded since a time, so
+# their responses change as records are loaded. They are never cached.
+uncached_parameters = ("min_load_date",)
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode for a request that is not in the cache."""
+
+
+def normalize_parameters(params, ignore = ("api_key",)):
+    """Returns the request parameters that identify a response, in a fixed order.
+
+    The API key does not change the response, so it is ignored. The page
+    size is kept: a page of one size does not continue a query paged with
+    another, and the count probes request a single result.
+    """
+    normalized = []
+    for key, value in sorted((params or {}).items()):
+        if key in ignore or value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(v) for v in value)
+        else:
+            value = str(value)
+        normalized.append([key, value])
+    return normalized
+
+
+class ResponseCache:
+    """On-disk cache of API responses, used by `make_request`.
+
+    Successful responses are stored gzip compressed, one file per request,
+    keyed by a hash of the URL and the normalized parameters (see
+    `normalize_parameters`). A repeated request is answered from disk,
+    without waiting for the rate limiter or using quota.
+
+    Entries older than `ttl` seconds are not used and are removed. When the
+    cache is larger than `max_bytes`, the oldest entries are removed.
+
+    Incremental requests, with `min_load_date` as used by
+    `ContributionStore.sync`, are always sent to the API, so records loaded
+    since the last request are not missed.
+
+    In offline mode, no requests are sent: responses are replayed from the
+    cache regardless of their age, and a request that is not cached raises
+    `CacheMiss`.
+
+    Args:
+        directory (str): directory of the cache (default: "cache/responses")
+        ttl (float): time in seconds an entry is used, None for no limit (default: 7 days)
+        max_bytes (int): size of the cache in bytes (default: 1 GB)
+        offline (bool): only replay cached responses (default: False)
+    """
+    def __init__(self, directory = cache_dir, ttl = 7 * 24 * 3600, max_bytes = 2**30, offline = False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        # Size of the cache, counted on first write and updated with each write
+        self.size = None
+
+    def cacheable(self, params):
+        return not any((params or {}).get(name) is not None for name in uncached_parameters)
+
+    def key(self, url, params):
+        data = json.dumps([url, normalize_parameters(params)])
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.gz")
+
+    def expired(self, modified, now = None):
+        return self.ttl is not None and (now or time.time()) - modified > self.ttl
+
+    def get(self, url, params):
+        """Returns the cached response of a request and the time the original request took.
+
+        Returns:
+            tuple: A requests.Response and the latency in seconds, or None if
+                the request is not cached.
+        """
+        if not self.cacheable(params):
+            if self.offline:
+                raise CacheMiss(f"Incremental requests are not cached: {url} {normalize_parameters(params)}")
+            return None
+        filename = self.filename(self.key(url, params))
+        try:
+            if not self.offline and self.expired(os.path.getmtime(filename)):
+                raise FileNotFoundError(filename)
+            with gzip.open(filename, "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, EOFError, ValueError):
+            metrics.inc("fec_response_cache_total", result="miss")
+            if self.offline:
+                raise CacheMiss(f"Not in the response cache: {url} {normalize_parameters(params)}")
+            return None
+        metrics.inc("fec_response_cache_total", result="hit")
+
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.headers["Content-Type"] = meta.get("content_type", "application/json")
+        response.encoding = "utf-8"
+        response.url = url
+        response._content = body
+        return response, meta.get("elapsed", 0.0)
+
+    def put(self, url, params, response, elapsed = 0.0):
+        """Stores a successful response."""
+        if response.status_code != 200 or not self.cacheable(params):
+            return
+        filename = self.filename(self.key(url, params))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        meta = {
+            "url": url,
+            "params": normalize_parameters(params),
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", "application/json"),
+            "elapsed": elapsed,
+            "stored": time.time(),
+        }
+        tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_filename, "wb", compresslevel=6) as f:
+            f.write(json.dumps(meta).encode("utf-8") + b"\n")
+            f.write(response.content)
+        size = os.path.getsize(tmp_filename)
+        os.replace(tmp_filename, filename)
+        metrics.inc("fec_response_cache_total", result="store")
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(entry_size for _, entry_size, _ in self.entries())
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        """Returns (modification time, size, filename) of the cached responses."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".gz"):
+                    continue
+                filename = os.path.join(root, name)
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        return entries
+
+    def remove(self, filename):
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Removes expired entries, then the oldest entries until the cache fits `max_bytes`.
+
+        The cache is reduced to 90% of `max_bytes`, so that eviction does not
+        run again on the next write.
+        """
+        now = time.time()
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for modified, size, filename in entries:
+            if total <= 0.9 * self.max_bytes and not self.expired(modified, now):
+                continue
+            self.remove(filename)
+            total -= size
+        self.size = total
+
+    def clear(self):
+        """Removes all entries."""
+        with self.lock:
+            for _, _, filename in self.entries():
+                self.remove(filename)
+            self.size = 0
@@ -0,0 +1,261 @@
+import os
+import threading
+import pandas
+from pandas import json_normalize
+
+# Columns written by the sinks and their types. Nested fields are flattened
+# with json_normalize, so committee fields are named "committee.<field>".
+schedule_a_schema = {
+    "sub_id": "string",
+    "two_year_transaction_period": "int",
+    "committee_id": "string",
+    "committee.name": "string",
+    "committee.party": "category",
+    "committee.state": "category",
+    "committee.committee_type": "category",
+    "committee.designation": "category",
+    "report_type": "category",
+    "report_year": "int",
+    "filing_form": "category",
+    "line_number": "category",
+    "receipt_type": "category",
+    "memo_code": "category",
+    "memo_text": "string",
+    "entity_type": "category",
+    "is_individual": "bool",
+    "contributor_id": "string",
+    "contributor_name": "string",
+    "contributor_prefix": "category",
+    "contributor_first_name": "string",
+    "contributor_middle_name": "string",
+    "contributor_last_name": "string",
+    "contributor_suffix": "category",
+    "contributor_street_1": "string",
+    "contributor_street_2": "string",
+    "contributor_city": "string",
+    "contributor_state": "category",
+    "contributor_zip": "string",
+    "contributor_employer": "string",
+    "contributor_occupation": "string",
+    "contribution_receipt_date": "date",
+    "contribution_receipt_amount": "float",
+    "contributor_aggregate_ytd": "float",
+    "election_type": "category",
+    "fec_election_year": "category",
+    "transaction_id": "string",
+    "file_number": "int",
+    "image_number": "string",
+    "amendment_indicator": "category",
+    "load_date": "datetime",
+    "pdf_url": "string",
+}
+
+# The same columns with only the committee id. The committee fields can be
+# added back from the committee table, see committees.CommitteeTable.enrich.
+schedule_a_schema_without_committee = {
+    column: kind for column, kind in schedule_a_schema.items() if not column.startswith("committee.")
+}
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Writing Parquet or Arrow files requires pyarrow. Install it with: pip install pyarrow")
+    return pyarrow
+
+
+def flatten_page(page, schema = schedule_a_schema):
+    """Flattens a page of API results into a DataFrame with fixed, typed columns.
+
+    Columns missing from the page are filled with nulls and columns not in the
+    schema are dropped, so every page has the same columns and types. If the
+    schema has no committee fields, the nested committee is dropped before
+    flattening.
+    """
+    if not any(column.startswith("committee.") for column in schema):
+        page = [{key: value for key, value in item.items() if key != "committee"} for item in page]
+    df = json_normalize(page) if len(page) > 0 else pandas.DataFrame()
+    df = df.reindex(columns=list(schema))
+    for column, kind in schema.items():
+        values = df[column]
+        if kind == "string":
+            df[column] = values.astype("string")
+        elif kind == "category":
+            df[column] = values.astype("string").astype("category")
+        elif kind == "float":
+            df[column] = pandas.to_numeric(values, errors="coerce").astype("float64")
+        elif kind == "int":
+            df[column] = pandas.to_numeric(values, errors="coerce").astype("Int64")
+        elif kind == "bool":
+            df[column] = values.astype("boolean")
+        elif kind == "date":
+            df[column] = pandas.to_datetime(values, errors="coerce").dt.normalize()
+        elif kind == "datetime":
+            df[column] = pandas.to_datetime(values, errors="coerce")
+    return df
+
+
+def arrow_schema(schema = schedule_a_schema):
+    pa = require_pyarrow()
+    types = {
+        "string": pa.string(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "float": pa.float64(),
+        "int": pa.int64(),
+        "bool": pa.bool_(),
+        "date": pa.date32(),
+        "datetime": pa.timestamp("us"),
+    }
+    return pa.schema([(column, types[kind]) for column, kind in schema.items()])
+
+
+def to_arrow(df, schema = schedule_a_schema):
+    """Converts a flattened page into an Arrow table with the fixed schema."""
+    pa = require_pyarrow()
+    target = arrow_schema(schema)
+    arrays = []
+    for field in target:
+        kind = schema[field.name]
+        values = df[field.name]
+        if kind == "category":
+            array = pa.array(values.astype("string"), type=pa.string()).dictionary_encode()
+            array = array.cast(field.type)
+        elif kind in ("date", "datetime"):
+            array = pa.array(values, from_pandas=True).cast(field.type)
+        else:
+            array = pa.array(values, type=field.type, from_pandas=True)
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, schema=target)
+
+
+class Sink:
+    """Writes pages of results to disk as they arrive, partitioned by cycle.
+
+    Each cycle is written to `<path>/cycle=<cycle>/`. Rows
+    are buffered until `chunk_size` rows are available for a cycle, so memory use
+    does not depend on the size of the output. Sinks can be shared by threads.
+
+    Args:
+        path (str): Output directory
+        schema (dict): Columns and their types (default: `schedule_a_schema`)
+        chunk_size (int): Number of rows written at a time (default: 50000)
+    """
+    extension = None
+
+    def __init__(self, path, schema = schedule_a_schema, chunk_size = 50000):
+        self.path = path
+        self.schema = schema
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.writers = {}
+
+    def filename(self, cycle):
+        directory = os.path.join(self.path, f"cycle={cycle}")
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return os.path.join(directory, f"part-0.{self.extension}")
+
+    def write(self, cycle, page):
+        """Flattens a page of API results and writes it once a chunk is full."""
+        df = flatten_page(page, self.schema)
+        with self.lock:
+            buffer = self.buffers.setdefault(cycle, [])
+            buffer.append(df)
+            if sum(len(chunk) for chunk in buffer) >= self.chunk_size:
+                self.flush(cycle)
+
+    def flush(self, cycle):
+        buffer = self.buffers.pop(cycle, [])
+        buffer = [chunk for chunk in buffer if len(chunk) > 0]
+        if len(buffer) == 0:
+            return
+        self.write_chunk(cycle, pandas.concat(buffer, ignore_index=True))
+
+    def write_chunk(self, cycle, df):
+        raise NotImplementedError
+
+    def close_writer(self, writer):
+        writer.close()
+
+    def close(self):
+        with self.lock:
+            for cycle in list(self.buffers):
+                self.flush(cycle)
+            for writer in self.writers.values():
+                self.close_writer(writer)
+            self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ParquetSink(Sink):
+    """Writes compressed Parquet files, one row group per chunk."""
+    extension = "parquet"
+
+    def __init__(self, path, schema = schedule_a_schema, chunk_size = 50000, compression = "zstd"):
+        super().__init__(path, schema, chunk_size)
+        self.compression = compression
+        require_pyarrow()
+
+    def write_chunk(self, cycle, df):
+        import pyarrow.parquet as pq
+        table = to_arrow(df, self.schema)
+        if cycle not in self.writers:
+            self.writers[cycle] = pq.ParquetWriter(self.filename(cycle), table.schema, compression=self.compression)
+        self.writers[cycle].write_table(table)
+
+
+class ArrowSink(Sink):
+    """Writes Arrow IPC streams, one record batch per chunk.
+
+    The stream format is used because category dictionaries differ between
+    chunks, which the IPC file format does not allow.
+    """
+    extension = "arrows"
+
+    def __init__(self, path, schema = schedule_a_schema, chunk_size = 50000):
+        super().__init__(path, schema, chunk_size)
+        require_pyarrow()
+
+    def write_chunk(self, cycle, df):
+        import pyarrow as pa
+        table = to_arrow(df, self.schema)
+        if cycle not in self.writers:
+            sink = pa.OSFile(self.filename(cycle), "wb")
+            self.writers[cycle] = (sink, pa.ipc.new_stream(sink, table.schema))
+        self.writers[cycle][1].write_table(table)
+
+    def close_writer(self, writer):
+        sink, ipc_writer = writer
+        ipc_writer.close()
+        sink.close()
+
+
+class CSVSink(Sink):
+    """Writes CSV files, appending a chunk at a time."""
+    extension = "csv"
+
+    def write_chunk(self, cycle, df):
+        header = cycle not in self.writers
+        if header:
+            self.writers[cycle] = open(self.filename(cycle), "w", newline="")
+        df.to_csv(self.writers[cycle], header=header, index=False)
+
+
+sink_formats = {
+    "parquet": ParquetSink,
+    "arrow": ArrowSink,
+    "csv": CSVSink,
+}
+
+def make_sink(path, format = "parquet", **kwargs):
+    """Creates a sink writing the given format ("parquet", "arrow" or "csv") to path."""
+    if format not in sink_formats:
+        raise ValueError(f"Unknown output format {format}, expected one of {', '.join(sink_formats)}")
+    return sink_formats[format](path, **kwargs)
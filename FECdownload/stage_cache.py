@@ -0,0 +1,166 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+from .metrics import metrics
+
+cache_dir = os.path.join("cache", "stages")
+# Changing the layout of the cached files or the meaning of a stage requires
+# a new version, so that older entries are not reused.
+cache_version = 1
+
+
+def file_fingerprint(filename):
+    """Identifies the content of a file by its name, size and modification time."""
+    stat = os.stat(filename)
+    return [filename, stat.st_size, stat.st_mtime_ns]
+
+
+def fingerprint(value):
+    """Returns a hash of a DataFrame, a Series or a JSON serializable value."""
+    digest = hashlib.sha256()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        digest.update(json.dumps([[str(c), str(t)] for c, t in frame.dtypes.items()]).encode("utf-8"))
+        try:
+            digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+        except TypeError:
+            # Columns of lists or dicts cannot be hashed by pandas
+            digest.update(frame.to_csv().encode("utf-8"))
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Cache of the DataFrames produced by the stages of the matcher.
+
+    Each entry is keyed by a hash of the stage name and of everything the
+    stage depends on: its parameters, its input data, or the key of the
+    stage it was computed from. An entry is therefore reused only while the
+    inputs are unchanged, and a change in the employer lists, the thresholds
+    or the target dataset recomputes the stages that depend on it.
+
+    Entries are stored as Parquet files, which keep the column types and
+    load much faster than CSV. Without pyarrow, or for columns Parquet
+    cannot store, entries are pickled. When the cache is larger than
+    `max_bytes`, the least recently used entries are removed.
+
+    Args:
+        directory (str): directory of the cache, None to disable it (default: cache/stages)
+        max_bytes (int): size of the cache in bytes (default: 2 GB)
+    """
+    def __init__(self, directory = cache_dir, max_bytes = 2 * 2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, stage, **inputs):
+        """Returns the key of a stage for the given inputs.
+
+        DataFrames and Series are hashed by content, other inputs must be
+        JSON serializable. Use `file_fingerprint` for input files.
+        """
+        if self.directory is None:
+            return None
+        return fingerprint({
+            "stage": stage,
+            "version": cache_version,
+            "inputs": {name: fingerprint(value) for name, value in sorted(inputs.items())},
+        })
+
+    def filename(self, stage, key, extension):
+        return os.path.join(self.directory, f"{stage}_{key[:32]}.{extension}")
+
+    def get(self, stage, key):
+        """Returns the cached DataFrame of a stage, or None."""
+        if self.directory is None:
+            return None
+        for extension, read in [("parquet", pd.read_parquet), ("pickle", pd.read_pickle)]:
+            filename = self.filename(stage, key, extension)
+            try:
+                df = read(filename)
+            except (FileNotFoundError, ImportError):
+                continue
+            # The modification time orders the entries for eviction
+            try:
+                os.utime(filename)
+            except FileNotFoundError:
+                pass
+            metrics.inc("fec_stage_cache_total", result="hit", stage=stage)
+            return df
+        metrics.inc("fec_stage_cache_total", result="miss", stage=stage)
+        return None
+
+    def put(self, stage, key, df):
+        """Stores the DataFrame of a stage and evicts old entries if needed."""
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self.filename(stage, key, "parquet")
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_filename)
+        except (ImportError, ValueError, TypeError, NotImplementedError):
+            filename = self.filename(stage, key, "pickle")
+            df.to_pickle(tmp_filename, compression=None)
+        os.replace(tmp_filename, filename)
+        self.evict(keep=filename)
+
+    def cached(self, stage, compute, **inputs):
+        """Returns the DataFrame of a stage, computing it if it is not cached.
+
+        Args:
+            stage (str): name of the stage
+            compute (function): computes the DataFrame of the stage
+            **inputs: everything the stage depends on, see `key`
+
+        Returns:
+            tuple: The DataFrame and the key of the stage, to use as an input
+                of later stages.
+        """
+        key = self.key(stage, **inputs)
+        df = self.get(stage, key)
+        if df is None:
+            df = compute()
+            self.put(stage, key, df)
+        return df, key
+
+    def entries(self):
+        """Returns (modification time, size, filename) of the cached files."""
+        entries = []
+        if self.directory is None or not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        return entries
+
+    def evict(self, keep = None):
+        """Removes the least recently used entries until the cache fits `max_bytes`."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_bytes:
+                break
+            if filename == keep:
+                continue
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Removes all entries."""
+        for _, _, filename in self.entries():
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,365 @@
+import json
+import sqlite3
+import datetime
+import threading
+import pandas as pd
+from pandas import json_normalize
+
+from .FECdownload import scheduleA_parameters, iter_pages, checkpoint_remove
+from . import utils
+
+# Matches any employer or name in the coverage table
+ANY = "*"
+
+schema = """
+CREATE TABLE IF NOT EXISTS contributions (
+    sub_id TEXT PRIMARY KEY,
+    cycle INTEGER,
+    canonical_last_name TEXT,
+    employer TEXT,
+    load_date TEXT,
+    record TEXT
+);
+CREATE INDEX IF NOT EXISTS contributions_last_name ON contributions (canonical_last_name, cycle);
+CREATE INDEX IF NOT EXISTS contributions_employer ON contributions (employer, cycle);
+CREATE INDEX IF NOT EXISTS contributions_cycle ON contributions (cycle);
+CREATE TABLE IF NOT EXISTS coverage (
+    employer TEXT,
+    last_name TEXT,
+    cycle INTEGER,
+    source TEXT,
+    updated TEXT,
+    PRIMARY KEY (employer, last_name, cycle)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    employer TEXT,
+    last_name TEXT,
+    cycle INTEGER,
+    max_load_date TEXT,
+    max_sub_id TEXT,
+    updated TEXT,
+    PRIMARY KEY (employer, last_name, cycle)
+);
+"""
+
+# Columns added after the first version of the contributions table. They
+# identify a transaction across amended filings.
+added_columns = {
+    "committee_id": "TEXT",
+    "transaction_id": "TEXT",
+    "file_number": "INTEGER",
+}
+
+# Bulk file columns and the API fields they correspond to
+bulk_fields = {
+    "CMTE_ID": "committee_id",
+    "AMNDT_IND": "amendment_indicator",
+    "RPT_TP": "report_type",
+    "IMAGE_NUM": "image_number",
+    "TRANSACTION_TP": "receipt_type",
+    "ENTITY_TP": "entity_type",
+    "NAME": "contributor_name",
+    "CITY": "contributor_city",
+    "STATE": "contributor_state",
+    "ZIP_CODE": "contributor_zip",
+    "EMPLOYER": "contributor_employer",
+    "OCCUPATION": "contributor_occupation",
+    "TRANSACTION_DT": "contribution_receipt_date",
+    "TRANSACTION_AMT": "contribution_receipt_amount",
+    "OTHER_ID": "contributor_id",
+    "TRAN_ID": "transaction_id",
+    "FILE_NUM": "file_number",
+    "MEMO_CD": "memo_code",
+    "MEMO_TEXT": "memo_text",
+    "SUB_ID": "sub_id",
+}
+
+# Maximum number of values bound in one SQLite statement
+max_variables = 900
+
+
+def split_name(name):
+    """Splits a bulk file name, "LAST, FIRST MIDDLE", into last, first and middle names."""
+    if not isinstance(name, str):
+        return None, None, None
+    last, _, rest = name.partition(",")
+    parts = rest.split()
+    first = parts[0] if len(parts) > 0 else None
+    middle = parts[1] if len(parts) > 1 else None
+    return last.strip() or None, first, middle
+
+
+class ContributionStore:
+    """Local, indexed store of individual contributions.
+
+    Records from API pulls and bulk files are stored in an SQLite database,
+    keyed on `sub_id` and indexed by canonical last name, employer and cycle.
+    A coverage table records which (employer, last name, cycle) queries the
+    store holds completely, so only missing data needs to be requested from
+    the API.
+
+    Args:
+        path (str): The database file (default: "contributions.sqlite")
+    """
+    def __init__(self, path = "contributions.sqlite"):
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.executescript(schema)
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(contributions)")]
+            for column, column_type in added_columns.items():
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE contributions ADD COLUMN {column} {column_type}")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS contributions_transaction ON contributions (committee_id, transaction_id)"
+            )
+
+    def connection(self):
+        """Returns the connection of the current thread."""
+        if not hasattr(self.local, "connection"):
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return self.local.connection
+
+    def upsert(self, records, cycle = None):
+        """Inserts records, replacing stored records with the same sub_id.
+
+        A stored record is not replaced by a version with an older load date,
+        or by a version without a load date, such as a bulk file row, if it
+        has one. So bulk data added after an API pull keeps the API records.
+        A record from an amended filing supersedes the records of the same
+        transaction, with the same committee and transaction ids, from
+        earlier filings, which are deleted. A record of an earlier filing
+        received after the amendment is not stored.
+
+        Args:
+            records (list): API records
+            cycle (int): two-year period of the records, if not in the records
+        """
+        if len(records) == 0:
+            return
+        last_names = utils.canonize_name(pd.Series(
+            [record.get("contributor_last_name") for record in records], dtype="object"
+        ))
+        rows = []
+        for record, last_name in zip(records, last_names):
+            employer = record.get("contributor_employer")
+            file_number = record.get("file_number")
+            rows.append((
+                str(record["sub_id"]),
+                record.get("two_year_transaction_period", cycle),
+                last_name if isinstance(last_name, str) else None,
+                employer.upper() if isinstance(employer, str) else None,
+                record.get("load_date"),
+                json.dumps(record),
+                record.get("committee_id"),
+                record.get("transaction_id"),
+                int(file_number) if file_number is not None else None,
+            ))
+        with self.connection() as connection:
+            connection.executemany(
+                """INSERT INTO contributions (sub_id, cycle, canonical_last_name, employer, load_date, record,
+                    committee_id, transaction_id, file_number)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (sub_id) DO UPDATE SET
+                    cycle = excluded.cycle,
+                    canonical_last_name = excluded.canonical_last_name,
+                    employer = excluded.employer,
+                    load_date = excluded.load_date,
+                    record = excluded.record,
+                    committee_id = excluded.committee_id,
+                    transaction_id = excluded.transaction_id,
+                    file_number = excluded.file_number
+                WHERE contributions.load_date IS NULL OR excluded.load_date >= contributions.load_date""",
+                rows
+            )
+            amendable = [
+                (row[6], row[7], row[1], row[8], row[0])
+                for row in rows
+                if row[6] is not None and row[7] is not None and row[8] is not None
+            ]
+            connection.executemany(
+                """DELETE FROM contributions
+                WHERE committee_id = ? AND transaction_id = ? AND cycle = ?
+                    AND file_number < ? AND sub_id != ?""",
+                amendable
+            )
+            connection.executemany(
+                """DELETE FROM contributions
+                WHERE sub_id = ?5 AND EXISTS (
+                    SELECT 1 FROM contributions AS amended
+                    WHERE amended.committee_id = ?1 AND amended.transaction_id = ?2
+                        AND amended.cycle = ?3 AND amended.file_number > ?4
+                )""",
+                amendable
+            )
+
+    def add_page(self, year, page):
+        """Stores a page of API results. Can be used as a hook of `iter_pages`."""
+        self.upsert(page, year)
+
+    def add_bulk(self, path = "bulk_parquet/contributions", cycles = None, batch_size = 100000):
+        """Stores contributions from a Parquet dataset written by `bulk_ingest.ingest_bulk`.
+
+        The bulk files contain all contributions of a cycle, so each cycle is
+        marked as completely covered.
+        """
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(path, partitioning="hive")
+        if cycles is None:
+            cycles = sorted(set(dataset.to_table(columns=["cycle"])["cycle"].to_pylist()))
+        for cycle in cycles:
+            scanner = dataset.scanner(filter=ds.field("cycle") == cycle, batch_size=batch_size)
+            for batch in scanner.to_batches():
+                df = batch.to_pandas().rename(columns=bulk_fields)
+                df["two_year_transaction_period"] = cycle
+                names = df["contributor_name"].map(split_name)
+                df["contributor_last_name"] = [name[0] for name in names]
+                df["contributor_first_name"] = [name[1] for name in names]
+                df["contributor_middle_name"] = [name[2] for name in names]
+                df["sub_id"] = df["sub_id"].astype(str)
+                df["contribution_receipt_date"] = pd.to_datetime(df["contribution_receipt_date"]).dt.strftime("%Y-%m-%d")
+                df = df[list(bulk_fields.values()) + [
+                    "two_year_transaction_period", "contributor_last_name",
+                    "contributor_first_name", "contributor_middle_name"
+                ]]
+                df = df.astype(object).where(df.notna(), None)
+                self.upsert(df.to_dict("records"))
+            self.mark_covered(cycle, source="bulk")
+
+    def mark_covered(self, cycle, employer = None, last_name = None, source = "api"):
+        """Records that the store holds all records of a query in a cycle."""
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)",
+                (employer or ANY, last_name or ANY, cycle, source, datetime.datetime.now().isoformat())
+            )
+
+    def covered(self, cycle, employer = None, last_name = None):
+        """Checks whether the store holds all records of a query in a cycle."""
+        employers = [ANY] if employer is None else [ANY, employer]
+        last_names = [ANY] if last_name is None else [ANY, last_name]
+        cursor = self.connection().execute(
+            f"""SELECT 1 FROM coverage WHERE cycle = ?
+            AND employer IN ({','.join('?'*len(employers))})
+            AND last_name IN ({','.join('?'*len(last_names))}) LIMIT 1""",
+            [cycle] + employers + last_names
+        )
+        return cursor.fetchone() is not None
+
+    def download(self, start, end, api_key = "DEMO_KEY", employer = None, name = None):
+        """Downloads the cycles of a query that the store does not cover yet."""
+        for parameters in scheduleA_parameters(start, end, api_key, employer, name):
+            cycle = parameters["two_year_transaction_period"]
+            if self.covered(cycle, employer, name):
+                continue
+            for page in iter_pages(parameters, progress=True, hooks=[self.add_page]):
+                pass
+            self.mark_covered(cycle, employer, name)
+
+    def high_water_mark(self, cycle, employer = None, last_name = None):
+        """Returns the latest load date and sub_id synced for a query, or None."""
+        row = self.connection().execute(
+            "SELECT max_load_date, max_sub_id FROM sync_state WHERE employer = ? AND last_name = ? AND cycle = ?",
+            (employer or ANY, last_name or ANY, cycle)
+        ).fetchone()
+        return row
+
+    def set_high_water_mark(self, cycle, employer, last_name, load_date, sub_id):
+        with self.connection() as connection:
+            connection.execute(
+                """INSERT INTO sync_state VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (employer, last_name, cycle) DO UPDATE SET
+                    max_load_date = MAX(COALESCE(max_load_date, ''), COALESCE(excluded.max_load_date, '')),
+                    max_sub_id = excluded.max_sub_id,
+                    updated = excluded.updated""",
+                (employer or ANY, last_name or ANY, cycle, load_date, sub_id, datetime.datetime.now().isoformat())
+            )
+
+    def sync(self, start, end, api_key = "DEMO_KEY", employer = None, name = None):
+        """Brings the store up to date with the API for a query.
+
+        The first sync of a cycle downloads all of its records. Later syncs
+        request only records loaded on or after the latest load date seen,
+        the high-water mark, and merge them into the store. Records seen
+        again replace the stored copy and amended records supersede the
+        originals, see `upsert`.
+
+        Returns:
+            int: The number of records received.
+        """
+        received = 0
+        for parameters in scheduleA_parameters(start, end, api_key, employer, name):
+            cycle = parameters["two_year_transaction_period"]
+            mark = self.high_water_mark(cycle, employer, name)
+            seen = {"load_date": None, "sub_id": None, "count": 0}
+
+            def track(year, page):
+                self.add_page(year, page)
+                for record in page:
+                    load_date = record.get("load_date")
+                    if load_date is not None and (seen["load_date"] is None or load_date > seen["load_date"]):
+                        seen["load_date"] = load_date
+                        seen["sub_id"] = str(record["sub_id"])
+                seen["count"] += len(page)
+
+            if mark is None or mark[0] is None:
+                # Full download, resumable from a checkpoint. The checkpoint is
+                # removed afterwards so the next sync does not replay it.
+                for page in iter_pages(parameters, progress=True, hooks=[track]):
+                    pass
+                checkpoint_remove(cycle, employer, name)
+            else:
+                # The mark is inclusive, records of the same day are received again
+                parameters["min_load_date"] = mark[0][:10]
+                for page in iter_pages(parameters, progress=True, checkpoint=False, hooks=[track]):
+                    pass
+
+            if seen["load_date"] is not None:
+                self.set_high_water_mark(cycle, employer, name, seen["load_date"], seen["sub_id"])
+            elif mark is None:
+                self.set_high_water_mark(cycle, employer, name, None, None)
+            self.mark_covered(cycle, employer, name)
+            received += seen["count"]
+        return received
+
+    def query(self, employers = None, last_names = None, cycles = None):
+        """Returns stored contributions as a DataFrame in the format of `fec_scheduleA_year_range`.
+
+        Args:
+            employers (list): keep records whose employer contains any of these,
+                ignoring case, like the API filter (default: all)
+            last_names (list): keep records with these last names, compared
+                after canonization (default: all)
+            cycles (list): keep records from these two-year periods (default: all)
+        """
+        conditions = []
+        values = []
+        if employers is not None:
+            conditions.append("(" + " OR ".join(["employer LIKE ?"]*len(employers)) + ")")
+            values += [f"%{employer.upper()}%" for employer in employers]
+        if cycles is not None:
+            conditions.append(f"cycle IN ({','.join('?'*len(cycles))})")
+            values += list(cycles)
+
+        batches = [None]
+        if last_names is not None:
+            names = utils.canonize_name(pd.Series(list(last_names), dtype="object")).dropna().unique().tolist()
+            batch_size = max_variables - len(values)
+            batches = [names[i:i+batch_size] for i in range(0, len(names), batch_size)]
+
+        records = []
+        for batch in batches:
+            batch_conditions = list(conditions)
+            batch_values = list(values)
+            if batch is not None:
+                batch_conditions.append(f"canonical_last_name IN ({','.join('?'*len(batch))})")
+                batch_values += batch
+            sql = "SELECT record FROM contributions"
+            if batch_conditions:
+                sql += " WHERE " + " AND ".join(batch_conditions)
+            for (record,) in self.connection().execute(sql, batch_values):
+                records.append(json.loads(record))
+        return pd.DataFrame(json_normalize(records))
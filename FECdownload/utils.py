@@ -1,24 +1,222 @@
+import os
+import re
+import csv
+import io
+import numpy as np
 import pandas as pd
-from thefuzz import fuzz
-from nicknames import NickNamer
-
-nicknamer = NickNamer()
-
-def canonize_name(series):
-    r = series.str.lower()
-    r = r.str.replace(',', '')
-    r = r.str.replace('.', '')
-    r = r.str.replace(' mr ', ' ')
-    r = r.str.replace(' ms ', ' ')
-    r = r.str.replace(' m ', ' ')
-    r = r.str.replace(' jr ', ' ')
-    r = r.str.strip()
-    return r
-
-def fuzzy_match(x, value, matcher = fuzz.ratio, threshold = 95):
+from pandas.api.types import union_categoricals
+
+# Version of the canonization rules, part of the cache file name. Version 1
+# removed adjacent titles, which the replacements below keep.
+canonize_version = 2
+canonize_cache_filename = os.path.join("cache", f"canonical_names_v{canonize_version}.csv")
+# Canonical form of each raw name seen, filled from the cache file on first use
+canonize_cache = {}
+_canonize_cache_loaded = False
+
+punctuation_table = str.maketrans("", "", ",.")
+# Titles and suffixes between two words, removed one after the other
+titles = (" mr ", " ms ", " m ", " jr ")
+
+def canonize_value(name):
+    """Canonizes one name: lowercase, without commas, periods, titles and
+    surrounding whitespace."""
+    name = name.lower().translate(punctuation_table)
+    for title in titles:
+        name = name.replace(title, " ")
+    return name.strip()
+
+def load_canonize_cache():
+    global _canonize_cache_loaded
+    if _canonize_cache_loaded:
+        return
+    _canonize_cache_loaded = True
+    try:
+        with open(canonize_cache_filename, "r", newline="", encoding="utf-8") as f:
+            canonize_cache.update((row[0], row[1]) for row in csv.reader(f) if len(row) == 2)
+    except OSError:
+        pass
+
+def save_canonize_cache(items):
+    """Appends new (raw, canonical) pairs to the cache file.
+
+    The rows are appended with a single write, so processes canonizing at
+    the same time do not interleave partial rows.
+    """
+    os.makedirs(os.path.dirname(canonize_cache_filename), exist_ok=True)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(items)
+    with open(canonize_cache_filename, "ab") as f:
+        f.write(buffer.getvalue().encode("utf-8"))
+
+def canonize_name(series, cache = True):
+    """Canonizes a column of names.
+
+    The column is factorized and each distinct name is canonized once.
+    Canonical names are remembered, and saved to the cache directory so that
+    later runs only canonize names they have not seen before.
+
+    Args:
+        series (pandas.Series): names. Values that are not strings become NaN.
+        cache (bool): read and update the cache file (default: True)
+
+    Returns:
+        pandas.Series: A categorical series of canonical names with the index
+            of `series`.
+    """
+    if cache:
+        load_canonize_cache()
+    codes, uniques = pd.factorize(np.asarray(series, dtype=object))
+    canonical = []
+    new_items = []
+    for name in uniques:
+        if not isinstance(name, str):
+            canonical.append(np.nan)
+        elif name in canonize_cache:
+            canonical.append(canonize_cache[name])
+        else:
+            value = canonize_value(name)
+            canonize_cache[name] = value
+            new_items.append((name, value))
+            canonical.append(value)
+    if cache and len(new_items) > 0:
+        save_canonize_cache(new_items)
+
+    category_codes, categories = pd.factorize(pd.Series(canonical, dtype=object))
+    # Missing values have code -1, which picks the -1 appended at the end
+    codes = np.append(category_codes, -1)[codes]
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=categories),
+        index=series.index, name=series.name
+    )
+
+def align_categories(*series):
+    """Gives categorical series the same categories, so they can be compared."""
+    categories = union_categoricals([s.astype("category").array for s in series]).categories
+    return [s.astype("category").cat.set_categories(categories) for s in series]
+
+def match_employers(series, exact = (), partial = ()):
+    """Matches employer names against lists of exact and partial patterns.
+
+    All partial patterns are compiled into a single regular expression, and
+    only the distinct employer names are searched. Both kinds of patterns
+    are case sensitive and partial patterns are literal strings. An exact
+    match takes precedence; otherwise the first partial pattern found in the
+    name is reported, preferring the longest one at the same position.
+
+    Args:
+        series (pandas.Series): employer names
+        exact (list): names that must match the employer exactly
+        partial (list): strings the employer must contain
+
+    Returns:
+        tuple: A boolean array, True where the employer matches, and a
+            categorical series with the pattern that matched, or NaN.
+    """
+    codes, uniques = pd.factorize(np.asarray(series, dtype=object))
+    exact = set(exact)
+    pattern = None
+    if len(partial) > 0:
+        pattern = re.compile("|".join(re.escape(p) for p in sorted(set(partial), key=len, reverse=True)))
+
+    matched = []
+    for name in uniques:
+        if not isinstance(name, str):
+            matched.append(np.nan)
+        elif name in exact:
+            matched.append(name)
+        else:
+            found = pattern.search(name) if pattern is not None else None
+            matched.append(found.group(0) if found is not None else np.nan)
+
+    pattern_codes, patterns = pd.factorize(pd.Series(matched, dtype=object))
+    codes = np.append(pattern_codes, -1)[codes]
+    matched = pd.Series(pd.Categorical.from_codes(codes, categories=patterns), index=series.index)
+    return codes >= 0, matched
+
+def fuzzy_match(x, value, matcher = None, threshold = 95):
     if x == value:
         return True
+    if matcher is None:
+        from thefuzz import fuzz
+        matcher = fuzz.ratio
     r = matcher(x, value)
     if r >= threshold:
         return True
     return False
+
+
+# Results of fuzzy_match_many by scorer and threshold, keyed by (x, value)
+fuzzy_cache = {}
+
+def fuzzy_match_many(x, values, scorer = None, threshold = 95):
+    """Vectorized version of `fuzzy_match` for pairs of strings.
+
+    Gives the same result as calling `fuzzy_match` on each pair with the
+    equivalent thefuzz scorer: pairs match if they are equal or if their
+    score, rounded to an integer, is at least the threshold. Non-string
+    values only match if equal.
+
+    Each unique pair is scored once, and all new pairs are scored in a single
+    `rapidfuzz.process.cpdist` call. Results are remembered between calls.
+
+    Args:
+        x (array-like): first strings of the pairs
+        values (array-like): second strings of the pairs
+        scorer (callable): a rapidfuzz scorer (default: rapidfuzz.fuzz.ratio)
+        threshold (float): minimum score, from 0 to 100 (default: 95)
+
+    Returns:
+        numpy.ndarray: A boolean array, True where the pair matches.
+    """
+    from rapidfuzz import process
+    if scorer is None:
+        from rapidfuzz import fuzz
+        scorer = fuzz.ratio
+
+    x_codes, x_uniques = pd.factorize(np.asarray(x, dtype=object))
+    value_codes, value_uniques = pd.factorize(np.asarray(values, dtype=object))
+    valid = (x_codes >= 0) & (value_codes >= 0)
+    result = np.zeros(len(x_codes), dtype=bool)
+    if not valid.any():
+        return result
+
+    pair_codes = x_codes[valid].astype(np.int64) * len(value_uniques) + value_codes[valid]
+    unique_pairs, inverse = np.unique(pair_codes, return_inverse=True)
+    pair_x = np.asarray(x_uniques, dtype=object)[unique_pairs // len(value_uniques)]
+    pair_values = np.asarray(value_uniques, dtype=object)[unique_pairs % len(value_uniques)]
+
+    cache = fuzzy_cache.setdefault((scorer, threshold), {})
+    pair_matches = np.zeros(len(unique_pairs), dtype=bool)
+    to_score = []
+    for i, key in enumerate(zip(pair_x, pair_values)):
+        if key[0] == key[1]:
+            pair_matches[i] = True
+        elif not (isinstance(key[0], str) and isinstance(key[1], str)):
+            continue
+        elif key in cache:
+            pair_matches[i] = cache[key]
+        else:
+            to_score.append(i)
+
+    if len(to_score) > 0:
+        # Scores below the cutoff are reported as 0 and cannot round up to the threshold
+        scores = process.cpdist(
+            pair_x[to_score], pair_values[to_score], scorer=scorer,
+            score_cutoff=max(0, threshold - 1), dtype=np.float64, workers=-1
+        )
+        # thefuzz rounds scores to integers before comparing
+        matches = np.round(scores) >= threshold
+        pair_matches[to_score] = matches
+        cache.update(zip(zip(pair_x[to_score], pair_values[to_score]), matches.tolist()))
+
+    result[valid] = pair_matches[inverse]
+    return result
+
+
+def __getattr__(name):
+    # The shared NickNamer, created on first use. Use name_groups.nicknamer().
+    if name == "nicknamer":
+        from .name_groups import nicknamer
+        return nicknamer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,154 @@
+"""Exercises and times the bulk downloader against a local stand-in server.
+
+The server serves random archives with ETag, Last-Modified and Range support
+and can drop connections part way through a file. The benchmark checks that
+interrupted downloads are resumed to a byte-identical file, that unchanged
+files are not downloaded again and that changed files are, and reports the
+download throughput with several files in parallel.
+
+Run from the repository root with the package installed:
+    python benchmarks/bench_bulk_download.py [--size MB] [--files N] [--workers N]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from FECdownload import bulk_download
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    files = {}
+    # Drop the connection after this many bytes of a response, once per file
+    drop_after = None
+    dropped = set()
+    requests = []
+
+    def headers_for(self, path):
+        data, modified = self.files[path]
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        return data, etag, formatdate(modified, usegmt=True)
+
+    def do_HEAD(self):
+        if self.path not in self.files:
+            self.send_error(404)
+            return
+        data, etag, modified = self.headers_for(self.path)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", modified)
+        self.end_headers()
+
+    def do_GET(self):
+        Handler.requests.append((self.path, self.headers.get("Range"), self.headers.get("If-None-Match")))
+        if self.path not in self.files:
+            self.send_error(404)
+            return
+        data, etag, modified = self.headers_for(self.path)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (if_range is None or if_range in (etag, modified)):
+            start = int(range_header.split("=")[1].split("-")[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data)-1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", modified)
+        self.end_headers()
+
+        body = data[start:]
+        if self.drop_after is not None and self.path not in self.dropped:
+            Handler.dropped.add(self.path)
+            self.wfile.write(body[:self.drop_after])
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def checksum(filename):
+    with open(filename, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test and benchmark the bulk downloader against a local server")
+    parser.add_argument("--size", type=int, default=64, help="size of each file in MB, default: 64")
+    parser.add_argument("--files", type=int, default=4, help="number of files, default: 4")
+    parser.add_argument("--workers", type=int, default=4, help="number of parallel downloads, default: 4")
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    for i in range(args.files):
+        Handler.files[f"/bulk/file{i}.zip"] = (os.urandom(size), time.time())
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        files = [(base_url + path, f"bulk_data/{os.path.basename(path)}") for path in Handler.files]
+        expected = {filename: hashlib.md5(Handler.files[url[len(base_url):]][0]).hexdigest() for url, filename in files}
+
+        start = time.perf_counter()
+        bulk_download.download_files(files, workers=args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"downloaded {args.files} x {args.size} MB in {elapsed:.2f} s ({args.files*args.size/elapsed:.0f} MB/s)")
+
+        # Every file is cut off once, part way through
+        shutil.rmtree("bulk_data")
+        Handler.requests = []
+        Handler.drop_after = size // 3
+        bulk_download.download_files(files, workers=args.workers)
+        Handler.drop_after = None
+        resumed = sum(1 for _, range_header, _ in Handler.requests if range_header)
+        assert all(checksum(filename) == md5 for filename, md5 in expected.items()), "downloaded files differ"
+        assert not any(name.endswith(".part") for name in os.listdir("bulk_data"))
+        print(f"interrupted downloads: {resumed} resumed with Range, all files identical")
+
+        Handler.requests = []
+        changed = bulk_download.download_files(files, workers=args.workers)
+        assert not any(changed), "unchanged files were downloaded again"
+        print(f"unchanged files: {len(Handler.requests)} conditional requests, nothing downloaded")
+
+        path = next(iter(Handler.files))
+        Handler.files[path] = (os.urandom(size), time.time() + 10)
+        changed = bulk_download.download_files(files, workers=args.workers)
+        assert sum(changed) == 1, "the changed file was not downloaded"
+        print("changed file downloaded again")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Benchmarks the download paths against a local mock of the OpenFEC API.
+
+Scenarios, each run in a fresh process so that peak memory is its own:
+    api      fec_scheduleA_year_range for one employer over all cycles
+    faults   the same query with 429s, 5xx errors and dropped connections,
+             checking that no records are lost or duplicated
+    bulk     downloading and converting the bulk archives to Parquet
+    matcher  FEC_match_name_and_employer for a synthetic donor list
+
+For each scenario the records per second, the peak memory of the process
+and, for API downloads, the share of the time spent writing checkpoints are
+reported. No API quota is used. See mock_openfec.py for the server.
+
+Run from the repository root with the package installed:
+    python benchmarks/bench_download.py [--records N] [--scenarios api,faults,bulk,matcher]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_openfec import MockOpenFEC
+
+
+def setup_package(api_url):
+    """Points the package at the mock server, without rate limiting."""
+    import FECdownload.FECdownload as fec
+    from FECdownload.rate_limiter import RateLimiter
+    from FECdownload.http_client import HTTPClient, set_client
+    fec.api_url = api_url
+    fec.set_rate_limiter(RateLimiter(rate=1e9, period=1, burst=1e9, state_file=None))
+    set_client(HTTPClient(backoff_factor=0.05))
+    return fec
+
+
+def histogram_sum(snapshot, name):
+    return sum(entry["value"]["sum"] for entry in snapshot["histograms"].get(name, []))
+
+
+def counter(snapshot, name):
+    return sum(entry["value"] for entry in snapshot["counters"].get(name, []))
+
+
+def run_api(options):
+    fec = setup_package(options["api_url"])
+    from FECdownload.metrics import metrics, peak_memory
+    start = time.perf_counter()
+    df = fec.fec_scheduleA_year_range(1979, 2026, key="BENCH", employer=options["employer"], workers=options["workers"])
+    elapsed = time.perf_counter() - start
+    snapshot = metrics.snapshot()
+    return {
+        "records": len(df),
+        "unique": int(df["sub_id"].nunique()) if len(df) else 0,
+        "seconds": elapsed,
+        "peak_memory": peak_memory(),
+        "checkpoint_seconds": histogram_sum(snapshot, "fec_checkpoint_write_seconds"),
+        "request_seconds": histogram_sum(snapshot, "fec_request_seconds"),
+        "requests": counter(snapshot, "fec_requests_total"),
+        "retries": counter(snapshot, "fec_request_retries_total"),
+    }
+
+
+def run_bulk(options):
+    setup_package(options["api_url"])
+    from FECdownload import bulk_download
+    from FECdownload.metrics import peak_memory
+    files = [(url, f"bulk_data/contributions_{cycle}.zip") for cycle, url in options["bulk_urls"]]
+    start = time.perf_counter()
+    bulk_download.download_files(files, workers=options["workers"])
+    download_seconds = time.perf_counter() - start
+    size = sum(os.path.getsize(filename) for _, filename in files)
+    result = {"download_seconds": download_seconds, "bytes": size}
+    try:
+        from FECdownload.bulk_ingest import ingest_bulk
+        start = time.perf_counter()
+        rows = ingest_bulk(workers=options["workers"])
+        result["ingest_seconds"] = time.perf_counter() - start
+        result["records"] = sum(rows.values())
+    except ImportError:
+        result["ingest_seconds"] = None
+    result["peak_memory"] = peak_memory()
+    return result
+
+
+def run_matcher(options):
+    import pandas as pd
+    setup_package(options["api_url"])
+    from FECdownload.contributor_employer_name_matcher import FEC_match_name_and_employer
+    from FECdownload.metrics import metrics, peak_memory
+    pd.DataFrame(options["targets"]).to_stata("targets.dta", write_index=False)
+    start = time.perf_counter()
+    FEC_match_name_and_employer(
+        "targets.dta", api_key="BENCH", download_workers=options["workers"],
+        api_filter_by_employers=["Google", "Microsoft"], partial_match_employers=["GOOGLE", "MICROSOFT"],
+    )
+    elapsed = time.perf_counter() - start
+    matched = pd.read_csv("matched_names.csv")
+    stages = {
+        entry["labels"]["stage"]: entry["value"] for entry in metrics.snapshot()["gauges"].get("fec_stage_seconds", [])
+    }
+    return {"seconds": elapsed, "matched": len(matched), "stages": stages, "peak_memory": peak_memory()}
+
+
+def run_scenario(function, options):
+    """Runs a scenario in a temporary directory of a fresh process."""
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return function(options)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+def in_process(function, options):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_scenario, function, options).result()
+
+
+def checkpoint_share(result):
+    """Checkpoint writes as a share of the time the download threads were busy."""
+    busy = result["request_seconds"] + result["checkpoint_seconds"]
+    return result["checkpoint_seconds"] / busy * 100 if busy > 0 else 0
+
+
+def megabytes(value):
+    return f"{value / 2**20:.0f} MB" if value else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark downloads and matching against a mock OpenFEC server")
+    parser.add_argument("--records", type=int, default=200000, help="synthetic records over all cycles, default: 200000")
+    parser.add_argument("--workers", type=int, default=4, help="parallel downloads, default: 4")
+    parser.add_argument("--latency", type=float, default=0.01, help="server latency per API response in seconds, default: 0.01")
+    parser.add_argument("--targets", type=int, default=200, help="donors in the matcher target list, default: 200")
+    parser.add_argument("--scenarios", default="api,faults,bulk,matcher", help="comma separated scenarios, default: all")
+    parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+    results = {}
+
+    with MockOpenFEC(records=args.records, latency=args.latency) as server:
+        employer = "GOOGLE"
+        expected = sum(1 for record in server.records if employer in record["contributor_employer"])
+        options = {"api_url": server.api_url, "employer": employer, "workers": args.workers}
+
+        if "api" in scenarios:
+            result = in_process(run_api, options)
+            assert result["records"] == expected and result["unique"] == expected, "records lost or duplicated"
+            print(f"api:     {result['records']} records in {result['seconds']:.2f} s, "
+                  f"{result['records']/result['seconds']:.0f} records/s, {result['requests']} requests, "
+                  f"checkpoints {checkpoint_share(result):.1f}% of the download time, "
+                  f"peak memory {megabytes(result['peak_memory'])}")
+            results["api"] = result
+
+        if "faults" in scenarios:
+            server.rate_429, server.rate_5xx, server.rate_drop, server.retry_after = 0.02, 0.02, 0.02, 0
+            result = in_process(run_api, options)
+            server.rate_429 = server.rate_5xx = server.rate_drop = 0
+            assert result["records"] == expected and result["unique"] == expected, "records lost or duplicated"
+            print(f"faults:  {result['records']} records in {result['seconds']:.2f} s, "
+                  f"{result['records']/result['seconds']:.0f} records/s, injected {server.faults}, "
+                  f"{result['retries']} retries, no records lost")
+            results["faults"] = dict(result, injected=dict(server.faults))
+
+        if "bulk" in scenarios:
+            cycles = sorted(server.by_cycle)[-4:]
+            result = in_process(run_bulk, dict(options, bulk_urls=[(cycle, server.bulk_url(cycle)) for cycle in cycles]))
+            line = f"bulk:    {len(cycles)} files, {megabytes(result['bytes'])} in {result['download_seconds']:.2f} s"
+            if result["ingest_seconds"] is not None:
+                line += f", ingested {result['records']} records at {result['records']/result['ingest_seconds']:.0f} records/s"
+            print(f"{line}, peak memory {megabytes(result['peak_memory'])}")
+            results["bulk"] = result
+
+        if "matcher" in scenarios:
+            rng = random.Random(0)
+            donors = rng.sample([r for r in server.records if r["contributor_employer"] in ("GOOGLE", "MICROSOFT")], args.targets)
+            targets = {
+                "employer": [r["contributor_employer"].title() for r in donors],
+                "first_name": [r["contributor_first_name"] for r in donors],
+                "middle_name": [r["contributor_middle_name"] or "" for r in donors],
+                "last_name": [r["contributor_last_name"] for r in donors],
+            }
+            result = in_process(run_matcher, dict(options, targets=targets))
+            stages = ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in result["stages"].items())
+            print(f"matcher: {result['matched']} matches in {result['seconds']:.2f} s ({stages}), "
+                  f"peak memory {megabytes(result['peak_memory'])}, {server.requests} API requests in total")
+            results["matcher"] = result
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compares the row-by-row and the vectorized fuzzy first name matching.
+
+Generates a synthetic merge of contributions and target donors with typos and
+truncated first names, runs `utils.fuzzy_match_many` on all rows and the
+original `DataFrame.apply(utils.fuzzy_match)` on a sample, checks that both
+give the same result on the sample and reports the speedup.
+
+Run from the repository root with the package installed:
+    python benchmarks/bench_fuzzy_match.py [--rows N] [--sample N] [--threshold T]
+"""
+import argparse
+import random
+import string
+import time
+
+import numpy as np
+import pandas as pd
+
+from FECdownload import utils
+
+
+def perturb(name, rng):
+    """Returns a name with a typo, a truncation or unchanged."""
+    r = rng.random()
+    if r < 0.3 and len(name) > 3:
+        i = rng.randrange(len(name))
+        return name[:i] + rng.choice(string.ascii_lowercase) + name[i+1:]
+    if r < 0.5 and len(name) > 4:
+        return name[:rng.randrange(3, len(name))]
+    return name
+
+
+def synthetic_merge(rows, seed=0):
+    rng = random.Random(seed)
+    first_names = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(2000)]
+    x, y = [], []
+    for _ in range(rows):
+        name = rng.choice(first_names)
+        x.append(perturb(name, rng))
+        y.append(name if rng.random() < 0.7 else rng.choice(first_names))
+    return pd.DataFrame({
+        "canonical_first_name_x": x,
+        "canonical_first_name_y": y,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy first name matching")
+    parser.add_argument("--rows", type=int, default=1000000, help="rows in the synthetic merge, default: 1000000")
+    parser.add_argument("--sample", type=int, default=50000, help="rows matched with DataFrame.apply, default: 50000")
+    parser.add_argument("--threshold", type=float, default=70, help="fuzzy ratio threshold, default: 70")
+    args = parser.parse_args()
+
+    df = synthetic_merge(args.rows)
+    utils.fuzzy_cache.clear()
+
+    start = time.perf_counter()
+    batch = utils.fuzzy_match_many(
+        df["canonical_first_name_x"], df["canonical_first_name_y"],
+        threshold=args.threshold,
+    )
+    batch_time = time.perf_counter() - start
+
+    sample = df.iloc[:args.sample]
+    start = time.perf_counter()
+    row_by_row = sample.apply(
+        lambda row: utils.fuzzy_match(row["canonical_first_name_x"], row["canonical_first_name_y"], threshold=args.threshold),
+        axis=1
+    )
+    apply_time = (time.perf_counter() - start) * len(df) / len(sample)
+
+    assert np.array_equal(batch[:args.sample], row_by_row.to_numpy()), "results differ"
+    print(f"rows: {len(df)}, matched: {batch.sum()}")
+    print(f"apply (extrapolated from {len(sample)} rows): {apply_time:.2f} s")
+    print(f"fuzzy_match_many: {batch_time:.2f} s")
+    print(f"speedup: {apply_time/batch_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compares bare `requests.get` calls to the pooled HTTPClient.
+
+Starts a local HTTP/1.1 server that returns a Schedule A sized JSON page and
+makes the same number of requests with both. Reports the time per request,
+the number of connections opened and the bytes transferred. The difference in
+time is the handshake and transfer time saved by connection reuse and
+compression. Over TLS to the real API the savings are larger.
+
+Run from the repository root with the package installed:
+    python benchmarks/bench_http_client.py [-n REQUESTS] [--latency SECONDS]
+"""
+import argparse
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from FECdownload.http_client import HTTPClient
+
+
+def page_body(per_page=100):
+    record = {
+        "contributor_name": "DOE, JANE",
+        "contributor_employer": "GOOGLE",
+        "contributor_occupation": "ENGINEER",
+        "contribution_receipt_amount": 250.0,
+        "contribution_receipt_date": "2020-01-01T00:00:00",
+        "committee": {"committee_id": "C00000000", "name": "EXAMPLE COMMITTEE", "party": "DEM"},
+    }
+    results = [dict(record, sub_id=i) for i in range(per_page)]
+    return json.dumps({"results": results, "pagination": {"count": per_page, "last_indexes": None}}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = page_body()
+    compressed_body = gzip.compress(body)
+    latency = 0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        with lock:
+            Handler.connections += 1
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        body = self.body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = self.compressed_body
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+lock = threading.Lock()
+
+
+def run(label, get, n, url):
+    Handler.connections = 0
+    received = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        response = get(url)
+        response.json()
+        received += response.raw.tell()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed/n*1000:8.2f} ms/request {Handler.connections:6d} connections {received/n/1024:8.1f} KB/request")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pooled HTTP client against a local server")
+    parser.add_argument("-n", "--requests", type=int, default=500, help="number of requests, default: 500")
+    parser.add_argument("--latency", type=float, default=0, help="server side latency per request in seconds, default: 0")
+    args = parser.parse_args()
+
+    Handler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/schedules/schedule_a/"
+
+    bare = run("requests.get", lambda u: requests.get(u, headers={"Accept-Encoding": "identity"}), args.requests, url)
+    client = HTTPClient()
+    pooled = run("HTTPClient", client.get, args.requests, url)
+    print(f"saved {(bare - pooled)/args.requests*1000:.2f} ms/request ({(1 - pooled/bare)*100:.0f}%)")
+    print(client.stats())
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
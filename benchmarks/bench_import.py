@@ -0,0 +1,101 @@
+"""Measures the import time of the package and checks that imports stay lazy.
+
+Each statement is run in a fresh interpreter, several times, and the median
+wall time is reported. Statements that should not load the heavy
+dependencies (pandas, requests, tqdm, thefuzz, rapidfuzz, nicknames) are
+checked against `sys.modules`, and `python -X importtime` lists the slowest
+modules imported by the matcher.
+
+Exits with an error if a lazy statement loads a heavy dependency, or takes
+longer than --max-seconds, so it can be run in CI to keep startup fast.
+
+Run from the repository root with the package installed:
+    python benchmarks/bench_import.py [--repeat N] [--max-seconds S]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+heavy_modules = ["pandas", "requests", "tqdm", "thefuzz", "rapidfuzz", "nicknames", "pyarrow"]
+
+# (statement, True if it should not load any heavy module)
+statements = [
+    ("import FECdownload", True),
+    ("import FECdownload.job_queue", True),
+    ("import FECdownload.metrics", True),
+    ("from FECdownload import fec_scheduleA_year_range", False),
+    ("from FECdownload import contributor_employer_name_matcher", False),
+    ("from FECdownload.name_groups import nicknamer; nicknamer()", False),
+]
+
+check = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(statement):
+    """Returns the time a statement took and the heavy modules it loaded."""
+    output = subprocess.run(
+        [sys.executable, "-c", check.format(statement=statement, heavy=heavy_modules)],
+        capture_output=True, text=True, check=True, cwd=repository,
+    ).stdout.split()
+    return float(output[0]), output[1].split(",") if len(output) > 1 else []
+
+
+def slowest_imports(statement, count = 10):
+    """Returns the modules with the largest cumulative import time, from -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, check=True, cwd=repository,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        # Only top level entries, nested imports are included in their parent
+        if module.startswith(" ") and not module.startswith("  "):
+            rows.append((int(cumulative), module.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of FECdownload")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each statement, default: 5")
+    parser.add_argument("--max-seconds", type=float, default=0.1, help="time allowed for lazy statements, default: 0.1")
+    args = parser.parse_args()
+
+    failures = []
+    for statement, lazy in statements:
+        times = []
+        for _ in range(args.repeat):
+            elapsed, loaded = run(statement)
+            times.append(elapsed)
+        median = statistics.median(times)
+        print(f"{median*1000:8.1f} ms  {statement}" + (f"  (loads {', '.join(loaded)})" if loaded else ""))
+        if lazy and loaded:
+            failures.append(f"{statement} loads {', '.join(loaded)}")
+        if lazy and median > args.max_seconds:
+            failures.append(f"{statement} takes {median:.3f} s")
+
+    statement = "from FECdownload import contributor_employer_name_matcher"
+    print(f"\nslowest imports of: {statement}")
+    for cumulative, module in slowest_imports(statement):
+        print(f"{cumulative/1000:8.1f} ms  {module}")
+
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
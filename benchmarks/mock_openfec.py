@@ -0,0 +1,349 @@
+"""A local stand-in for the OpenFEC API and the FEC bulk file server.
+
+Serves `/v1/schedules/schedule_a/` from a synthetic, deterministic set of
+individual contributions, with `last_indexes` keyset pagination,
+`pagination.count` and the filters the package uses (two-year period,
+employer, one or more contributor names, receipt date and load date
+ranges, and `sort_null_only` for records without a receipt date). Records
+without a receipt date come first, as with `sort_nulls_last=false`. Counts
+above `exact_count_limit` are reported as estimates, as the API does. Bulk archives of the same contributions are served at
+`/files/bulk-downloads/<year>/indiv<yy>.zip`, with ETag and Range support.
+
+Faults can be injected into API responses: a fixed and a per-record latency,
+and a fraction of 429 responses, 5xx responses and connections dropped part
+way through the body.
+
+Used by the benchmarks in this directory:
+    with MockOpenFEC(records=100000) as server:
+        FECdownload.FECdownload.api_url = server.api_url
+        ...
+"""
+import datetime
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+first_names = ["JOHN", "JANE", "ROBERT", "BOB", "WILLIAM", "BILL", "MARY", "ELIZABETH", "LIZ", "MICHAEL",
+               "MIKE", "JENNIFER", "DAVID", "SARAH", "JAMES", "JIM", "LINDA", "RICHARD", "DICK", "SUSAN"]
+employers = ["GOOGLE", "GOOGLE LLC", "MICROSOFT", "MICROSOFT CORP", "MSFT", "EY", "ERNST & YOUNG",
+             "SELF-EMPLOYED", "RETIRED", "NOT EMPLOYED", "ACME INC", "UNIVERSITY OF NOWHERE"]
+states = ["CA", "WA", "NY", "TX", "MA", "IL", "FL", "OR"]
+
+
+def make_records(count, last_names = 2000, first_cycle = 1980, last_cycle = 2026, seed = 0, undated = 0):
+    """Generates synthetic Schedule A records, spread evenly over the cycles.
+
+    A fraction `undated` of the records have no receipt date.
+    """
+    rng = random.Random(seed)
+    surnames = [f"SURNAME{i}" for i in range(last_names)]
+    cycles = list(range(first_cycle, last_cycle + 1, 2))
+    records = []
+    for sub_id in range(1, count + 1):
+        cycle = cycles[sub_id % len(cycles)]
+        date = datetime.date(cycle - 1, 1, 1) + datetime.timedelta(days=rng.randrange(730))
+        last = rng.choice(surnames)
+        first = rng.choice(first_names)
+        middle = rng.choice(["", "A", "B", "C", "J", "M"])
+        records.append({
+            "sub_id": str(4000000000000000000 + sub_id),
+            "two_year_transaction_period": cycle,
+            "committee_id": f"C{sub_id % 500:08d}",
+            "committee": {"committee_id": f"C{sub_id % 500:08d}", "name": f"COMMITTEE {sub_id % 500}", "party": rng.choice(["DEM", "REP", None])},
+            "contributor_name": f"{last}, {first} {middle}".strip(),
+            "contributor_last_name": last,
+            "contributor_first_name": first,
+            "contributor_middle_name": middle or None,
+            "contributor_city": "SPRINGFIELD",
+            "contributor_state": rng.choice(states),
+            "contributor_zip": f"{rng.randrange(100000000):09d}",
+            "contributor_employer": rng.choice(employers),
+            "contributor_occupation": "ENGINEER",
+            "contribution_receipt_date": None if undated and rng.random() < undated else date.isoformat() + "T00:00:00",
+            "contribution_receipt_amount": float(rng.randrange(1, 5000)),
+            "receipt_type": "15",
+            "entity_type": "IND",
+            "memo_code": None,
+            "memo_text": None,
+            "transaction_id": f"T{sub_id}",
+            "file_number": 1000000 + sub_id % 1000,
+            "image_number": f"2019{sub_id:014d}",
+            "amendment_indicator": "N",
+            "report_type": "Q1",
+            "load_date": (date + datetime.timedelta(days=30)).isoformat() + "T00:00:00",
+        })
+    return records
+
+
+def bulk_line(record):
+    """Formats a record as a line of the itcont.txt bulk file."""
+    date = (record["contribution_receipt_date"] or "")[:10]
+    return "|".join([
+        record["committee_id"], record["amendment_indicator"], record["report_type"], "P",
+        record["image_number"], record["receipt_type"], record["entity_type"], record["contributor_name"],
+        record["contributor_city"], record["contributor_state"], record["contributor_zip"],
+        record["contributor_employer"], record["contributor_occupation"],
+        date[5:7] + date[8:10] + date[0:4], str(int(record["contribution_receipt_amount"])), "",
+        record["transaction_id"], str(record["file_number"]), "", "", record["sub_id"],
+    ])
+
+
+def sort_key(record):
+    """Keyset order of the records, without a receipt date first."""
+    return (record["contribution_receipt_date"] or "", record["sub_id"])
+
+
+def name_words(name):
+    return set(name.upper().replace(",", " ").split())
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server_version = "MockOpenFEC"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, headers = ()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        mock = self.server.mock
+        path = urlparse(self.path).path
+        if path.rstrip("/") == "/v1/schedules/schedule_a":
+            self.schedule_a(mock)
+        elif path in mock.bulk_files:
+            self.bulk_file(mock, path)
+        else:
+            self.send_body(404, b"not found")
+
+    def do_HEAD(self):
+        mock = self.server.mock
+        path = urlparse(self.path).path
+        if path not in mock.bulk_files:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data, etag, modified = mock.bulk_file(path)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", modified)
+        self.end_headers()
+
+    def schedule_a(self, mock):
+        query = parse_qs(urlparse(self.path).query)
+        mock.count_request()
+        fault = mock.fault()
+        if fault == "429":
+            self.send_body(429, b'{"error": "rate limited"}', [("Retry-After", str(mock.retry_after))])
+            return
+        if fault == "5xx":
+            self.send_body(503, b'{"error": "unavailable"}')
+            return
+
+        per_page = min(int(query.get("per_page", ["20"])[0]), 100)
+        matches = mock.select(query)
+        start = 0
+        if "last_index" in query:
+            key = (query.get("last_contribution_receipt_date", [""])[0], query["last_index"][0])
+            start = mock.position(matches, key)
+        page = matches[start:start + per_page]
+        last_indexes = None
+        if len(page) == per_page and start + per_page < len(matches):
+            last_indexes = {
+                "last_index": page[-1]["sub_id"],
+                "last_contribution_receipt_date": page[-1]["contribution_receipt_date"],
+            }
+        exact = mock.exact_count_limit is None or len(matches) <= mock.exact_count_limit
+        body = json.dumps({
+            "api_version": "1.0",
+            "results": page,
+            "pagination": {"count": len(matches), "is_count_exact": exact, "per_page": per_page, "last_indexes": last_indexes},
+        }).encode("utf-8")
+
+        time.sleep(mock.latency + mock.record_latency * len(page))
+        if fault == "drop":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.send_body(200, body, [("Content-Type", "application/json")])
+
+    def bulk_file(self, mock, path):
+        data, etag, modified = mock.bulk_file(path)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_body(304, b"")
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") in (None, etag, modified):
+            start = int(range_header.split("=")[1].split("-")[0])
+        headers = [("ETag", etag), ("Last-Modified", modified)]
+        if start > 0:
+            headers.append(("Content-Range", f"bytes {start}-{len(data)-1}/{len(data)}"))
+        self.send_body(206 if start > 0 else 200, data[start:], headers)
+
+
+class MockOpenFEC:
+    """Runs the mock server in a background thread.
+
+    Args:
+        records (int): number of synthetic records (default: 100000)
+        latency (float): seconds added to every API response (default: 0)
+        record_latency (float): seconds added per record in a page (default: 0)
+        rate_429 (float): fraction of API requests answered with 429 (default: 0)
+        rate_5xx (float): fraction of API requests answered with 503 (default: 0)
+        rate_drop (float): fraction of API responses cut off part way (default: 0)
+        retry_after (int): Retry-After seconds sent with 429 responses (default: 1)
+        seed (int): seed of the data and of the fault injection (default: 0)
+        undated (float): fraction of records without a receipt date (default: 0)
+        exact_count_limit (int): larger counts are reported as estimates,
+            None for exact counts only (default: None)
+    """
+    def __init__(self, records = 100000, latency = 0, record_latency = 0, rate_429 = 0, rate_5xx = 0, rate_drop = 0, retry_after = 1, seed = 0, undated = 0, exact_count_limit = None):
+        self.records = make_records(records, seed=seed, undated=undated)
+        self.exact_count_limit = exact_count_limit
+        self.records.sort(key=sort_key)
+        self.by_cycle = {}
+        for record in self.records:
+            self.by_cycle.setdefault(record["two_year_transaction_period"], []).append(record)
+        self.latency = latency
+        self.record_latency = record_latency
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_drop = rate_drop
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.faults = {}
+        self.cache = {}
+        self.bulk_files = {
+            f"/files/bulk-downloads/{cycle}/indiv{str(cycle)[-2:]}.zip": cycle for cycle in self.by_cycle
+        }
+        self.bulk_data = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def api_url(self):
+        return f"{self.url}/v1/schedules/schedule_a/"
+
+    def bulk_url(self, cycle):
+        return f"{self.url}/files/bulk-downloads/{cycle}/indiv{str(cycle)[-2:]}.zip"
+
+    def add(self, record):
+        """Adds a record, as if it was loaded after the server started."""
+        with self.lock:
+            self.records.append(record)
+            self.records.sort(key=sort_key)
+            records = self.by_cycle.setdefault(record["two_year_transaction_period"], [])
+            records.append(record)
+            records.sort(key=sort_key)
+            self.cache.clear()
+            self.bulk_data.clear()
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def fault(self):
+        """Draws the fault, if any, injected into the next response."""
+        with self.lock:
+            r = self.random.random()
+            for fault, rate in [("429", self.rate_429), ("5xx", self.rate_5xx), ("drop", self.rate_drop)]:
+                if r < rate:
+                    self.faults[fault] = self.faults.get(fault, 0) + 1
+                    return fault
+                r -= rate
+        return None
+
+    def select(self, query):
+        """Returns the records matching the filters of a query, in keyset order."""
+        key = tuple(sorted((k, tuple(v)) for k, v in query.items() if not k.startswith("last_") and k not in ("per_page", "page", "api_key")))
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        records = self.by_cycle.get(int(query.get("two_year_transaction_period", ["0"])[0]), [])
+        if "contributor_employer" in query:
+            employer = query["contributor_employer"][0].upper()
+            records = [r for r in records if employer in r["contributor_employer"]]
+        if "contributor_name" in query:
+            names = [name_words(name) for name in query["contributor_name"]]
+            records = [r for r in records if any(words <= name_words(r["contributor_name"]) for words in names)]
+        if query.get("sort_null_only", ["false"])[0] == "true":
+            records = [r for r in records if r["contribution_receipt_date"] is None]
+        if "min_date" in query:
+            records = [r for r in records if (r["contribution_receipt_date"] or "")[:10] >= query["min_date"][0]]
+        if "max_date" in query:
+            records = [r for r in records if r["contribution_receipt_date"] is not None and r["contribution_receipt_date"][:10] <= query["max_date"][0]]
+        if "min_load_date" in query:
+            records = [r for r in records if r["load_date"][:10] >= query["min_load_date"][0]]
+        with self.lock:
+            self.cache[key] = records
+        return records
+
+    @staticmethod
+    def position(records, key):
+        """Returns the index of the first record after a keyset cursor."""
+        low, high = 0, len(records)
+        while low < high:
+            middle = (low + high) // 2
+            record = records[middle]
+            if sort_key(record) <= key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def bulk_file(self, path):
+        """Returns the archive, ETag and Last-Modified of a bulk file."""
+        with self.lock:
+            if path not in self.bulk_data:
+                cycle = self.bulk_files[path]
+                text = "\n".join(bulk_line(record) for record in self.by_cycle[cycle]) + "\n"
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                    archive.writestr("itcont.txt", text.encode("latin1"))
+                data = buffer.getvalue()
+                etag = '"' + hashlib.md5(data).hexdigest() + '"'
+                self.bulk_data[path] = (data, etag, formatdate(usegmt=True))
+            return self.bulk_data[path]
@@ -1,31 +1,77 @@
 import argparse
-from FECdownload import fec_scheduleA_year_range
 
 
 def main():
     parser = argparse.ArgumentParser(description="Fetch data from FEC API")
-    parser.add_argument("-k", "--api_key", metavar="", default="DEMO_KEY", help="your FEC API key, default: DEMO_KEY")
+    parser.add_argument("-k", "--api_key", metavar="", default="DEMO_KEY", help="your FEC API key, or a comma separated list of keys to spread requests over, default: DEMO_KEY")
     parser.add_argument("-s", "--start", metavar="", default=1990, help="The first year for which data is requested. The data is returned in 2 year chunks and earlier data may be returned.")
     parser.add_argument("-e", "--end", metavar="", default=2025, help="The last year for which data is requested. The data is returned in 2 year chunks and later data may be returned.")
     parser.add_argument("-E", "--employer", metavar="", default=None, help="The employer for which data is requested. If not provided, all employers are requested.")
+    parser.add_argument("-w", "--workers", metavar="", default=1, type=int, help="Number of two-year periods to download at the same time. Default: 1")
     parser.add_argument("-o", "--output", metavar="", default=None, help="Output file name. Default: fec_scheduleA_[EMPLOYER_]START_END.json")
+    parser.add_argument("-f", "--format", metavar="", default=None, choices=["parquet", "arrow", "csv"], help="Write the data as it arrives to a directory of parquet, arrow or csv files partitioned by two-year period. Memory use does not depend on the size of the data. Default: write a single csv file at the end.")
+    parser.add_argument("--shard-size", metavar="", default=None, type=int, help="Split each two-year period into date ranges of about this many records and download --workers ranges at the same time. Default: do not split")
+    parser.add_argument("--no-committee", action="store_true", help="Keep only the committee id of each record, not the nested committee fields. They can be added back from the bulk committee files, see FECdownload.committees.")
+    parser.add_argument("--sync", metavar="", default=None, help="Update a local contributions store (an SQLite file) instead of writing a file. Only records loaded since the previous sync are requested.")
+    parser.add_argument("--cache", metavar="", default=None, help="Keep API responses in this directory and answer repeated requests from it, without using quota.")
+    parser.add_argument("--cache-ttl", metavar="", default=7*24*3600, type=float, help="Seconds a cached response is used. Default: 604800 (7 days)")
+    parser.add_argument("--offline", action="store_true", help="Only replay responses from the --cache directory (default: cache/responses), without sending requests.")
+    parser.add_argument("--metrics-json", metavar="", default=None, help="Write request metrics to this JSON file every 15 seconds.")
+    parser.add_argument("--metrics-textfile", metavar="", default=None, help="Write request metrics to this Prometheus textfile every 15 seconds, for the node exporter textfile collector.")
     args = parser.parse_args()
+    if args.sync is not None and args.offline:
+        parser.error("--sync requests new records from the API and cannot be used with --offline")
+
+    # Imported after parsing the arguments, so that --help is fast
+    from FECdownload.metrics import metrics
+    if args.metrics_json or args.metrics_textfile:
+        metrics.start(args.metrics_json, args.metrics_textfile)
+    try:
+        download(args)
+    finally:
+        metrics.stop()
+
+
+def download(args):
+    from FECdownload import fec_scheduleA_year_range, fec_scheduleA_to_file
 
     if args.api_key == "DEMO_KEY":
         print("Warning: Using DEMO_KEY. This API key is rate-limited and should not be used for production. Get a personal key at https://api.data.gov/signup.")
     
+    api_key = args.api_key
+    if "," in api_key:
+        api_key = api_key.split(",")
+
     start = int(args.start)
     end = int(args.end)
 
+    if args.cache is not None or args.offline:
+        from FECdownload.http_client import HTTPClient, set_client
+        from FECdownload.response_cache import ResponseCache, cache_dir
+        cache = ResponseCache(args.cache or cache_dir, ttl=args.cache_ttl, offline=args.offline)
+        set_client(HTTPClient(cache=cache))
+
+    if args.sync is not None:
+        from FECdownload.store import ContributionStore
+        received = ContributionStore(args.sync).sync(start, end, api_key, args.employer)
+        print(f"Received {received} records")
+        return
+
     if args.output is None:
         if args.employer is not None:
-            output_filename = f"fec_scheduleA_{args.employer}_{start}_{end}.json"
+            output_filename = f"fec_scheduleA_{args.employer}_{start}_{end}"
         else:
-            output_filename = f"fec_scheduleA_{start}_{end}.json"
+            output_filename = f"fec_scheduleA_{start}_{end}"
+        if args.format is None:
+            output_filename = f"{output_filename}.json"
     else:
         output_filename = args.output
 
-    data = fec_scheduleA_year_range(start, end, args.api_key, args.employer)
+    if args.format is not None:
+        fec_scheduleA_to_file(start, end, output_filename, args.format, api_key, args.employer, workers=args.workers, shard_size=args.shard_size, committee=not args.no_committee)
+        return
+
+    data = fec_scheduleA_year_range(start, end, api_key, args.employer, workers=args.workers, shard_size=args.shard_size, committee=not args.no_committee)
     data.to_csv(output_filename)
 
 
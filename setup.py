@@ -25,8 +25,11 @@ setup(
             'download_scheduleA=download_scheduleA:main',
         ],
     },
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     install_requires=requirements,
+    extras_require={
+        "parquet": ["pyarrow"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Development Status :: 3 - Alpha",
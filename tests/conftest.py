@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in an empty directory, for the checkpoints and caches."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def openfec(request, workdir, monkeypatch):
+    """Points the package at a mock OpenFEC API, without rate limiting.
+
+    Options of the mock can be given with indirect parametrization.
+    """
+    from mock_openfec import MockOpenFEC
+    import FECdownload.FECdownload as fec
+    import FECdownload.http_client as http_client
+    from FECdownload.rate_limiter import RateLimiter
+
+    options = dict(records=5000, **getattr(request, "param", {}))
+    with MockOpenFEC(**options) as server:
+        monkeypatch.setattr(fec, "api_url", server.api_url)
+        monkeypatch.setattr(fec, "default_limiter", RateLimiter(rate=1e9, period=1, burst=1e9, state_file=None))
+        monkeypatch.setattr(http_client, "default_client", http_client.HTTPClient(backoff_factor=0.05))
+        yield server
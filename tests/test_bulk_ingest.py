@@ -0,0 +1,100 @@
+import zipfile
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+
+from FECdownload import bulk_ingest
+from FECdownload.metrics import metrics
+
+states = ["CA", "WA", "NY", "TX", "MA", "IL", "FL", "OR"]
+
+
+def contribution_line(i):
+    fields = [f"C{i % 50:08d}", "N", "Q1", "P", f"{i}", "15", "IND", f"SMITH{i}, JOHN", "SPRINGFIELD",
+              states[i % len(states)], "12345", "ACME", "ENGINEER", "01152024", "100", "", f"T{i}", "1", "", "", f"{i}"]
+    return "|".join(fields)
+
+
+@pytest.fixture
+def archive(workdir):
+    lines = [contribution_line(i) for i in range(1, 2001)]
+    # Two malformed rows, with too few and too many fields
+    lines.insert(10, "C00000001|N|Q1")
+    lines.insert(500, contribution_line(0) + "|extra")
+    path = workdir / "contributions_2024.zip"
+    with zipfile.ZipFile(path, "w") as f:
+        f.writestr("itcont.txt", "\n".join(lines) + "\n")
+    return str(path)
+
+
+def skipped_count():
+    return sum(metrics.counters.get("fec_bulk_skipped_rows_total", {}).values())
+
+
+def test_malformed_rows_are_counted(archive, workdir, capsys):
+    skipped = skipped_count()
+    rows = bulk_ingest.ingest_file(archive, str(workdir / "out"), 2024)
+
+    assert rows == 2000
+    assert skipped_count() == skipped + 2
+    assert "Skipped 2 malformed rows" in capsys.readouterr().out
+
+
+def test_buffered_rows_are_capped(archive, workdir, monkeypatch):
+    monkeypatch.setattr(bulk_ingest, "block_size", 16 * 1024)
+    written = []
+    write_table = pq.ParquetWriter.write_table
+
+    def record(self, table, *args, **kwargs):
+        written.append(table.num_rows)
+        return write_table(self, table, *args, **kwargs)
+
+    monkeypatch.setattr(pq.ParquetWriter, "write_table", record)
+    rows = bulk_ingest.ingest_file(
+        archive, str(workdir / "out"), 2024, partition_by="state", row_group_size=10**6, max_buffered_rows=300
+    )
+
+    assert rows == 2000
+    # Without the cap, each partition would be written once, at the end
+    assert len(written) > len(states)
+    assert max(written) <= 300
+    table = pa.concat_tables(
+        pq.read_table(str(workdir / "out" / "cycle=2024" / f"state={state}" / "part-0.parquet")) for state in states
+    )
+    assert sorted(table["SUB_ID"].to_pylist()) == list(range(1, 2001))
+
+
+def dataset_rows(path):
+    import pyarrow.dataset as ds
+    return ds.dataset(path, partitioning="hive").count_rows()
+
+
+def test_ingest_again_replaces_the_cycle(archive, workdir):
+    output = str(workdir / "out")
+    bulk_ingest.ingest_file(archive, output, 2024)
+    bulk_ingest.ingest_file(archive, output, 2024, partition_by="state")
+
+    assert dataset_rows(output) == 2000
+    assert not (workdir / "out" / "cycle=2024" / "part-0.parquet").exists()
+    assert sorted(p.name for p in (workdir / "out").iterdir()) == ["cycle=2024"]
+
+
+def test_failed_ingest_keeps_the_old_files(archive, workdir, monkeypatch):
+    output = str(workdir / "out")
+    bulk_ingest.ingest_file(archive, output, 2024)
+    batches = bulk_ingest.iter_bulk_batches
+
+    def fail(*args, **kwargs):
+        for batch in batches(*args, **kwargs):
+            yield batch
+            raise OSError("interrupted")
+
+    monkeypatch.setattr(bulk_ingest, "block_size", 16 * 1024)
+    monkeypatch.setattr(bulk_ingest, "iter_bulk_batches", fail)
+    with pytest.raises(OSError):
+        bulk_ingest.ingest_file(archive, output, 2024, partition_by="state")
+
+    assert dataset_rows(output) == 2000
+    assert sorted(p.name for p in (workdir / "out").iterdir()) == ["cycle=2024"]
@@ -0,0 +1,66 @@
+import random
+import zipfile
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from FECdownload import bulk_ingest, bulk_matcher
+from FECdownload.contributor_employer_name_matcher import match_names
+from FECdownload.store import bulk_fields
+
+last_names = ["SMITH", "JONES", "O'NEIL", "DOE", "NGUYEN"]
+first_names = ["JOHN", "JON", "JONATHAN", "ROBERT", "BOB", "ROBBIE", "JANE", "ANN", "ANNE"]
+middle_names = ["", "A", "B", "ALAN", "BETH"]
+employers = ["GOOGLE", "GOOGLE LLC", "ACME", "SELF"]
+
+targets = pd.DataFrame({
+    "first_name": ["John", "Robert", "Jane", "Ann", "Bob"],
+    "middle_name": ["A", None, "B", None, "Alan"],
+    "last_name": ["Smith", "Jones", "Doe", "O'Neil", "Smith"],
+    "donor_id": [1, 2, 3, 4, 5],
+})
+
+
+def contribution_line(i, rng):
+    name = f"{rng.choice(last_names)}, {rng.choice(first_names)} {rng.choice(middle_names)}".strip()
+    fields = [f"C{i % 7:08d}", "N", "Q1", "P", f"{i}", "15", "IND", name, "SPRINGFIELD",
+              "CA", "12345", rng.choice(employers), "ENGINEER", "01152024", "100", "", f"T{i}", "1", "", "", f"{i}"]
+    return "|".join(fields)
+
+
+def reference_match(path, employer_filter):
+    """match_names on all bulk rows, split into names as partition_file does."""
+    df = pd.read_parquet(path).rename(columns=bulk_fields)
+    df = df.drop(columns=[column for column in df.columns if column.startswith("cycle")])
+    df["contributor_last_name"] = df["contributor_name"].str.partition(",")[0].str.strip()
+    rest = df["contributor_name"].str.partition(",")[2].str.split()
+    df["contributor_first_name"] = rest.str[0]
+    df["contributor_middle_name"] = rest.str[1]
+    df = df[df["contributor_employer"].isin(employer_filter)]
+    matched, _ = match_names(df, targets, "first_name", "middle_name", "last_name", 0.7)
+    return matched
+
+
+def pairs(df):
+    return sorted(zip(df["sub_id"].astype(int), df["donor_id"].astype(int)))
+
+
+def test_match_bulk_equals_match_names(workdir):
+    rng = random.Random(3)
+    archive = workdir / "contributions_2024.zip"
+    with zipfile.ZipFile(archive, "w") as f:
+        f.writestr("itcont.txt", "\n".join(contribution_line(i, rng) for i in range(1, 1001)) + "\n")
+    bulk_ingest.ingest_file(str(archive), "bulk", 2024)
+
+    matched, unmatched = bulk_matcher.match_bulk(
+        targets, path="bulk", output="matches", exact_match_employers=["GOOGLE", "GOOGLE LLC"],
+        partitions=3, workers=2,
+    )
+    result = pd.read_parquet("matches/matched")
+    expected = reference_match("bulk/cycle=2024", ["GOOGLE", "GOOGLE LLC"])
+
+    assert matched == len(result) > 0
+    assert pairs(result) == pairs(expected)
+    assert len(set(donor for _, donor in pairs(result))) > 1
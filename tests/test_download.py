@@ -0,0 +1,104 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import FECdownload.FECdownload as fec
+
+
+def query(cycle = 2024):
+    return fec.scheduleA_parameters(cycle - 1, cycle - 1)[0]
+
+
+def test_without_committee_nothing_keeps_the_nested_committee(openfec):
+    hooked = []
+    pages = list(fec.iter_pages(query(), hooks=[lambda year, page: hooked.extend(page)], committee=False))
+
+    items = [item for page in pages for item in page]
+    assert len(items) > 100
+    assert all("committee" not in item and "committee_id" in item for item in items)
+    assert all("committee" not in item for item in hooked)
+    journal = list(fec.checkpoint_entries(2024, None, None))
+    assert len(journal) == len(items)
+    assert all("committee" not in item for item in journal)
+
+
+def test_without_committee_resumed_pages_drop_the_committee(openfec):
+    # A checkpoint written with the committee, resumed without it
+    parameters = query()
+    for page in fec.iter_pages(parameters):
+        break
+    assert all("committee" in item for item in fec.checkpoint_entries(2024, None, None))
+
+    items = [item for page in fec.iter_pages(query(), committee=False) for item in page]
+    assert all("committee" not in item for item in items)
+
+
+def test_checkpoint_directory_created_by_another_download(workdir, monkeypatch):
+    # Another download creates the directory between the check and makedirs
+    exists = os.path.exists
+    monkeypatch.setattr(os.path, "exists", lambda path: False if path == "checkpoints" else exists(path))
+    os.makedirs("checkpoints")
+
+    fec.checkpoint_dump({"last_indexes": None}, [{"sub_id": "1"}], 1, 2024, None, None)
+    assert list(fec.checkpoint_entries(2024, None, None)) == [{"sub_id": "1"}]
+
+
+def test_parallel_checkpoint_writes(workdir):
+    years = list(range(1980, 2028, 2))
+    barrier = threading.Barrier(len(years))
+
+    def write(year):
+        barrier.wait()
+        fec.checkpoint_dump({"last_indexes": None}, [{"sub_id": str(year)}], 1, year, None, None)
+
+    with ThreadPoolExecutor(max_workers=len(years)) as executor:
+        list(executor.map(write, years))
+    for year in years:
+        assert list(fec.checkpoint_entries(year, None, None)) == [{"sub_id": str(year)}]
+
+
+def test_shards_cover_all_results(openfec):
+    shards = fec.shard_parameters(query(), shard_size=50)
+    assert len(shards) > 1
+
+    total = sum(len(fec.download_pages(shard)) for shard in shards)
+    assert total == len(fec.download_pages(query()))
+
+
+@pytest.mark.parametrize("openfec", [{"undated": 0.05, "exact_count_limit": 20}], indirect=True)
+def test_sharded_download_with_estimated_counts_and_undated_records(openfec):
+    expected = {r["sub_id"] for r in openfec.by_cycle[2024]}
+    assert any(r["contribution_receipt_date"] is None for r in openfec.by_cycle[2024])
+
+    shards = fec.shard_parameters(query(), shard_size=50)
+    assert len(shards) > 2
+    assert shards[-1]["sort_null_only"] == "true"
+    entries = fec.download_sharded([query()], workers=4, shard_size=50)[0]
+    assert sorted(item["sub_id"] for item in entries) == sorted(expected)
+
+
+def test_name_batch_plan_is_reused(openfec):
+    parameter_list = fec.scheduleA_parameters(2019, 2023)
+    names = [f"SURNAME{i}" for i in range(60)]
+    plan = fec.plan_name_batches(parameter_list, names, max_results=20)
+    assert len(plan) > 1
+    assert sorted(name for batch in plan for name in batch) == sorted(names)
+
+    # A resumed run sends no probes and gets the same batches
+    requests = openfec.requests
+    assert fec.plan_name_batches(parameter_list, names, max_results=20) == plan
+    assert openfec.requests == requests
+    # Other limits are planned again
+    fec.plan_name_batches(parameter_list, names, max_results=40)
+    assert openfec.requests > requests
+
+
+def test_star_import_exports_the_download_functions():
+    namespace = {}
+    exec("from FECdownload import *", namespace)
+
+    assert namespace["fec_scheduleA_year_range"] is fec.fec_scheduleA_year_range
+    assert namespace["iter_scheduleA"] is fec.iter_scheduleA
+    assert hasattr(namespace["contributor_employer_name_matcher"], "FEC_match_name_and_employer")
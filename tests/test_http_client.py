@@ -0,0 +1,60 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from FECdownload.FECdownload import make_request
+from FECdownload.http_client import HTTPClient
+from FECdownload.metrics import metrics
+from FECdownload.rate_limiter import RateLimiter
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests += 1
+        body = b'{"error": "rate limited"}'
+        self.send_response(429)
+        self.send_header("Retry-After", "120")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    RateLimitedHandler.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def rate_limited_count():
+    return sum(metrics.counters.get("fec_rate_limited_total", {}).values())
+
+
+def test_429_with_retry_after_blocks_limiter(server):
+    limiter = RateLimiter(state_file=None)
+    client = HTTPClient(retries=3, backoff_factor=0)
+    rate_limited = rate_limited_count()
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        make_request(server, {"api_key": "KEY"}, max_tries=1, sleep_time=0, limiter=limiter, client=client)
+
+    # The adapter did not retry the 429 on its own
+    assert RateLimitedHandler.requests == 1
+    assert rate_limited_count() == rate_limited + 1
+    with limiter.state() as buckets:
+        bucket = limiter.bucket(buckets, "KEY", time.time())
+    assert bucket["blocked_until"] > time.time() + 100
+    assert bucket["tokens"] < 1
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from FECdownload.job_queue import JobQueue, PENDING, RUNNING, DONE
+
+
+def test_run_does_not_wait_for_jobs_of_its_own_process(workdir):
+    queue = JobQueue("jobs.sqlite")
+    queue.add("slow", {"seconds": 2})
+    started = threading.Event()
+
+    def job(seconds):
+        started.set()
+        time.sleep(seconds)
+
+    thread = threading.Thread(target=queue.run, args=(job,))
+    thread.start()
+    started.wait(5)
+
+    # Only a job of another thread of this process is running
+    start = time.time()
+    assert JobQueue("jobs.sqlite").run(job, poll_time=30) == 0
+    assert time.time() - start < 5
+    thread.join()
+    assert JobQueue("jobs.sqlite").counts() == {DONE: 1}
+
+
+def test_run_waits_for_jobs_of_other_processes(workdir):
+    queue = JobQueue("jobs.sqlite", lease_time=1)
+    queue.add("crashed", {})
+    # Leased by a worker of another process, which stops sending heartbeats
+    queue.connection().execute(
+        "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, tries = 1",
+        (RUNNING, "otherhost:1:1", time.time() + 1)
+    )
+
+    ran = []
+    assert queue.run(lambda: ran.append(True), poll_time=0.2) == 1
+    assert ran == [True]
+
+
+def test_add_returns_done_job_to_the_queue(workdir):
+    queue = JobQueue("jobs.sqlite")
+    queue.add("job", {"n": 1})
+    assert queue.run(lambda n: None, poll_time=0) == 1
+
+    # Already done and its output exists
+    queue.add("job", {"n": 1}, done=True)
+    assert queue.counts() == {DONE: 1}
+    # Its output was deleted
+    queue.add("job", {"n": 1})
+    assert queue.counts() == {PENDING: 1}
+    assert queue.run(lambda n: None, poll_time=0) == 1
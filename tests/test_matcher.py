@@ -0,0 +1,32 @@
+import os
+
+import pandas as pd
+
+from FECdownload.contributor_employer_name_matcher import FEC_match_name_and_employer
+
+
+def donors(openfec):
+    records = [r for r in openfec.records if "GOOGLE" in r["contributor_employer"]][:20]
+    return pd.DataFrame({
+        "first_name": [r["contributor_first_name"] for r in records],
+        "middle_name": [r["contributor_middle_name"] or "" for r in records],
+        "last_name": [r["contributor_last_name"] for r in records],
+        "employer": ["GOOGLE"] * len(records),
+    })
+
+
+def match(target):
+    FEC_match_name_and_employer(target, api_filter_by_employers=["GOOGLE"], partial_match_employers=["GOOGLE"])
+    return pd.read_csv("matched_names.csv")
+
+
+def test_rerun_downloads_deleted_files(openfec):
+    target = donors(openfec)
+    matched = match(target)
+    assert len(matched) > 0
+
+    filename = "by_employer/downloaded_GOOGLE.csv"
+    os.remove(filename)
+    rerun = match(target)
+    assert os.path.getsize(filename) > 0
+    assert len(rerun) == len(matched)
@@ -0,0 +1,28 @@
+import pytest
+
+from FECdownload.metrics import Metrics
+
+
+def gauge(metrics, name, stage):
+    return metrics.gauges.get(name, {}).get((("stage", stage),))
+
+
+def test_stage_that_raises_is_recorded():
+    metrics = Metrics()
+    with pytest.raises(ValueError):
+        with metrics.stage("match"):
+            raise ValueError("failed")
+
+    assert gauge(metrics, "fec_stage_seconds", "match") is not None
+    assert gauge(metrics, "fec_stage_last_completed_timestamp_seconds", "match") is None
+    assert metrics.stage_starts == {}
+
+
+def test_completed_stage():
+    metrics = Metrics()
+    with metrics.stage("download"):
+        pass
+
+    assert gauge(metrics, "fec_stage_seconds", "download") >= 0
+    assert gauge(metrics, "fec_stage_last_completed_timestamp_seconds", "download") is not None
+    assert "fec_stage_process_peak_memory_bytes" in metrics.prometheus()
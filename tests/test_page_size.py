@@ -0,0 +1,40 @@
+from FECdownload.page_size import PageSizeController
+
+everything = {"two_year_transaction_period": 2024}
+by_employer = dict(everything, contributor_employer="GOOGLE")
+
+
+def test_fast_full_pages_grow_to_the_maximum():
+    controller = PageSizeController(min_size=5, max_size=100, increase=10)
+    assert controller.initial(everything) == 100
+
+    sizes = [controller.update(everything, 20, latency=1, records=20)]
+    while sizes[-1] < 100:
+        sizes.append(controller.update(everything, sizes[-1], latency=1, records=sizes[-1]))
+    assert sizes == [30, 40, 50, 60, 70, 80, 90, 100]
+    assert controller.update(everything, 100, latency=1, records=100) == 100
+    # A short page, the last of the query, does not grow the size
+    assert controller.update(everything, 50, latency=1, records=7) == 50
+
+
+def test_slow_pages_shrink_to_the_minimum():
+    controller = PageSizeController(target_latency=10, max_latency=20, min_size=5, max_size=100, decrease=0.7)
+    assert controller.update(everything, 100, latency=15, records=100) == 70
+    # Above max_latency, the size is at least halved
+    assert controller.update(everything, 100, latency=30, records=100) == 50
+    assert PageSizeController(max_latency=20, decrease=0.3).update(everything, 100, latency=30, records=100) == 30
+
+    size = 100
+    for _ in range(20):
+        size = controller.update(everything, size, latency=30, records=size)
+    assert size == 5
+
+
+def test_sizes_are_kept_per_query_type():
+    controller = PageSizeController(max_size=100)
+    controller.update(by_employer, 100, latency=30, records=100)
+
+    assert controller.initial(dict(everything, contributor_employer="APPLE")) == 50
+    assert controller.initial(everything) == 100
+    assert controller.summary()["employer"]["per_page"] == 50
+    assert [entry["decision"] for entry in controller.history] == ["decrease"]
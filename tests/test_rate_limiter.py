@@ -0,0 +1,26 @@
+import os
+import stat
+import time
+
+import pytest
+
+from FECdownload import rate_limiter
+from FECdownload.rate_limiter import RateLimiter
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no user ids")
+def test_default_state_file_is_per_user():
+    assert os.path.basename(rate_limiter.default_state_file) == f"fec_download_rate_limit_{os.getuid()}.json"
+
+
+@pytest.mark.skipif(rate_limiter.fcntl is None, reason="no file locking")
+def test_limiters_share_the_state_file(workdir):
+    state_file = str(workdir / "state.json")
+    first = RateLimiter(rate=1, period=3600, burst=2, state_file=state_file)
+    second = RateLimiter(rate=1, period=3600, burst=2, state_file=state_file)
+
+    first.acquire("KEY")
+    second.acquire("KEY")
+    assert stat.S_IMODE(os.stat(state_file).st_mode) == 0o600
+    with second.state() as buckets:
+        assert second.bucket(buckets, "KEY", time.time())["tokens"] < 1
@@ -0,0 +1,51 @@
+import FECdownload.FECdownload as fec
+from FECdownload.http_client import HTTPClient
+from FECdownload.response_cache import ResponseCache, normalize_parameters
+
+
+def test_normalize_parameters():
+    assert normalize_parameters({"b": 1, "a": ["y", "x"], "api_key": "KEY", "c": None, "per_page": 100}) == [
+        ["a", ["x", "y"]], ["b", "1"], ["per_page", "100"]
+    ]
+
+
+def test_probe_does_not_shorten_a_cached_crawl(openfec, monkeypatch):
+    parameters = fec.scheduleA_parameters(2023, 2023)[0]
+    expected = len(fec.download_pages(dict(parameters)))
+    fec.checkpoint_remove(2024, None, None)
+
+    cache = ResponseCache("cache/responses")
+    client = HTTPClient(backoff_factor=0.05, cache=cache)
+    monkeypatch.setattr(fec, "get_client", lambda: client)
+    count, exact = fec.probe_count(dict(parameters))
+    assert count == expected
+
+    pages = list(fec.iter_pages(dict(parameters)))
+    assert sum(len(page) for page in pages) == expected
+    # The probe of one result is not replayed as the first page
+    assert len(pages[0]) == 100
+    fec.checkpoint_remove(2024, None, None)
+    # Replayed from the cache
+    requests = openfec.requests
+    assert len(fec.download_pages(dict(parameters))) == expected
+    assert openfec.requests == requests
+
+
+def test_cached_sync_receives_new_records(openfec, monkeypatch):
+    from FECdownload.store import ContributionStore
+
+    client = HTTPClient(backoff_factor=0.05, cache=ResponseCache("cache/responses"))
+    monkeypatch.setattr(fec, "get_client", lambda: client)
+    store = ContributionStore("contributions.sqlite")
+    store.sync(2023, 2023)
+    # An incremental sync, whose request is repeated by the next one
+    store.sync(2023, 2023)
+    mark = store.high_water_mark(2024)[0]
+
+    # Loaded later on the day of the mark
+    record = dict(openfec.by_cycle[2024][0], sub_id="4999999999999999999", transaction_id="NEW", load_date=mark[:10] + "T23:00:00")
+    openfec.add(record)
+    requests = openfec.requests
+    assert store.sync(2023, 2023) > 0
+    assert openfec.requests > requests
+    assert record["sub_id"] in set(store.query(cycles=[2024])["sub_id"])
@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+
+from FECdownload.stage_cache import StageCache, file_fingerprint
+
+frame = pd.DataFrame({"name": ["ann", "bob", "cy"], "amount": [1.0, 2.0, 3.0]})
+
+
+def test_least_recently_used_entries_are_evicted(workdir):
+    cache = StageCache("stages", max_bytes=2**30)
+    files = {}
+    for number, stage in enumerate(["a", "b", "c"]):
+        key = cache.key(stage)
+        cache.put(stage, key, frame)
+        files[stage] = cache.filename(stage, key, "parquet")
+        size = os.path.getsize(files[stage])
+        os.utime(files[stage], (1000 + number, 1000 + number))
+
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a", cache.key("a")) is not None
+    cache.max_bytes = 3 * size
+    cache.put("d", cache.key("d"), frame)
+
+    assert not os.path.exists(files["b"])
+    assert all(os.path.exists(files[stage]) for stage in ["a", "c"])
+    assert cache.get("d", cache.key("d")) is not None
+    assert sum(size for _, size, _ in cache.entries()) <= cache.max_bytes
+
+
+def test_changed_input_file_is_computed_again(workdir):
+    cache = StageCache("stages")
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return frame
+
+    with open("input.csv", "w") as f:
+        f.write("name\nann\n")
+    for _ in range(2):
+        df, key = cache.cached("load", compute, source=file_fingerprint("input.csv"))
+    assert len(computed) == 1
+    pd.testing.assert_frame_equal(df, frame)
+
+    with open("input.csv", "a") as f:
+        f.write("bob\n")
+    _, changed_key = cache.cached("load", compute, source=file_fingerprint("input.csv"))
+    assert len(computed) == 2
+    assert changed_key != key
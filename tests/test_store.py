@@ -0,0 +1,88 @@
+import zipfile
+
+import pytest
+
+from mock_openfec import bulk_line
+from FECdownload.store import ContributionStore
+
+
+def stored(store, cycle = 2024):
+    df = store.query(cycles=[cycle])
+    return {row["sub_id"]: row for row in df.to_dict("records")}
+
+
+def test_bulk_rows_do_not_replace_api_records(openfec):
+    pytest.importorskip("pyarrow")
+    from FECdownload import bulk_ingest
+
+    store = ContributionStore("contributions.sqlite")
+    store.sync(2023, 2023)
+    api = stored(store)
+    assert all(isinstance(row["load_date"], str) for row in api.values())
+
+    records = openfec.by_cycle[2024]
+    with zipfile.ZipFile("contributions_2024.zip", "w") as f:
+        f.writestr("itcont.txt", "\n".join(bulk_line(record) for record in records) + "\n")
+    bulk_ingest.ingest_file("contributions_2024.zip", "bulk_parquet/contributions", 2024)
+    store.add_bulk("bulk_parquet/contributions")
+
+    after = stored(store)
+    assert set(after) == set(api)
+    for sub_id, row in after.items():
+        assert row["load_date"] == api[sub_id]["load_date"]
+        assert row["committee.name"] == api[sub_id]["committee.name"]
+
+
+def test_api_records_replace_bulk_rows(workdir):
+    store = ContributionStore("contributions.sqlite")
+    store.upsert([{"sub_id": "1", "two_year_transaction_period": 2024, "contributor_last_name": "DOE", "load_date": None}])
+    store.upsert([{"sub_id": "1", "two_year_transaction_period": 2024, "contributor_last_name": "DOE", "load_date": "2024-01-01T00:00:00"}])
+    assert stored(store)["1"]["load_date"] == "2024-01-01T00:00:00"
+
+
+def contribution(sub_id, file_number, transaction_id = "T1", load_date = "2024-01-01T00:00:00"):
+    return {
+        "sub_id": sub_id, "two_year_transaction_period": 2024, "contributor_last_name": "DOE",
+        "committee_id": "C00000001", "transaction_id": transaction_id, "file_number": file_number,
+        "load_date": load_date,
+    }
+
+
+def test_amended_filing_replaces_the_original(workdir):
+    store = ContributionStore("contributions.sqlite")
+    store.upsert([contribution("1", 100), contribution("2", 100, transaction_id="T2")])
+    store.upsert([contribution("3", 101, load_date="2024-02-01T00:00:00")])
+
+    # The amendment replaces the transaction it amends, not the others
+    assert set(stored(store)) == {"2", "3"}
+    # An earlier filing received later does not come back
+    store.upsert([contribution("1", 100)])
+    assert set(stored(store)) == {"2", "3"}
+
+
+def test_sync_requests_records_loaded_since_the_mark(openfec, monkeypatch):
+    import FECdownload.FECdownload as fec
+
+    store = ContributionStore("contributions.sqlite")
+    assert store.sync(2023, 2023) == len(openfec.by_cycle[2024])
+    mark = store.high_water_mark(2024)[0]
+
+    requests = []
+    make_request = fec.make_request
+
+    def record_request(url, params, *args, **kwargs):
+        requests.append(dict(params))
+        return make_request(url, params, *args, **kwargs)
+
+    monkeypatch.setattr(fec, "make_request", record_request)
+    # Loaded later on the day of the mark
+    record = dict(openfec.by_cycle[2024][0], sub_id="4999999999999999999", transaction_id="NEW", load_date=mark[:10] + "T23:00:00")
+    openfec.add(record)
+    received = store.sync(2023, 2023)
+
+    assert len(requests) > 0
+    assert all(params["min_load_date"] == mark[:10] for params in requests)
+    expected = [r for r in openfec.by_cycle[2024] if r["load_date"][:10] >= mark[:10]]
+    assert received == len(expected)
+    assert record["sub_id"] in stored(store)
+    assert store.high_water_mark(2024)[0] == record["load_date"]
@@ -0,0 +1,101 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from FECdownload import utils
+
+
+def baseline_canonize_name(series):
+    """canonize_name before the canonical names were cached."""
+    r = series.str.lower()
+    r = r.str.replace(',', '', regex=False)
+    r = r.str.replace('.', '', regex=False)
+    r = r.str.replace(' mr ', ' ', regex=False)
+    r = r.str.replace(' ms ', ' ', regex=False)
+    r = r.str.replace(' m ', ' ', regex=False)
+    r = r.str.replace(' jr ', ' ', regex=False)
+    r = r.str.strip()
+    return r
+
+
+def random_names(count, seed = 0):
+    rng = random.Random(seed)
+    words = ["mr", "ms", "m", "jr", "Mr.", "MS", "Jr.", "smith", "x", "j", "ann-marie", "o'neil", ",", ".", ""]
+    separators = [" ", " ", " ", "  ", ", ", ". ", "\t"]
+    names = []
+    for _ in range(count):
+        parts = [rng.choice(words) for _ in range(rng.randrange(1, 7))]
+        name = "".join(part + rng.choice(separators) for part in parts)
+        names.append(rng.choice(["", " ", "   "]) + name)
+    return names
+
+
+@pytest.mark.parametrize("name", ["smith, ms Jr. jr x", "   ms ms   ", "doe mr mr john", "a m m m b"])
+def test_canonize_value_keeps_adjacent_titles(name):
+    expected = baseline_canonize_name(pd.Series([name]))[0]
+    assert utils.canonize_value(name) == expected
+
+
+def test_canonize_value_matches_baseline():
+    names = random_names(20000)
+    expected = baseline_canonize_name(pd.Series(names)).tolist()
+    assert [utils.canonize_value(name) for name in names] == expected
+
+
+def test_canonize_name_matches_baseline():
+    names = pd.Series(random_names(2000, seed=1) + [None, 3.5], index=range(10, 2012))
+    result = utils.canonize_name(names, cache=False)
+    expected = baseline_canonize_name(names)
+    assert result.index.equals(names.index)
+    assert result.astype(object).where(result.notna(), None).tolist() == expected.where(expected.notna(), None).tolist()
+
+
+def baseline_match_employers(series, exact, partial):
+    """match_employers as one comparison per employer, before the single pattern."""
+    match = pd.Series(False, index=series.index)
+    for employer in exact:
+        match = match | (series == employer)
+    for employer in partial:
+        match = match | series.str.contains(employer, regex=False).fillna(False).astype(bool)
+    return match
+
+
+def reported_pattern(name, exact, partial):
+    """The leftmost partial pattern in the name, the longest at the same position."""
+    if name in exact:
+        return name
+    found = [(name.find(p), -len(p), p) for p in partial if p in name]
+    return min(found)[2] if found else None
+
+
+def test_match_employers_matches_baseline():
+    exact = ["AT&T.", "ACME", "(EY)"]
+    partial = ["A+B", "(EY)", "C++", "GOOGLE", "GOOGLE LLC", "MS", "MSFT", ".*", "[X]", "\\d", "^", "$", "|"]
+    fragments = partial + ["AT&T.", "ATXT", "ACME", "AB", "AAB", "EY", "C+", "GOOGL", "M", "SFT", "XYZ", "", " ", "."]
+    rng = random.Random(2)
+    names = ["".join(rng.choice(fragments) for _ in range(rng.randrange(1, 4))) for _ in range(5000)]
+    series = pd.Series(names + [None, "AT&T.", "ATXT", "GOOGLE LLC", "MSFT INC"], index=range(7, 5012))
+
+    match, matched = utils.match_employers(series, exact, partial)
+    assert match.tolist() == baseline_match_employers(series, exact, partial).tolist()
+    assert matched.index.equals(series.index)
+    expected = [reported_pattern(name, exact, partial) if isinstance(name, str) else None for name in series]
+    assert matched.astype(object).where(matched.notna(), None).tolist() == expected
+    assert matched[5010] == "GOOGLE LLC"
+    assert matched[5011] == "MSFT"
+    assert not match[-3]
+
+
+def test_canonize_name_without_names():
+    result = utils.canonize_name(pd.Series([None, np.nan], index=[4, 5]), cache=False)
+    assert result.index.tolist() == [4, 5]
+    assert result.isna().all()
+
+
+def test_match_employers_without_employers():
+    match, matched = utils.match_employers(pd.Series([None, np.nan], index=[4, 5]), ["ACME"], ["GOOGLE"])
+    assert match.tolist() == [False, False]
+    assert matched.index.tolist() == [4, 5]
+    assert matched.isna().all()